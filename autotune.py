@@ -0,0 +1,201 @@
+import os
+import random
+import time
+import zlib
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+from bandwidth import mbps_to_bytes
+
+
+# ====================================================================================================
+# COMPRESSION AUTO-TUNING
+# ====================================================================================================
+#
+# Welches Format und welche Stufe am schnellsten zum fertigen Backup führen, hängt von den Daten
+# (Text komprimiert 4:1, Fotos gar nicht) und vom Uplink ab. Im Modus "Auto" wird vor dem Lauf
+# gemessen statt geraten:
+#
+# 1. Stichprobe: bis zu sample_bytes aus bis zu max_files Dateien. Die Dateien werden gewichtet nach
+#    ihrer Größe gezogen (A-Res-Reservoir über höchstens MAX_SAMPLE_CANDIDATES Einträge), aus jeder
+#    wird ein Block aus der Mitte gelesen, proportional zu ihrer Größe. Große Dateien bestimmen das
+#    Ergebnis also wie im Backup.
+# 2. Messung je Kandidat (Format, Stufe): Deflate über die Stichprobe - für ZIP je Datei ein eigener
+#    Stream (wie ParallelZipWriter), für tar.gz ein Stream über alles. Ergebnis: Ratio und
+#    Durchsatz pro Kern; ZIP komprimiert auf allen Kernen, tar.gz auf einem.
+# 3. Vorhersage pro Kandidat: Archivieren (Quell-Bytes / Durchsatz) + Upload (Archiv-Bytes /
+#    Bandbreite je Ziel). Mit einem Zeitfenster gewinnt der Kandidat mit der besten Ratio, der noch
+#    hineinpasst (passt keiner: der schnellste); ohne Fenster der schnellste.
+#
+# Wahl und Messwerte landen in den Lauf-Metriken (metrics.RunMetrics.compression_tuning).
+
+COMPRESSION_LEVELS = {"None": 0, "Fast": 1, "Default": None, "Best": 9} # None: Standard des Formats
+AUTO = "Auto"
+CANDIDATE_LEVELS = (1, 6, 9)
+CANDIDATE_FORMATS = ("zip", "tar.gz")
+TAR_DEFAULT_LEVEL = 9 # tarfile.open("w:gz") ohne compresslevel
+ZIP_DEFAULT_LEVEL = 6 # zlib Z_DEFAULT_COMPRESSION
+DEFAULT_SAMPLE_BYTES = 4 * 1024 * 1024
+DEFAULT_SAMPLE_FILES = 64
+DEFAULT_BANDWIDTH = 100 * 1000 * 1000 // 8 # 100 Mbit/s, wenn nichts konfiguriert ist
+MAX_SAMPLE_CANDIDATES = 20000
+MIN_SAMPLE_BLOCK = 16 * 1024
+TAR_HEADER_BYTES = 512
+ZIP_HEADER_BYTES = 100 # lokaler Header + Central Directory, ohne Dateinamen
+
+
+def compression_level_value(name):
+    """zlib-Stufe für die Auswahl der GUI ('None', 'Fast', 'Default', 'Best') oder eine Zahl; None = Standard."""
+    if name is None or name == "" or name == AUTO:
+        return None
+    if isinstance(name, int) or str(name).lstrip("-").isdigit():
+        return max(0, min(9, int(name)))
+    return COMPRESSION_LEVELS.get(str(name).capitalize())
+
+
+@dataclass
+class TuningSettings:
+    formats: tuple = CANDIDATE_FORMATS
+    levels: tuple = CANDIDATE_LEVELS
+    window_seconds: Optional[float] = None # Zielzeit für Archivieren + Upload
+    bandwidth: Optional[int] = None # Bytes/s je Ziel; None = DEFAULT_BANDWIDTH
+    sample_bytes: int = DEFAULT_SAMPLE_BYTES
+    sample_files: int = DEFAULT_SAMPLE_FILES
+    workers: Optional[int] = None # Kerne für ZIP; None = alle
+
+
+@dataclass
+class Candidate:
+    compress_type: str
+    level: int
+    ratio: float # Quell-Bytes / Archiv-Bytes
+    compress_bytes_per_second: float # über alle genutzten Kerne
+    predicted_seconds: float = 0.0
+    fits_window: Optional[bool] = None
+
+
+@dataclass
+class TuningResult:
+    compress_type: str
+    level: int
+    sample_files: int
+    sample_bytes: int
+    sample_seconds: float
+    window_seconds: Optional[float]
+    bandwidth: int
+    candidates: List[Candidate] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _iter_candidate_files(source_paths, limit=MAX_SAMPLE_CANDIDATES):
+    seen = 0
+    for path in source_paths:
+        if os.path.isfile(path):
+            yield path
+            seen += 1
+            continue
+        for root, _, names in os.walk(path):
+            for name in names:
+                yield os.path.join(root, name)
+                seen += 1
+                if seen >= limit:
+                    return
+
+
+def sample_sources(source_paths, sample_bytes=DEFAULT_SAMPLE_BYTES, max_files=DEFAULT_SAMPLE_FILES, rng=None):
+    """Gibt eine Liste von Byte-Blöcken zurück: nach Dateigröße gewichtete Stichprobe (A-Res)."""
+    rng = rng or random.Random()
+    reservoir = [] # (Schlüssel, pfad, größe)
+    for path in _iter_candidate_files(source_paths):
+        try:
+            size = os.path.getsize(path) if not os.path.islink(path) else 0
+        except OSError:
+            continue
+        if size <= 0:
+            continue
+        key = rng.random() ** (1.0 / size)
+        if len(reservoir) < max_files:
+            reservoir.append((key, path, size))
+            reservoir.sort()
+        elif key > reservoir[0][0]:
+            reservoir[0] = (key, path, size)
+            reservoir.sort()
+
+    # Blockgröße proportional zur Dateigröße, damit große Dateien auch in Bytes so stark zählen wie im Backup
+    samples = []
+    selected_bytes = sum(size for _, _, size in reservoir)
+    for _, path, size in reservoir:
+        length = min(size, max(MIN_SAMPLE_BLOCK, sample_bytes * size // max(1, selected_bytes)))
+        try:
+            with open(path, "rb") as f:
+                f.seek((size - length) // 2)
+                samples.append(f.read(length))
+        except OSError:
+            continue
+    return samples
+
+
+def measure(samples, compress_type, level, workers=None):
+    """Misst einen Kandidaten auf der Stichprobe; gibt Candidate ohne Vorhersage zurück."""
+    raw = sum(len(sample) for sample in samples)
+    start = time.perf_counter()
+    if compress_type == "zip":
+        out = 0
+        for sample in samples:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            out += len(compressor.compress(sample)) + len(compressor.flush()) + ZIP_HEADER_BYTES
+        cores = workers or os.cpu_count() or 1
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16) # gzip-Container
+        out = sum(len(compressor.compress(sample)) for sample in samples) + len(compressor.flush())
+        out += TAR_HEADER_BYTES * len(samples)
+        cores = 1
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    return Candidate(compress_type, level, raw / max(out, 1), raw / elapsed * cores)
+
+
+def choose(candidates, source_bytes, destinations, bandwidth, window_seconds=None):
+    """Ergänzt die Vorhersage je Kandidat und gibt den gewählten zurück."""
+    for candidate in candidates:
+        archive_bytes = source_bytes / candidate.ratio
+        candidate.predicted_seconds = (source_bytes / candidate.compress_bytes_per_second
+                                       + archive_bytes / bandwidth * max(1, destinations))
+        if window_seconds:
+            candidate.fits_window = candidate.predicted_seconds <= window_seconds
+    fitting = [c for c in candidates if c.fits_window]
+    if fitting:
+        return max(fitting, key=lambda c: (c.ratio, -c.predicted_seconds))
+    return min(candidates, key=lambda c: c.predicted_seconds)
+
+
+def tune_compression(source_paths, source_bytes, destinations=1, settings=None):
+    """Stichprobe, Messung und Wahl; gibt TuningResult zurück (compress_type/level der Wahl)."""
+    settings = settings or TuningSettings()
+    start = time.perf_counter()
+    samples = sample_sources(source_paths, settings.sample_bytes, settings.sample_files)
+    bandwidth = settings.bandwidth or DEFAULT_BANDWIDTH
+    if not samples: # leere Quellen: nichts zu messen
+        compress_type = settings.formats[0]
+        return TuningResult(compress_type, ZIP_DEFAULT_LEVEL if compress_type == "zip" else TAR_DEFAULT_LEVEL,
+                            0, 0, 0.0, settings.window_seconds, bandwidth)
+    candidates = [measure(samples, compress_type, level, settings.workers)
+                  for compress_type in settings.formats for level in settings.levels]
+    best = choose(candidates, source_bytes, destinations, bandwidth, settings.window_seconds)
+    return TuningResult(best.compress_type, best.level, len(samples), sum(len(s) for s in samples),
+                        round(time.perf_counter() - start, 3), settings.window_seconds, bandwidth, candidates)
+
+
+def tuning_settings_from_config(config, bandwidth=None):
+    """TuningSettings aus config.json ('autotune_*'); bandwidth (Bytes/s) ist der Standard für den Uplink."""
+    window_minutes = config.get('autotune_window_minutes')
+    bandwidth_mbps = config.get('autotune_bandwidth_mbps')
+    formats = config.get('autotune_formats') or CANDIDATE_FORMATS
+    levels = config.get('autotune_levels') or CANDIDATE_LEVELS
+    return TuningSettings(
+        formats=tuple(f for f in formats if f in CANDIDATE_FORMATS) or CANDIDATE_FORMATS,
+        levels=tuple(max(0, min(9, int(level))) for level in levels),
+        window_seconds=float(window_minutes) * 60 if window_minutes else None,
+        bandwidth=mbps_to_bytes(bandwidth_mbps) or bandwidth,
+        sample_bytes=int(float(config.get('autotune_sample_mb', 4) or 4) * 1024 * 1024),
+    )
@@ -3,16 +3,31 @@ import tarfile
 import zipfile
 import shutil
 import hashlib
-import paramiko
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+# paramiko und cryptography werden erst in den Funktionen importiert, die sie brauchen.
+# So startet die CLI (cli.py) schnell und ein reines NAS-Backup lädt keinen SSH-/Krypto-Stack.
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 import secrets
 import io
+import json
+import posixpath
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from zip_writer import ParallelZipWriter
+from sparse import add_sparse_to_tar, allocated_size, write_sparse
+from verify import verify_remote_file
+from listing_cache import cache_key
+from prefetch import DEFAULT_PREFETCH_MEMORY, prefetched, prefetch_depth_for
+from dedup import DedupIndex, DEDUP_PAX_KEY, LINKS_MEMBER, METADATA_DIR, LINK_COPY, LINK_HARDLINK
+from metrics import RunMetrics
+from autotune import tune_compression
+from file_order import order_entries
+from source_fingerprint import UNCHANGED_REFERENCE, fingerprint_key
+from low_impact import LoadThrottle, advise_noreuse, lower_priority, release_cache
+from zip_dictionary import DICTIONARY_MEMBER, build_dictionary, load_dictionary, read_dictionary_member, uses_dictionary
+from progress import ProgressModel, ScanResult, prescan_sources, upload_stage, STAGE_ARCHIVE, STAGE_ENCRYPT, STAGE_HASH
 # WICHTIG: Wenn Sie genaue Monats- oder Jahresberechnungen für Retention Policy benötigen,
 # müssen Sie 'pip install python-dateutil' ausführen und dies importieren:
 # from dateutil.relativedelta import relativedelta
@@ -22,11 +37,17 @@ from datetime import datetime, timedelta
 # HELPER FUNCTIONS
 # ====================================================================================================
 
+COPY_BLOCK_SIZE = 1024 * 1024 # Blockgröße für Hash, Verschlüsselung und Kopie (1 MB)
+
 def derive_key_and_salt(passphrase: str, salt: bytes = None) -> (bytes, bytes):
     """
     Leitet einen Schlüssel und Salt von einer Passphrase ab.
     Wenn kein Salt bereitgestellt wird, wird ein neues generiert.
     """
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.backends import default_backend
+
     if salt is None:
         salt = secrets.token_bytes(16)  # 16-Byte Salt
     
@@ -45,6 +66,9 @@ def encrypt_data(data: bytes, passphrase: str) -> bytes:
     Verschlüsselt Daten mit AES256 im GCM-Modus.
     Gibt Salt, Nonce (IV), verschlüsselte Daten und Authentifizierungs-Tag zurück.
     """
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+
     key, salt = derive_key_and_salt(passphrase)
     
     # Nonce (Initialization Vector) generieren
@@ -60,11 +84,115 @@ def encrypt_data(data: bytes, passphrase: str) -> bytes:
     # Format: salt (16 bytes) + iv (12 bytes) + tag (16 bytes) + ciphertext
     return salt + iv + tag + ciphertext
 
+def _encrypt_stream(f_in, f_out, key, salt, progress=None, limit=None):
+    """
+    Verschlüsselt bis zu 'limit' Bytes (None = bis EOF) aus f_in nach f_out im Format von
+    encrypt_data. Gibt die Anzahl gelesener Klartext-Bytes zurück.
+    """
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend()).encryptor()
+
+    # Der Tag steht vor dem Ciphertext, ist aber erst am Ende bekannt: Platzhalter, später überschreiben
+    header_offset = f_out.tell()
+    f_out.write(salt + iv + b"\0" * 16)
+    consumed = 0
+    while limit is None or consumed < limit:
+        block = f_in.read(COPY_BLOCK_SIZE if limit is None else min(COPY_BLOCK_SIZE, limit - consumed))
+        if not block:
+            break
+        f_out.write(encryptor.update(block))
+        consumed += len(block)
+        if progress:
+            progress(len(block))
+    f_out.write(encryptor.finalize())
+    end = f_out.tell()
+    f_out.seek(header_offset + len(salt) + len(iv))
+    f_out.write(encryptor.tag)
+    f_out.seek(end)
+    return consumed
+
+def encrypt_file(in_path, out_path, passphrase, progress=None, key_and_salt=None):
+    """
+    Verschlüsselt eine Datei blockweise (konstanter Speicher) im selben Format wie encrypt_data.
+    key_and_salt erlaubt, die Schlüsselableitung vorab (separat gemessen) auszuführen.
+    """
+    key, salt = key_and_salt or derive_key_and_salt(passphrase)
+    with open(in_path, "rb") as f_in, open(out_path, "wb") as f_out:
+        _encrypt_stream(f_in, f_out, key, salt, progress)
+    return out_path
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Entschlüsselt beim Lesen eine Datei im Format von encrypt_data (konstanter Speicher).
+    Der GCM-Tag kann erst am Ende geprüft werden: Der Lesevorgang, der EOF erreicht, löst bei falscher
+    Passphrase oder beschädigten Daten ValueError aus. Bis dahin gelieferte Daten sind nicht
+    authentifiziert und dürfen noch nicht übernommen werden.
+    key_cache (dict salt -> key) spart die PBKDF2-Ableitung bei mehreren Dateien mit gleichem Salt.
+    """
+
+    def __init__(self, fileobj, passphrase, key_cache=None, progress=None):
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.backends import default_backend
+
+        header = fileobj.read(44)
+        if len(header) < 44: # 16 (salt) + 12 (iv) + 16 (tag)
+            raise ValueError("Encrypted data is too short to contain salt, IV, and tag.")
+        salt, iv, tag = header[:16], header[16:28], header[28:44]
+        if key_cache is not None and salt in key_cache:
+            key = key_cache[salt]
+        else:
+            key, _ = derive_key_and_salt(passphrase, salt)
+            if key_cache is not None:
+                key_cache[salt] = key
+
+        self._fileobj = fileobj
+        self._progress = progress
+        self._decryptor = Cipher(algorithms.AES(key), modes.GCM(iv, tag), backend=default_backend()).decryptor()
+        self._pending = memoryview(b"")
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._finished:
+            block = self._fileobj.read(COPY_BLOCK_SIZE)
+            if block:
+                self._pending = memoryview(self._decryptor.update(block))
+                if self._progress:
+                    self._progress(len(block))
+                continue
+            self._finished = True
+            try:
+                self._pending = memoryview(self._decryptor.finalize())
+            except Exception as e:
+                raise ValueError(f"Decryption failed, likely due to incorrect passphrase or corrupted data: {e}")
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+def decrypt_file(in_path, out_path, passphrase, progress=None, key_cache=None):
+    """
+    Gegenstück zu encrypt_file mit konstantem Speicher. Bei falscher Passphrase oder beschädigten
+    Daten wird ValueError ausgelöst (erst nach dem letzten Block, wenn der GCM-Tag geprüft ist).
+    """
+    with open(in_path, "rb") as f_in, open(out_path, "wb") as f_out:
+        reader = DecryptingReader(f_in, passphrase, key_cache, progress)
+        shutil.copyfileobj(reader, f_out, COPY_BLOCK_SIZE)
+    return out_path
+
 def decrypt_data(encrypted_data: bytes, passphrase: str) -> bytes:
     """
     Entschlüsselt Daten, die mit AES256 im GCM-Modus verschlüsselt wurden.
     Erwartet das Format: salt (16 bytes) + iv (12 bytes) + tag (16 bytes) + ciphertext.
     """
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+
     if len(encrypted_data) < 44: # 16 (salt) + 12 (iv) + 16 (tag)
         raise ValueError("Encrypted data is too short to contain salt, IV, and tag.")
 
@@ -84,15 +212,142 @@ def decrypt_data(encrypted_data: bytes, passphrase: str) -> bytes:
     except Exception as e:
         raise ValueError(f"Decryption failed, likely due to incorrect passphrase or corrupted data: {e}")
 
-def calculate_sha256(file_path):
-    """Berechnet den SHA256-Hash einer Datei."""
+def calculate_sha256(file_path, progress=None):
+    """Berechnet den SHA256-Hash einer Datei. progress(nbytes) wird pro gelesenem Block aufgerufen."""
     sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
         # Lesen in Blöcken, um große Dateien zu handhaben
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(COPY_BLOCK_SIZE), b""):
             sha256_hash.update(byte_block)
+            if progress:
+                progress(len(byte_block))
     return sha256_hash.hexdigest()
 
+def copy_file_with_progress(src, dst, progress=None):
+    """Wie shutil.copy2, meldet aber die kopierten Bytes über progress(nbytes)."""
+    with open(src, "rb") as f_in, open(dst, "wb") as f_out:
+        for block in iter(lambda: f_in.read(COPY_BLOCK_SIZE), b""):
+            f_out.write(block)
+            if progress:
+                progress(len(block))
+    shutil.copystat(src, dst)
+    return dst
+
+class _CountingReader:
+    """Dateiobjekt-Hülle, die gelesene Bytes an progress(nbytes) meldet."""
+
+    def __init__(self, fileobj, progress):
+        self._fileobj = fileobj
+        self._progress = progress
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._progress(len(data))
+        return data
+
+def iter_tar_tree(path, arcname):
+    """(pfad, arcname) in der Reihenfolge von tar.add: rekursiv, Verzeichnisinhalte sortiert."""
+    yield path, arcname
+    if os.path.isdir(path) and not os.path.islink(path):
+        for name in sorted(os.listdir(path)):
+            yield from iter_tar_tree(os.path.join(path, name), arcname + "/" + name)
+
+def add_to_tar(tar, path, arcname, progress=None, dedup=None, prefetch_depth=0, prefetch_memory=DEFAULT_PREFETCH_MEMORY,
+               drop_cache=False, file_order=None):
+    """
+    Wie tar.add(path, arcname) (rekursiv, sortiert, Symlinks als Links), aber die Bytes regulärer
+    Dateien werden beim Lesen durch tarfile gemeldet - also während sie komprimiert werden.
+    Dateien mit Löchern werden als PAX-Sparse-Mitglieder nur mit ihren Datenbereichen gespeichert.
+    Mit dedup (dedup.DedupIndex) werden Duplikate als Hardlink-Einträge auf das Original geschrieben.
+    prefetch_depth > 0 liest kleine Dateien parallel voraus (siehe prefetch.py).
+    drop_cache gibt gelesene Dateien danach im Page-Cache frei (siehe low_impact.py).
+    file_order ordnet die Dateien unter path um (siehe file_order.py).
+    """
+    ordered = order_entries(iter_tar_tree(path, arcname), file_order)
+    with prefetched(ordered, prefetch_depth, prefetch_memory, drop_cache) as entries:
+        for entry in entries:
+            _add_tar_member(tar, entry.path, entry.arcname, progress, dedup, entry.data, drop_cache)
+
+def _add_tar_member(tar, path, arcname, progress=None, dedup=None, data=None, drop_cache=False):
+    tarinfo = tar.gettarinfo(path, arcname)
+    if tarinfo is None: # Socket o.ä., tar.add überspringt das ebenfalls
+        return
+    link = dedup.link_target(path, arcname) if dedup is not None and tarinfo.isreg() else None
+    if link is not None:
+        tarinfo.type = tarfile.LNKTYPE
+        tarinfo.linkname, kind = link
+        tarinfo.size = 0
+        if kind == LINK_COPY:
+            tarinfo.pax_headers = dict(tarinfo.pax_headers, **{DEDUP_PAX_KEY: LINK_COPY})
+    if tarinfo.islnk():
+        tar.addfile(tarinfo)
+        if progress: # Inhalt wird nicht gelesen, zählt aber im Vorab-Scan mit
+            progress(allocated_size(os.lstat(path)))
+    elif tarinfo.isreg():
+        wrap = (lambda reader: _CountingReader(reader, progress)) if progress else None
+        if data is not None and len(data) == tarinfo.size: # vorausgelesen und seither unverändert
+            reader = io.BytesIO(data)
+            tar.addfile(tarinfo, wrap(reader) if wrap else reader)
+            return
+        with open(path, "rb") as f:
+            if drop_cache:
+                advise_noreuse(f)
+            if not add_sparse_to_tar(tar, tarinfo, f, wrap):
+                tar.addfile(tarinfo, wrap(f) if wrap else f)
+            if drop_cache:
+                release_cache(f)
+    else:
+        tar.addfile(tarinfo)
+
+def _transfer_callback(sftp_client, progress, bandwidth):
+    """
+    Übersetzt paramikos kumulativen (übertragen, gesamt)-Callback in Byte-Deltas für progress und
+    drosselt über bandwidth (bandwidth.BandwidthLimiter). Der Callback läuft synchron in der
+    Transfer-Schleife, ein Blockieren hier bremst also den Transfer selbst.
+    """
+    if progress is None and bandwidth is None:
+        return None
+    sent = [0]
+    probe_client = []
+
+    def probe():
+        # RTT-Messung für adaptive Profile über einen zweiten SFTP-Kanal derselben Verbindung: er teilt
+        # sich die Warteschlange im Uplink, stört aber nicht die Pipeline-Antworten des Transfers
+        if not probe_client:
+            import paramiko
+            probe_client.append(paramiko.SFTPClient.from_transport(sftp_client.get_channel().get_transport()))
+        probe_client[0].stat(".")
+
+    def _callback(transferred, _total):
+        delta = transferred - sent[0]
+        sent[0] = transferred
+        if progress:
+            progress(delta)
+        if bandwidth:
+            bandwidth.throttle(delta, probe)
+
+    _callback.close = lambda: probe_client and probe_client[0].close()
+    return _callback
+
+@contextmanager
+def _transfer(sftp_client, progress, bandwidth):
+    callback = _transfer_callback(sftp_client, progress, bandwidth)
+    try:
+        yield callback
+    finally:
+        if callback:
+            callback.close()
+
+def sftp_put_with_progress(sftp_client, local_path, remote_path, progress=None, bandwidth=None):
+    """sftp.put mit Byte-Deltas für progress und optionaler Bandbreitenbegrenzung."""
+    with _transfer(sftp_client, progress, bandwidth) as callback:
+        return sftp_client.put(local_path, remote_path, callback=callback)
+
+def sftp_get_with_progress(sftp_client, remote_path, local_path, progress=None, bandwidth=None):
+    """sftp.get mit Byte-Deltas für progress und optionaler Bandbreitenbegrenzung."""
+    with _transfer(sftp_client, progress, bandwidth) as callback:
+        return sftp_client.get(remote_path, local_path, callback=callback)
+
 def calculate_sha256_from_bytes(data_bytes):
     """Berechnet den SHA256-Hash von Bytes-Daten."""
     sha256_hash = hashlib.sha256()
@@ -101,6 +356,8 @@ def calculate_sha256_from_bytes(data_bytes):
 
 def get_sftp_client(sftp_host, sftp_username, sftp_password):
     """Erstellt und gibt einen SFTPClient zurück."""
+    import paramiko
+
     try:
         # SFTP Host kann auch Port enthalten (user@host:port)
         hostname = sftp_host
@@ -122,15 +379,1041 @@ def get_sftp_client(sftp_host, sftp_username, sftp_password):
     except Exception as e:
         raise Exception(f"Failed to connect to SFTP server: {e}")
 
+
+class SFTPSessionPool:
+    """
+    Hält SFTP-Sitzungen zwischen mehreren Jobs offen (genutzt vom Scheduler-Dienst in scheduler.py),
+    damit nicht jeder Lauf einen neuen SSH-Handshake mit Login braucht.
+    """
+
+    def __init__(self, idle_timeout=600):
+        self.idle_timeout = idle_timeout
+        self._idle_sessions = {} # (host, username) -> [(sftp_client, transport, last_used)]
+        self._lock = threading.Lock()
+
+    def acquire(self, sftp_host, sftp_username, sftp_password):
+        """Gibt eine freie, noch aktive Sitzung zurück oder baut eine neue auf."""
+        key = (sftp_host, sftp_username)
+        with self._lock:
+            sessions = self._idle_sessions.get(key, [])
+            while sessions:
+                sftp_client, transport, last_used = sessions.pop()
+                if transport.is_active() and time.monotonic() - last_used < self.idle_timeout:
+                    return sftp_client, transport
+                _close_sftp_session(sftp_client, transport)
+        return get_sftp_client(sftp_host, sftp_username, sftp_password)
+
+    def release(self, sftp_host, sftp_username, sftp_client, transport, broken=False):
+        """Gibt eine Sitzung zurück in den Pool; defekte Sitzungen werden geschlossen."""
+        if broken or not transport.is_active():
+            _close_sftp_session(sftp_client, transport)
+            return
+        with self._lock:
+            self._idle_sessions.setdefault((sftp_host, sftp_username), []).append((sftp_client, transport, time.monotonic()))
+
+    def prune(self):
+        """Schließt Sitzungen, die länger als idle_timeout unbenutzt waren."""
+        with self._lock:
+            for key, sessions in list(self._idle_sessions.items()):
+                keep = []
+                for sftp_client, transport, last_used in sessions:
+                    if transport.is_active() and time.monotonic() - last_used < self.idle_timeout:
+                        keep.append((sftp_client, transport, last_used))
+                    else:
+                        _close_sftp_session(sftp_client, transport)
+                self._idle_sessions[key] = keep
+
+    def close_all(self):
+        with self._lock:
+            for sessions in self._idle_sessions.values():
+                for sftp_client, transport, _ in sessions:
+                    _close_sftp_session(sftp_client, transport)
+            self._idle_sessions.clear()
+
+
+def _close_sftp_session(sftp_client, transport):
+    try:
+        if sftp_client:
+            sftp_client.close()
+    finally:
+        if transport:
+            transport.close()
+
+
+@contextmanager
+def sftp_session(sftp_host, sftp_username, sftp_password, sftp_pool=None):
+    """
+    Liefert (sftp_client, transport) für die Dauer eines with-Blocks.
+    Mit sftp_pool wird die Sitzung danach wiederverwendet, sonst geschlossen.
+    """
+    if sftp_pool is None:
+        sftp_client, transport = get_sftp_client(sftp_host, sftp_username, sftp_password)
+        try:
+            yield sftp_client, transport
+        finally:
+            _close_sftp_session(sftp_client, transport)
+        return
+
+    sftp_client, transport = sftp_pool.acquire(sftp_host, sftp_username, sftp_password)
+    broken = False
+    try:
+        yield sftp_client, transport
+    except Exception:
+        broken = True
+        raise
+    finally:
+        sftp_pool.release(sftp_host, sftp_username, sftp_client, transport, broken=broken)
+
+# ====================================================================================================
+# MULTI-VOLUME ARCHIVES
+# ====================================================================================================
+#
+# Optional wird das (ggf. verschlüsselte) Archiv in Volumes fester Größe zerlegt:
+#   backup_20250622_180000.tar.gz.enc.vol001, .vol002, ...
+#   backup_20250622_180000.tar.gz.enc.manifest.json
+# Jedes Volume ist für sich verschlüsselt (eigene Nonce, eigener GCM-Tag) und hat einen eigenen
+# SHA256 im Manifest. Volumes werden parallel und einzeln wiederholbar hochgeladen; das Manifest
+# kommt zuletzt, d.h. ein Backup mit Manifest ist vollständig. Retention behandelt das Manifest als
+# das Backup und löscht die Volumes mit.
+
+MANIFEST_SUFFIX = ".manifest.json"
+VOLUME_SUFFIX = ".vol{:03d}"
+PART_SUFFIX = ".part" # Uploads laufen unter diesem Namen und werden danach umbenannt
+MANIFEST_FORMAT = "backuptool-volumes"
+UPLOAD_RETRIES = 3
+DOWNLOAD_RETRIES = 3
+DEFAULT_VOLUME_WORKERS = 4
+
+
+def is_volume_manifest(filename):
+    return filename.endswith(MANIFEST_SUFFIX)
+
+
+def is_volume_or_partial(filename):
+    """Volumes, Shards und unfertige Uploads sind keine eigenständigen Backups (für Retention und Auflistung)."""
+    extension = filename.rsplit(".", 1)[-1]
+    return (filename.endswith(PART_SUFFIX) or (extension.startswith("vol") and extension[3:].isdigit())
+            or is_shard(filename))
+
+
+def split_into_volumes(archive_path, out_dir, archive_name, volume_size, key_and_salt=None, progress=None):
+    """
+    Zerlegt archive_path in Volumes zu je volume_size Klartext-Bytes (mit key_and_salt verschlüsselt).
+    Gibt (manifest_dict, [volume_pfade]) zurück; das Manifest enthält Größe und SHA256 jedes Volumes.
+    """
+    archive_hash = hashlib.sha256()
+    volumes = []
+    paths = []
+
+    class _HashingReader:
+        def __init__(self, f):
+            self._f = f
+
+        def read(self, size=-1):
+            data = self._f.read(size)
+            archive_hash.update(data)
+            return data
+
+    archive_size = os.path.getsize(archive_path)
+    with open(archive_path, "rb") as raw_in:
+        f_in = _HashingReader(raw_in)
+        offset = 0
+        index = 1
+        while offset < archive_size or index == 1:
+            name = archive_name + VOLUME_SUFFIX.format(index)
+            path = os.path.join(out_dir, name)
+            with open(path, "w+b") as f_out:
+                if key_and_salt:
+                    key, salt = key_and_salt
+                    length = _encrypt_stream(f_in, f_out, key, salt, progress, limit=volume_size)
+                else:
+                    length = 0
+                    while length < volume_size:
+                        block = f_in.read(min(COPY_BLOCK_SIZE, volume_size - length))
+                        if not block:
+                            break
+                        f_out.write(block)
+                        length += len(block)
+                        if progress:
+                            progress(len(block))
+            volumes.append({"name": name, "offset": offset, "length": length,
+                            "size": os.path.getsize(path), "sha256": calculate_sha256(path)})
+            paths.append(path)
+            offset += length
+            index += 1
+
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": 1,
+        "archive": archive_name,
+        "encrypted": bool(key_and_salt),
+        "volume_size": volume_size,
+        "archive_size": archive_size,
+        "archive_sha256": archive_hash.hexdigest(), # über das unverschlüsselte Archiv
+        "volumes": volumes,
+    }
+    return manifest, paths
+
+
+def write_manifest(manifest, out_dir):
+    path = os.path.join(out_dir, manifest["archive"] + MANIFEST_SUFFIX)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def upload_with_retry(put, local_path, progress=None, on_retry=None, retries=UPLOAD_RETRIES):
+    """
+    Ruft put(local_path, progress) bis zu 'retries' mal auf. Bereits gemeldete Bytes eines
+    fehlgeschlagenen Versuchs werden über progress(-n) zurückgenommen.
+    """
+    for attempt in range(1, retries + 1):
+        sent = [0]
+
+        def counting(nbytes):
+            sent[0] += nbytes
+            if progress:
+                progress(nbytes)
+
+        try:
+            return put(local_path, counting)
+        except Exception as e:
+            if progress and sent[0]:
+                progress(-sent[0])
+            if attempt == retries:
+                raise
+            if on_retry:
+                on_retry(os.path.basename(local_path), attempt, e)
+            time.sleep(min(30, 2 ** attempt))
+
+
+def download_with_retry(fetch, name, on_retry=None, retries=DOWNLOAD_RETRIES):
+    """Ruft fetch() bis zu 'retries' mal auf; vor jeder Wiederholung on_retry(name, versuch, fehler)."""
+    for attempt in range(1, retries + 1):
+        try:
+            return fetch()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            if on_retry:
+                on_retry(name, attempt, e)
+            time.sleep(min(30, 2 ** attempt))
+
+
+def upload_files(put, local_paths, progress=None, on_retry=None, workers=1):
+    """
+    Lädt mehrere Dateien mit upload_with_retry hoch, bis zu 'workers' gleichzeitig.
+    Die letzte Datei (das Manifest) folgt erst, wenn alle anderen erfolgreich übertragen sind.
+    """
+    *others, last = local_paths
+    if workers <= 1 or len(others) <= 1:
+        for path in others:
+            upload_with_retry(put, path, progress, on_retry)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="volume-upload") as executor:
+            futures = [executor.submit(upload_with_retry, put, path, progress, on_retry) for path in others]
+            errors = [future.exception() for future in futures]
+        failed = [e for e in errors if e is not None]
+        if failed:
+            raise failed[0]
+    upload_with_retry(put, last, progress, on_retry)
+
+
+def nas_put(nas_path):
+    """put-Funktion für upload_files: Kopie unter .part, dann atomar umbenennen."""
+    def put(local_path, progress):
+        dest = os.path.join(nas_path, os.path.basename(local_path))
+        copy_file_with_progress(local_path, dest + PART_SUFFIX, progress)
+        os.replace(dest + PART_SUFFIX, dest)
+        return dest
+    return put
+
+
+def sftp_put(sftp_host, sftp_username, sftp_password, sftp_pool=None, bandwidth=None, remote_dir="",
+             expected_hashes=None, on_verified=None):
+    """
+    put-Funktion für upload_files: jede Datei über eine (Pool-)Sitzung, unter .part hochgeladen.
+    Mit expected_hashes (Dateiname -> SHA256) wird die .part-Datei vor dem Umbenennen auf dem Server
+    geprüft (verify.verify_remote_file); on_verified(result) erhält jedes Ergebnis. Eine Abweichung
+    löst einen Fehler aus, upload_with_retry lädt die Datei dann erneut hoch.
+    """
+    def put(local_path, progress):
+        remote_path = posixpath.join(remote_dir, os.path.basename(local_path)) if remote_dir else os.path.basename(local_path)
+        with sftp_session(sftp_host, sftp_username, sftp_password, sftp_pool) as (sftp_client, transport):
+            sftp_put_with_progress(sftp_client, local_path, remote_path + PART_SUFFIX, progress, bandwidth)
+            expected = (expected_hashes or {}).get(os.path.basename(local_path))
+            if expected:
+                result = verify_remote_file(sftp_client, transport, remote_path + PART_SUFFIX, local_path, expected)
+                if on_verified:
+                    on_verified(result)
+                if not result.ok:
+                    raise ValueError(f"Remote verification of {result.file} failed ({result.method}): {result.detail}")
+            sftp_client.rename(remote_path + PART_SUFFIX, remote_path)
+        return remote_path
+    return put
+
+
+class DestinationVolumeSource:
+    """Volumes neben einem Manifest auf einem Ziel (Destination); Downloads mit Wiederholung."""
+
+    def __init__(self, destination, manifest_path, log=None):
+        self.destination = destination
+        self.manifest_path = manifest_path
+        self.log = log
+
+    def read_manifest(self):
+        return self.destination.read_json(self.manifest_path)
+
+    def fetch(self, name, temp_dir):
+        """Gibt (lokaler_pfad, ist_temporär) zurück."""
+        path = self.destination.sibling(self.manifest_path, name)
+        return download_with_retry(lambda: self.destination.fetch(path, temp_dir), name, self._on_retry)
+
+    def _on_retry(self, name, attempt, error):
+        if self.log:
+            self.log(f"Download of {name} failed (attempt {attempt}/{DOWNLOAD_RETRIES}): {error}. Retrying...",
+                     level="WARNING")
+
+
+def iter_volume_plaintext(source, manifest, passphrase, temp_dir, workers=DEFAULT_VOLUME_WORKERS):
+    """
+    Holt, prüft (SHA256, GCM-Tag) und entschlüsselt Volumes parallel und liefert die Klartext-Pfade
+    in Reihenfolge. Höchstens workers + 1 Volumes liegen gleichzeitig auf der Platte; jedes Volume
+    wird gelöscht, sobald der Aufrufer das nächste anfordert.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError("Not a BackupTool volume manifest.")
+    if manifest.get("encrypted") and not passphrase:
+        raise ValueError("Volumes are encrypted but no passphrase was provided.")
+    key_cache = {}
+    key_lock = threading.Lock()
+
+    def prepare(volume):
+        path, is_temp = source.fetch(volume["name"], temp_dir)
+        try:
+            if calculate_sha256(path) != volume["sha256"]:
+                raise ValueError(f"Checksum mismatch for volume {volume['name']}")
+            if not manifest.get("encrypted"):
+                return path, is_temp
+            plain_path = os.path.join(temp_dir, volume["name"] + ".plain")
+            with open(path, "rb") as f:
+                salt = f.read(16)
+            with key_lock: # PBKDF2 nur einmal pro Salt ableiten, nicht pro Volume
+                if salt not in key_cache:
+                    key_cache[salt] = derive_key_and_salt(passphrase, salt)[0]
+            decrypt_file(path, plain_path, passphrase, key_cache=key_cache)
+            return plain_path, True
+        finally:
+            if is_temp and manifest.get("encrypted"):
+                os.remove(path)
+
+    volumes = manifest["volumes"]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="volume-fetch") as executor:
+        pending = []
+        next_index = 0
+        try:
+            while next_index < len(volumes) or pending:
+                while next_index < len(volumes) and len(pending) <= workers:
+                    pending.append(executor.submit(prepare, volumes[next_index]))
+                    next_index += 1
+                path, is_temp = pending.pop(0).result()
+                try:
+                    yield path
+                finally:
+                    if is_temp and os.path.exists(path):
+                        os.remove(path)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class VolumeStream(io.RawIOBase):
+    """Liest die Klartext-Volumes aus iter_volume_plaintext als einen fortlaufenden Datenstrom."""
+
+    def __init__(self, plaintext_paths):
+        self._paths = iter(plaintext_paths)
+        self._current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self._current is None:
+                try:
+                    self._current = open(next(self._paths), "rb")
+                except StopIteration:
+                    return 0
+            count = self._current.readinto(buffer)
+            if count:
+                return count
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        close_iterator = getattr(self._paths, "close", None)
+        if close_iterator:
+            close_iterator() # räumt noch laufende Downloads und Temp-Dateien auf
+        super().close()
+
+
+def reassemble_volumes(source, passphrase, out_path, temp_dir, workers=DEFAULT_VOLUME_WORKERS):
+    """Setzt das (entschlüsselte) Archiv aus den Volumes in out_path zusammen; gibt das Manifest zurück."""
+    manifest = source.read_manifest()
+    archive_hash = hashlib.sha256()
+    with open(out_path, "wb") as f_out:
+        for path in iter_volume_plaintext(source, manifest, passphrase, temp_dir, workers):
+            with open(path, "rb") as f_in:
+                for block in iter(lambda: f_in.read(COPY_BLOCK_SIZE), b""):
+                    archive_hash.update(block)
+                    f_out.write(block)
+    if archive_hash.hexdigest() != manifest["archive_sha256"]:
+        raise ValueError("Reassembled archive does not match the manifest checksum.")
+    return manifest
+
+# ====================================================================================================
+# DESTINATIONS
+# ====================================================================================================
+#
+# Backup, Restore, Inhaltsanzeige und Retention sprechen jedes Ziel über dieselbe Schnittstelle an
+# (Destination): hochladen über uploader() mit upload_files, lesen über fetch/read_json, auflisten
+# und löschen für die Retention. Eingebaut sind LocalDestination (NAS/lokaler Ordner) und
+# SFTPDestination (Hetzner Storage Box); s3_destination.S3Destination ergänzt S3-kompatiblen
+# Objektspeicher. Weitere Ziele übergibt der Aufrufer als extra_destinations an perform_backup
+# und apply_retention_policy bzw. als source an perform_restore und get_archive_contents.
+#
+# Pfade sind relativ zum Ziel (lokal auch absolut). Ein Upload ist erst nach Abschluss sichtbar
+# (.part + Umbenennen bzw. Abschluss des Multipart-Uploads).
+
+
+class Destination:
+    """Schnittstelle eines Backup-Ziels (siehe DESTINATIONS)."""
+
+    name = None # Stufe upload:<name> und Schlüssel in den Retention-Einstellungen
+    remote = True # Lesen heißt herunterladen
+    label = None # für Log-Meldungen
+    location = None # Ort für Listing-Cache-Schlüssel
+
+    def uploader(self, expected_hashes=None, on_verified=None, parallel=False):
+        """put-Funktion für upload_files; parallel, wenn mehrere Dateien gleichzeitig laufen."""
+        raise NotImplementedError
+
+    def fetch(self, path, temp_dir, progress=None):
+        """Stellt path lokal bereit; gibt (lokaler_pfad, ist_temporär) zurück."""
+        raise NotImplementedError
+
+    def read_bytes(self, path):
+        raise NotImplementedError
+
+    def read_json(self, path):
+        return json.loads(self.read_bytes(path).decode("utf-8"))
+
+    def list_names(self):
+        """Dateinamen im Backup-Verzeichnis des Ziels."""
+        raise NotImplementedError
+
+    def stat(self, path):
+        """(größe, mtime) von path; OSError/IOError, wenn es fehlt."""
+        raise NotImplementedError
+
+    def exists(self, path):
+        try:
+            self.stat(path)
+            return True
+        except (IOError, OSError):
+            return False
+
+    def remove(self, path):
+        raise NotImplementedError
+
+    def sibling(self, path, name):
+        """Pfad von name im selben Verzeichnis wie path (Volumes, Shards, Referenz-Ziele)."""
+        return posixpath.join(posixpath.dirname(path), name)
+
+    def remove_uploaded(self, names):
+        """Räumt nach einem abgebrochenen Upload mehrerer Dateien auf (samt .part-Resten)."""
+        for name in names:
+            for suffix in ("", PART_SUFFIX):
+                if self.exists(name + suffix):
+                    self.remove(name + suffix)
+
+    def close(self):
+        pass
+
+
+class LocalDestination(Destination):
+    """NAS bzw. lokaler Ordner."""
+
+    name = "nas"
+    location = "local"
+    remote = False
+
+    def __init__(self, directory=""):
+        self.directory = directory
+        self.label = f"NAS ({directory})" if directory else "NAS"
+
+    def _path(self, path):
+        return os.path.join(self.directory, path) if self.directory else path
+
+    def uploader(self, expected_hashes=None, on_verified=None, parallel=False):
+        return nas_put(self.directory)
+
+    def fetch(self, path, temp_dir, progress=None):
+        return self._path(path), False
+
+    def read_bytes(self, path):
+        with open(self._path(path), "rb") as f:
+            return f.read()
+
+    def list_names(self):
+        return os.listdir(self.directory)
+
+    def stat(self, path):
+        st = os.stat(self._path(path))
+        return st.st_size, st.st_mtime
+
+    def remove(self, path):
+        os.remove(self._path(path))
+
+    def sibling(self, path, name):
+        return os.path.join(os.path.dirname(path), name)
+
+
+class SFTPDestination(Destination):
+    """SFTP-Server (Hetzner Storage Box); Sitzungen über sftp_pool oder pro Aufruf."""
+
+    name = "hetzner"
+
+    def __init__(self, sftp_host, sftp_username, sftp_password, sftp_pool=None, bandwidth=None, directory=""):
+        self.session_args = (sftp_host, sftp_username, sftp_password)
+        self.sftp_pool = sftp_pool
+        self.bandwidth = bandwidth
+        self.directory = directory
+        self.label = f"Hetzner Storage Box ({sftp_host})"
+        self.location = sftp_host
+        self._owned_pool = None
+
+    @classmethod
+    def from_host_string(cls, hetzner_host, hetzner_password, sftp_pool=None, bandwidth=None):
+        """Aus 'user@host:port' wie in perform_backup/apply_retention_policy."""
+        username = hetzner_host.split('@')[0] if '@' in hetzner_host else "your_sftp_user" # Default if not in host string
+        return cls(hetzner_host, username, hetzner_password, sftp_pool, bandwidth)
+
+    @classmethod
+    def from_sftp_config(cls, sftp_config, bandwidth=None):
+        """Aus dem sftp_config-Dict von perform_restore (host, port, username, password)."""
+        host_string = f"{sftp_config['username']}@{sftp_config['host']}:{sftp_config['port']}"
+        return cls(host_string, sftp_config['username'], sftp_config['password'], None, bandwidth)
+
+    def _pool(self):
+        if self.sftp_pool is None and self._owned_pool is None:
+            self._owned_pool = SFTPSessionPool() # mehrere Aufrufe: Sitzungen wiederverwenden
+        return self.sftp_pool if self.sftp_pool is not None else self._owned_pool
+
+    def session(self):
+        return sftp_session(*self.session_args, self._pool())
+
+    def _path(self, path):
+        return posixpath.join(self.directory, path) if self.directory else path
+
+    def uploader(self, expected_hashes=None, on_verified=None, parallel=False):
+        return sftp_put(*self.session_args, self._pool() if parallel else self.sftp_pool, self.bandwidth,
+                        self.directory, expected_hashes, on_verified)
+
+    def fetch(self, path, temp_dir, progress=None):
+        local_path = os.path.join(temp_dir, posixpath.basename(path))
+        with self.session() as (sftp_client, _):
+            sftp_get_with_progress(sftp_client, self._path(path), local_path, progress, self.bandwidth)
+        return local_path, True
+
+    def read_bytes(self, path):
+        with self.session() as (sftp_client, _):
+            with sftp_client.open(self._path(path), "r") as f:
+                return f.read()
+
+    def list_names(self):
+        with self.session() as (sftp_client, _):
+            return sftp_client.listdir(self.directory or ".")
+
+    def stat(self, path):
+        with self.session() as (sftp_client, _):
+            st = sftp_client.stat(self._path(path))
+        return st.st_size, st.st_mtime
+
+    def remove(self, path):
+        with self.session() as (sftp_client, _):
+            sftp_client.remove(self._path(path))
+
+    def remove_uploaded(self, names):
+        with self.session() as (sftp_client, _):
+            remote_names = set(sftp_client.listdir(self.directory or "."))
+            for name in names:
+                for suffix in ("", PART_SUFFIX):
+                    if name + suffix in remote_names:
+                        sftp_client.remove(self._path(name + suffix))
+
+    def close(self):
+        if self._owned_pool is not None:
+            self._owned_pool.close_all()
+            self._owned_pool = None
+
+
+def backup_destinations(nas_path, hetzner_host, hetzner_password, sftp_pool=None, bandwidth=None,
+                        extra_destinations=None):
+    """Ziele eines Laufs in Upload-Reihenfolge: NAS, Hetzner, dann extra_destinations."""
+    destinations = []
+    if nas_path:
+        destinations.append(LocalDestination(nas_path))
+    if hetzner_host and hetzner_password:
+        destinations.append(SFTPDestination.from_host_string(hetzner_host, hetzner_password, sftp_pool, bandwidth))
+    return destinations + [d for d in (extra_destinations or []) if d is not None]
+
+
+def restore_source(source_type, sftp_config=None, bandwidth=None):
+    """Destination für perform_restore/get_archive_contents aus source_type ('nas_local', 'hetzner_sftp')."""
+    if source_type == "nas_local":
+        return LocalDestination()
+    if source_type == "hetzner_sftp":
+        return SFTPDestination.from_sftp_config(sftp_config, bandwidth)
+    raise ValueError("Invalid source type specified for restore.")
+
+# ====================================================================================================
+# SHARDED BACKUPS
+# ====================================================================================================
+#
+# Große Quellen werden optional auf mehrere Archive ("Shards") verteilt, die in eigenen Prozessen
+# parallel gebaut werden - gzip und das Hashen laufen so auf mehreren Kernen statt auf einem:
+#   backup_20250622_180000.shard01.tar.gz.enc, .shard02.tar.gz.enc, ...
+#   backup_20250622_180000.tar.gz.enc.snapshot.json
+#
+# - shard_mode "per_root": ein Shard pro Quellpfad.
+#   shard_mode "balanced": die Einträge der obersten Ebene aller Quellen werden nach Größe (aus
+#   dem Vorab-Scan) auf shard_count Shards verteilt, größte zuerst in den jeweils kleinsten Shard.
+#   Einträge werden nie geteilt; die Pfade im Archiv sind dieselben wie ohne Shards, alle Shards
+#   zusammen entpacken also denselben Baum.
+# - Budget: höchstens shard_workers Prozesse (Standard: alle CPUs); ZIP-Shards teilen sich die
+#   CPUs für ihre Kompressions-Threads. shard_io_budget (Bytes/s) begrenzt das Lesen der Quellen
+#   über alle Prozesse zusammen (bandwidth.SharedTokenBucket).
+# - Jeder Worker archiviert, verschlüsselt (mit dem einmal im Hauptprozess abgeleiteten Schlüssel)
+#   und hasht seinen Shard; Fortschritt kommt gebündelt über eine Queue zurück. Dedup gilt
+#   innerhalb eines Shards.
+# - Das Snapshot-Manifest (Name, Größe, SHA256 und Quellen jedes Shards) wird wie ein Volume-Manifest
+#   zuletzt hochgeladen und ist für Restore, Inhaltsanzeige und Retention "das Backup".
+#
+# Worker werden per "spawn" gestartet: der Hauptprozess hat Threads (GUI, Event-Bus, SSH), ein
+# fork() kopiert deren Locks in unbestimmtem Zustand.
+
+SNAPSHOT_SUFFIX = ".snapshot.json"
+SHARD_SUFFIX = ".shard{:02d}"
+SNAPSHOT_FORMAT = "backuptool-snapshot"
+SHARD_PER_ROOT = "per_root"
+SHARD_BALANCED = "balanced"
+SHARD_PROGRESS_INTERVAL = 0.2 # Sekunden zwischen zwei Fortschrittsmeldungen eines Workers
+
+
+def is_snapshot_manifest(filename):
+    return filename.endswith(SNAPSHOT_SUFFIX)
+
+
+def is_shard(filename):
+    """True für einzelne Shards eines Snapshots (backup_..._HHMMSS.shardNN.<typ>)."""
+    parts = filename.split(".")
+    return len(parts) > 1 and parts[1].startswith("shard") and parts[1][5:].isdigit()
+
+
+def plan_shards(source_paths, shard_mode, shard_count=None, scan_sources=prescan_sources):
+    """
+    Teilt die existierenden Quellen auf. Gibt eine Liste von Shards zurück, jeder eine Liste von
+    (pfad, arcname, ScanResult) in der ursprünglichen Reihenfolge. scan_sources ersetzt den Vorab-Scan
+    (z.B. change_journal.JournaledScan.prescan).
+    """
+    roots = [p for p in source_paths if os.path.exists(p)]
+    if shard_mode == SHARD_PER_ROOT:
+        return [[(p, os.path.basename(p), scan_sources([p]))] for p in roots]
+    if shard_mode != SHARD_BALANCED:
+        raise ValueError(f"Unknown shard mode: {shard_mode}")
+
+    units = []
+    for root in roots:
+        if os.path.isdir(root) and not os.path.islink(root):
+            units += [(os.path.join(root, name), os.path.basename(root) + "/" + name) for name in sorted(os.listdir(root))]
+        else:
+            units.append((root, os.path.basename(root)))
+    units = [(path, arcname, scan_sources([path])) for path, arcname in units]
+    count = max(1, min(int(shard_count or os.cpu_count() or 1), len(units)))
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    for position in sorted(range(len(units)), key=lambda i: -units[i][2].bytes):
+        target = loads.index(min(loads))
+        shards[target].append(position)
+        loads[target] += units[position][2].bytes
+    return [[units[i] for i in sorted(shard)] for shard in shards if shard]
+
+
+_shard_worker = {} # Zustand eines Worker-Prozesses (Queue, I/O-Budget, Drosselung), gesetzt von _init_shard_worker
+
+
+def _init_shard_worker(progress_queue, io_bucket, low_impact=None):
+    _shard_worker["queue"] = progress_queue
+    _shard_worker["io_bucket"] = io_bucket
+    _shard_worker["throttle"] = None
+    if low_impact is not None:
+        # Der Hauptthread startet alle Threads des Workers: Priorität und Drosselung gelten für den ganzen Prozess
+        lower_priority(low_impact)
+        _shard_worker["throttle"] = LoadThrottle(low_impact.max_load, low_impact.max_iowait)
+
+
+class _ShardReporter:
+    """Bündelt Bytes und Dateinamen eines Workers für die Queue und bucht das gemeinsame I/O-Budget ab."""
+
+    def __init__(self, index):
+        self.index = index
+        self.queue = _shard_worker.get("queue")
+        self.io_bucket = _shard_worker.get("io_bucket")
+        self.throttle = _shard_worker.get("throttle")
+        self._bytes = 0
+        self._files = []
+        self._next_flush = time.monotonic() + SHARD_PROGRESS_INTERVAL
+
+    def progress(self, nbytes):
+        if self.io_bucket is not None:
+            self.io_bucket.consume(nbytes)
+        if self.throttle is not None:
+            self.throttle.throttle(nbytes)
+        self._bytes += nbytes
+        self._maybe_flush()
+
+    def file(self, archive_name, file_size):
+        self._files.append((archive_name, file_size))
+        self._maybe_flush()
+
+    def log(self, message, percentage=None, level="INFO"):
+        if self.queue is not None:
+            self.queue.put(("log", self.index, message, level))
+
+    def _maybe_flush(self):
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        if self.queue is not None and (self._bytes or self._files):
+            self.queue.put(("progress", self.index, self._bytes, self._files))
+        self._bytes = 0
+        self._files = []
+        self._next_flush = time.monotonic() + SHARD_PROGRESS_INTERVAL
+
+
+def _build_shard(job):
+    """Läuft im Worker-Prozess: archiviert, verschlüsselt und hasht einen Shard. Gibt den Manifest-Eintrag zurück."""
+    reporter = _ShardReporter(job["index"])
+    sources = job["sources"]
+    dedup_index = DedupIndex.build([path for path, _ in sources]) if job["dedup"] else None
+    write_archive(job["archive_path"], sources, job["compress_type"], reporter.progress, dedup_index,
+                  job["prefetch_depth"], job["prefetch_memory"], reporter.file, reporter.log, job["zip_workers"],
+                  job["compresslevel"], job["zdict"], job["drop_cache"], job["file_order"])
+    path = job["archive_path"]
+    if job["key_and_salt"]:
+        encrypt_file(path, path + ENCRYPTED_SUFFIX, None, key_and_salt=job["key_and_salt"])
+        os.remove(path)
+        path += ENCRYPTED_SUFFIX
+    reporter.flush()
+    return {"name": os.path.basename(path), "size": os.path.getsize(path), "sha256": calculate_sha256(path),
+            "sources": [arcname for _, arcname in sources], "source_bytes": job["source_bytes"]}
+
+
+def build_shards(shards, out_dir, archive_base, compress_type, key_and_salt=None, dedup=False, workers=None,
+                 io_budget=None, prefetch_depth=0, prefetch_memory=DEFAULT_PREFETCH_MEMORY,
+                 progress=None, on_file=None, log=None, compresslevel=None, zdict=None, low_impact=None,
+                 file_order=None):
+    """
+    Baut die Shards aus plan_shards parallel in out_dir. progress(nbytes), on_file(arcname, größe) und
+    log(message, level=...) werden im aufrufenden Thread mit den gebündelten Meldungen der Worker aufgerufen.
+    Gibt die Manifest-Einträge der Shards in Shard-Reihenfolge zurück.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+    from queue import Empty
+    from bandwidth import SharedTokenBucket
+
+    cpu_budget = max(1, int(workers or os.cpu_count() or 1))
+    processes = min(cpu_budget, len(shards))
+    jobs = [{
+        "index": index,
+        "sources": [(path, arcname) for path, arcname, _ in shard],
+        "source_bytes": sum(scan.bytes for _, _, scan in shard),
+        "archive_path": os.path.join(out_dir, archive_base + SHARD_SUFFIX.format(index) + "." + compress_type),
+        "compress_type": compress_type,
+        "compresslevel": compresslevel,
+        "zdict": zdict,
+        "drop_cache": bool(low_impact and low_impact.drop_cache),
+        "file_order": file_order,
+        "key_and_salt": key_and_salt,
+        "dedup": dedup,
+        "zip_workers": max(1, cpu_budget // processes),
+        "prefetch_depth": prefetch_depth,
+        "prefetch_memory": prefetch_memory // processes,
+    } for index, shard in enumerate(shards, start=1)]
+
+    def dispatch(message):
+        if message[0] == "progress":
+            _, _, nbytes, files = message
+            if progress and nbytes:
+                progress(nbytes)
+            for archive_name, file_size in files:
+                if on_file:
+                    on_file(archive_name, file_size)
+        elif log:
+            _, index, text, level = message
+            log(f"[shard {index:02d}] {text}", level=level)
+
+    context = multiprocessing.get_context("spawn")
+    progress_queue = context.Queue()
+    io_bucket = SharedTokenBucket(io_budget, context) if io_budget else None
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_shard_worker,
+                             initargs=(progress_queue, io_bucket, low_impact)) as executor:
+        futures = [executor.submit(_build_shard, job) for job in jobs]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=SHARD_PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+            while not progress_queue.empty():
+                dispatch(progress_queue.get())
+            failed = [future for future in done if future.exception() is not None]
+            if failed:
+                for future in pending: # noch nicht gestartete Shards verwerfen
+                    future.cancel()
+                raise failed[0].exception()
+    while True: # Meldungen, die erst nach dem letzten Ergebnis ankamen
+        try:
+            dispatch(progress_queue.get(timeout=0.1))
+        except Empty:
+            break
+    return [future.result() for future in futures]
+
+
+def write_snapshot_manifest(shard_entries, out_dir, archive_name, compress_type, encrypted):
+    """Schreibt <archive_name>.snapshot.json nach out_dir und gibt den Pfad zurück."""
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": 1,
+        "archive": archive_name,
+        "compress_type": compress_type,
+        "encrypted": bool(encrypted),
+        "shards": shard_entries,
+    }
+    path = os.path.join(out_dir, archive_name + SNAPSHOT_SUFFIX)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+# ====================================================================================================
+# REFERENCE BACKUPS
+# ====================================================================================================
+#
+# Hat sich die Quelle seit dem letzten Backup nicht geändert (source_fingerprint.py), wird im Modus
+# 'reference' statt eines Archivs nur eine Referenz hochgeladen:
+#   backup_20250623_180000.tar.gz.enc.ref -> {"target": "backup_20250622_180000.tar.gz.enc", ...}
+# Die Referenz liegt im selben Verzeichnis wie ihr Ziel. Restore und Inhaltsanzeige folgen ihr,
+# Retention zählt sie als eigenes Backup, löscht aber kein Ziel, auf das eine behaltene Referenz zeigt.
+
+REFERENCE_SUFFIX = ".ref"
+REFERENCE_FORMAT = "backuptool-reference"
+
+
+def is_reference(filename):
+    return filename.endswith(REFERENCE_SUFFIX)
+
+
+def write_reference(out_dir, backup_filename_base, target_name, target_sha256, fingerprint):
+    """Schreibt die Referenz auf target_name nach out_dir und gibt den Pfad zurück (Endung wie das Ziel)."""
+    suffix = target_name[target_name.index("."):] # .tar.gz.enc, .zip.manifest.json, ...
+    path = os.path.join(out_dir, backup_filename_base + suffix + REFERENCE_SUFFIX)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"format": REFERENCE_FORMAT, "version": 1, "target": target_name, "sha256": target_sha256,
+                   "fingerprint": fingerprint}, f, indent=2)
+    return path
+
+
+def _backup_exists(name, destinations):
+    """True, wenn name auf allen Zielen liegt (Grundlage für das Überspringen)."""
+    return all(destination.exists(name) for destination in destinations)
+
+
+def _upload_reference(reference_path, reference_hash, destinations, verify_uploads, metrics, progress_callback):
+    """Lädt eine Referenz auf alle Ziele hoch (gleiche .part-/Prüf-Logik wie Archive); True bei Erfolg."""
+    success = True
+    size = os.path.getsize(reference_path)
+    expected = {os.path.basename(reference_path): reference_hash} if verify_uploads else None
+    for destination in destinations:
+        try:
+            with metrics.stage(upload_stage(destination.name), bytes_in=size) as stage:
+                upload_files(destination.uploader(expected, lambda result, name=destination.name:
+                                                  metrics.add_verification(name, result)),
+                             [reference_path])
+                stage.bytes_out = size
+        except Exception as e:
+            progress_callback(f"Error uploading reference to {destination.label}: {e}", level="ERROR")
+            success = False
+    return success
+
+
+def _referenced_targets(destination, kept_files):
+    """Namen der Backups, auf die eine der behaltenen Referenzen zeigt."""
+    targets = set()
+    for _, filename in kept_files:
+        if not is_reference(filename):
+            continue
+        try:
+            reference = destination.read_json(filename)
+        except (IOError, OSError, ValueError):
+            continue
+        if reference.get("target"):
+            targets.add(reference["target"])
+    return targets
+
+
+def _protect_referenced(destination, backup_files, files_to_delete, progress_callback):
+    """Entfernt aus files_to_delete alle Backups, auf die eine behaltene Referenz zeigt."""
+    doomed = {filename for _, filename in files_to_delete}
+    kept = [entry for entry in backup_files if entry[1] not in doomed]
+    protected = _referenced_targets(destination, kept)
+    for _, filename in files_to_delete:
+        if filename in protected:
+            progress_callback(f"Keeping {filename}: still referenced by a newer backup.", level="INFO")
+    return [entry for entry in files_to_delete if entry[1] not in protected]
+
 # ====================================================================================================
 # BACKUP LOGIC
 # ====================================================================================================
 
+def _iter_zip_files(path, arcname):
+    """(pfad, arcname) aller Dateien unter path in os.walk-Reihenfolge; path selbst heißt im Archiv arcname."""
+    if not os.path.isdir(path):
+        yield path, arcname
+        return
+    for root, _, files in os.walk(path):
+        for file in files:
+            full_file_path = os.path.join(root, file)
+            yield full_file_path, arcname + "/" + os.path.relpath(full_file_path, path).replace(os.sep, "/")
+
+
+def write_archive(archive_path, sources, compress_type, progress=None, dedup_index=None, prefetch_depth=0,
+                  prefetch_memory=DEFAULT_PREFETCH_MEMORY, on_file=None, log=None, zip_workers=None,
+                  compresslevel=None, zdict=None, drop_cache=False, file_order=None):
+    """
+    Schreibt sources ([(pfad, arcname), ...]) als tar.gz oder ZIP nach archive_path, mit der
+    zlib-Stufe compresslevel (None = Standard des Formats: 9 für tar.gz, 6 für ZIP).
+    zdict (trainiertes Wörterbuch, siehe zip_dictionary.py) wird nur bei ZIP genutzt.
+    drop_cache gibt jede gelesene Datei im Page-Cache frei (Low-Impact-Modus, siehe low_impact.py).
+    file_order legt die Reihenfolge der Dateien je Quelle fest (siehe file_order.py).
+    progress(nbytes) erhält die gelesenen Quell-Bytes, on_file(arcname, größe) jede ZIP-Datei
+    (ohne on_file geht eine DEBUG-Meldung an log), log(message, percentage, level) alle übrigen Meldungen.
+    zip_workers begrenzt die Kompressions-Threads des ParallelZipWriter (Standard: alle CPUs).
+    """
+    log = log or (lambda message, percentage=None, level="INFO": None)
+    for path, _ in sources:
+        if not os.path.exists(path):
+            log(f"Warning: Source path not found: {path}. Skipping.", level="WARNING")
+    if compress_type == "tar.gz":
+        level = {} if compresslevel is None else {"compresslevel": compresslevel}
+        with tarfile.open(archive_path, "w:gz", **level) as tar:
+            for index, (path, arcname) in enumerate(sources):
+                if os.path.exists(path):
+                    add_to_tar(tar, path, arcname, progress, dedup_index, prefetch_depth, prefetch_memory, drop_cache,
+                               file_order)
+                    log(f"Added {arcname} to archive.", 10 + index * (20 / len(sources)))
+    elif compress_type == "zip":
+        # Mitglieder werden parallel komprimiert, das Ergebnis bleibt ein Standard-ZIP
+        with ParallelZipWriter(archive_path, -1 if compresslevel is None else compresslevel,
+                               max_workers=zip_workers, zdict=zdict, drop_cache=drop_cache) as zipf:
+            if zdict:
+                zipf.writestr(DICTIONARY_MEMBER, zdict) # vor allen Mitgliedern, die es brauchen
+            links = [] # Duplikate: Verweise statt Inhalt, landen in .backuptool/links.json
+            for index, (path, arcname) in enumerate(sources):
+                if not os.path.exists(path):
+                    continue
+                ordered = order_entries(_iter_zip_files(path, arcname), file_order, log)
+                with prefetched(ordered, prefetch_depth, prefetch_memory, drop_cache) as entries:
+                    for entry in entries:
+                        full_file_path, archive_name = entry.path, entry.arcname
+                        link = dedup_index.link_target(full_file_path, archive_name) if dedup_index else None
+                        st = entry.st or os.lstat(full_file_path)
+                        if link is not None:
+                            links.append({"name": archive_name, "target": link[0], "type": link[1]})
+                            file_size = st.st_size
+                        else:
+                            file_size = zipf.write(full_file_path, archive_name, entry.data).file_size
+                        # Löcher von Sparse-Dateien werden nicht gelesen (wie im Vorab-Scan)
+                        if progress:
+                            progress(min(file_size, allocated_size(st)))
+                        if on_file is not None:
+                            on_file(archive_name, file_size)
+                        else:
+                            log(f"Added {archive_name} to archive.", 10 + index * (20 / len(sources)), level="DEBUG")
+            if links:
+                zipf.writestr(LINKS_MEMBER, json.dumps({"links": links}, indent=1))
+    return os.path.getsize(archive_path)
+
+
 def perform_backup(source_paths, nas_path, hetzner_host, hetzner_password,
-                   compress_type, encrypt_enabled, passphrase, progress_callback):
+                   compress_type, encrypt_enabled, passphrase, progress_callback,
+                   sftp_pool=None, event_bus=None, progress_model=None, metrics=None, bandwidth=None,
+                   volume_size=None, volume_workers=DEFAULT_VOLUME_WORKERS, dedup=False, verify_uploads=True,
+                   prefetch_depth=None, prefetch_memory=DEFAULT_PREFETCH_MEMORY, shard_mode=None, shard_count=None,
+                   shard_workers=None, shard_io_budget=None, change_journal=None, compression_level=None,
+                   autotune=None, compression_dictionary=False, low_impact=None, file_order=None, unchanged=None,
+                   extra_destinations=None):
+    """
+    Erstellt ein Backup und lädt es auf die Ziele hoch.
+    Mit event_bus (events.EventBus) werden archivierte Dateien nur gezählt statt pro Datei
+    eine Log-Nachricht über progress_callback zu schicken.
+    progress_model (progress.ProgressModel) wird nach einem Vorab-Scan mit den verarbeiteten
+    Bytes jeder Stufe gefüttert und liefert Fortschritt, MB/s und ETA.
+    metrics (metrics.RunMetrics) erhält Zeiten, Bytes und Fehler jeder Stufe; der Aufrufer
+    exportiert sie nach dem Lauf (metrics.export_run_metrics).
+    bandwidth (bandwidth.BandwidthLimiter) begrenzt den SFTP-Upload nach Tageszeit-Profil.
+    volume_size (Bytes) zerlegt das Archiv in Volumes mit Manifest, die mit bis zu volume_workers
+    parallelen Uploads übertragen werden; Hash und Dateiname im Ergebnis gehören dann zum Manifest.
+    Uploads laufen unter <name>.part, werden pro Datei wiederholt und erst danach umbenannt.
+    dedup speichert Hardlinks und Dateien mit identischem Inhalt nur einmal (siehe dedup.py); aus, wenn nicht gesetzt.
+    verify_uploads prüft jede per SFTP hochgeladene Datei auf dem Server gegen ihren SHA256
+    (siehe verify.py); die Ergebnisse landen in metrics.verifications.
+    prefetch_depth Dateien (höchstens prefetch_memory Bytes) werden beim Archivieren parallel
+    vorausgelesen; None wählt automatisch (nur für Quellen auf Netzwerk-Dateisystemen, prefetch.py).
+    shard_mode ('per_root' oder 'balanced' mit shard_count Shards) baut mehrere Archive parallel in
+    bis zu shard_workers Prozessen, das Lesen ist über alle zusammen auf shard_io_budget Bytes/s
+    begrenzt (siehe SHARDED BACKUPS); Hash und Dateiname im Ergebnis gehören zum Snapshot-Manifest.
+    change_journal (change_journal.JournaledScan) ersetzt den vollen Vorab-Scan durch die seit dem
+    letzten Lauf gemeldeten Änderungen, solange der Watcher des Scheduler-Dienstes läuft; mit unchanged
+    spart es auch den Durchlauf für den Fingerabdruck. Die Deduplizierung durchläuft die Quellen immer.
+    compression_level ist die zlib-Stufe (None = Standard des Formats). Mit autotune
+    (autotune.TuningSettings) werden Format und Stufe nach dem Vorab-Scan an einer Stichprobe
+    gemessen und gewählt (siehe autotune.py); Wahl und Messwerte landen in metrics.compression_tuning.
+    compression_dictionary trainiert für ZIP ein Deflate-Wörterbuch aus einer Stichprobe kleiner
+    Dateien und komprimiert kleine Mitglieder damit (siehe zip_dictionary.py).
+    low_impact (low_impact.LowImpactSettings) senkt CPU- und I/O-Priorität des Laufs, gibt gelesene
+    Dateien im Page-Cache frei und pausiert das Archivieren bei hoher Systemlast.
+    file_order ('walk', 'inode', 'physical', 'type') legt die Lesereihenfolge der Dateien fest
+    (siehe file_order.py).
+    unchanged (source_fingerprint.UnchangedDetector) vergleicht vorab den Fingerabdruck der Quellen mit
+    dem letzten erfolgreichen Backup; ist nichts geändert, wird nichts archiviert und je nach Modus nur
+    das vorherige Backup zurückgegeben oder eine Referenz darauf hochgeladen (siehe REFERENCE BACKUPS).
+    extra_destinations (Destination, z.B. s3_destination.S3Destination) werden nach NAS und Hetzner
+    beschrieben (siehe DESTINATIONS).
+    """
     
     backup_filename_base = datetime.now().strftime("backup_%Y%m%d_%H%M%S")
-    temp_archive_path = os.path.join(tempfile.gettempdir(), backup_filename_base)
+    # Eigenes Temp-Verzeichnis pro Lauf: gleichzeitige Läufe in derselben Sekunde kollidieren nicht,
+    # der Archivname (und damit der Name auf den Zielen) bleibt unverändert.
+    temp_dir = tempfile.mkdtemp(prefix="backup_tool_")
+    temp_archive_path = os.path.join(temp_dir, backup_filename_base)
 
     if compress_type == "tar.gz":
         temp_archive_path += ".tar.gz"
@@ -139,95 +1422,268 @@ def perform_backup(source_paths, nas_path, hetzner_host, hetzner_password,
 
     final_backup_path = temp_archive_path # Pfad zur unverschlüsselten/unverschlüsselten Datei
     calculated_hash = None
+    run_success = False
     
     progress_callback(f"Starting backup process. Archiving to {temp_archive_path}...", 5)
 
+    if progress_model is None:
+        progress_model = ProgressModel()
+    if metrics is None:
+        metrics = RunMetrics()
+    if bandwidth is not None and bandwidth.log is None:
+        bandwidth.log = progress_callback
+    metrics.compress_type = compress_type
+    metrics.compression_level = compression_level
+    metrics.encrypted = bool(encrypt_enabled)
+    targets = backup_destinations(nas_path, hetzner_host, hetzner_password, sftp_pool, bandwidth, extra_destinations)
+    destinations = [target.name for target in targets]
+
+    if shard_mode and volume_size:
+        progress_callback("Volumes are not supported for sharded backups; writing whole shards.", level="WARNING")
+        volume_size = None
+
+    restore_priority = None
+    throttle = None
+    drop_cache = False
+    if low_impact is not None:
+        restore_priority = lower_priority(low_impact, progress_callback)
+        throttle = LoadThrottle(low_impact.max_load, low_impact.max_iowait, progress_callback)
+        drop_cache = low_impact.drop_cache
+        progress_callback("Low-impact mode: reduced CPU/IO priority"
+                          f"{', page cache released after reading' if drop_cache else ''}.", level="INFO")
+
     try:
-        # 1. Archive sources
-        if compress_type == "tar.gz":
-            with tarfile.open(temp_archive_path, "w:gz") as tar:
-                for path in source_paths:
-                    if os.path.exists(path):
-                        tar.add(path, arcname=os.path.basename(path))
-                        progress_callback(f"Added {os.path.basename(path)} to archive.", 10 + source_paths.index(path) * (20 / len(source_paths)))
-                    else:
-                        progress_callback(f"Warning: Source path not found: {path}. Skipping.", level="WARNING")
-                        
-        elif compress_type == "zip":
-            with zipfile.ZipFile(temp_archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for path in source_paths:
-                    if os.path.exists(path):
-                        for root, _, files in os.walk(path):
-                            for file in files:
-                                full_file_path = os.path.join(root, file)
-                                archive_name = os.path.relpath(full_file_path, os.path.dirname(path))
-                                zipf.write(full_file_path, archive_name)
-                                progress_callback(f"Added {archive_name} to archive.", 10 + source_paths.index(path) * (20 / len(source_paths)))
-                    else:
-                        progress_callback(f"Warning: Source path not found: {path}. Skipping.", level="WARNING")
+        if unchanged is not None:
+            with metrics.stage("fingerprint") as stage:
+                state_key = fingerprint_key(source_paths, [target.location or target.label for target in targets])
+                fingerprint, stage.files = unchanged.fingerprint(source_paths, {
+                    "compress_type": compress_type, "compression_level": compression_level,
+                    "autotune": autotune is not None, "encrypted": bool(encrypt_enabled), "volume_size": volume_size,
+                    "shard_mode": shard_mode, "shard_count": shard_count, "dedup": dedup,
+                    "compression_dictionary": compression_dictionary, "file_order": file_order},
+                    state_key, change_journal)
+                previous = unchanged.previous(state_key, fingerprint)
+            if previous is not None and not _backup_exists(previous["archive"], targets):
+                progress_callback(f"Sources unchanged, but {previous['archive']} is missing on a destination; "
+                                  "running a full backup.", level="WARNING")
+                previous = None
+            if previous is not None:
+                metrics.unchanged_of = previous["archive"]
+                if unchanged.mode != UNCHANGED_REFERENCE:
+                    progress_callback(f"Sources unchanged since {previous['archive']}; skipping backup.", 95)
+                    run_success = True
+                    return True, previous["sha256"], previous["archive"]
+                final_backup_path = write_reference(temp_dir, backup_filename_base, previous["archive"],
+                                                    previous["sha256"], fingerprint)
+                calculated_hash = calculate_sha256(final_backup_path)
+                progress_callback(f"Sources unchanged since {previous['archive']}; "
+                                  f"uploading reference {os.path.basename(final_backup_path)}.", 60)
+                if not _upload_reference(final_backup_path, calculated_hash, targets, verify_uploads, metrics,
+                                         progress_callback):
+                    progress_callback("Warning: Some uploads failed.", level="WARNING")
+                    return False, calculated_hash, os.path.basename(final_backup_path)
+                progress_callback("All uploads completed.", 95)
+                run_success = True
+                return True, calculated_hash, os.path.basename(final_backup_path)
+
+        scan_sources = change_journal.prescan if change_journal is not None else prescan_sources
+        with metrics.stage("scan") as stage:
+            if shard_mode:
+                # Der Vorab-Scan pro Eintrag liefert zugleich die Größen für die Verteilung
+                shards = plan_shards(source_paths, shard_mode, shard_count, scan_sources)
+                unit_scans = [unit_scan for shard in shards for _, _, unit_scan in shard]
+                scan = ScanResult(sum(u.files for u in unit_scans), sum(u.bytes for u in unit_scans))
+            else:
+                scan = scan_sources([p for p in source_paths if os.path.exists(p)])
+            stage.files = scan.files
+            stage.bytes_in = scan.bytes
+        progress_model.plan(scan, encrypt=encrypt_enabled, destinations=destinations)
+        progress_model.start_stage(STAGE_ARCHIVE)
+        progress_callback(f"Pre-scan: {scan.files} files, {scan.bytes} bytes.", 8)
+
+        if autotune is not None:
+            with metrics.stage("autotune") as stage:
+                tuning = tune_compression([p for p in source_paths if os.path.exists(p)], scan.bytes,
+                                          len(destinations), autotune)
+                stage.bytes_in = tuning.sample_bytes
+                stage.files = tuning.sample_files
+            metrics.compression_tuning = tuning.to_dict()
+            metrics.compress_type = compress_type = tuning.compress_type
+            metrics.compression_level = compression_level = tuning.level
+            temp_archive_path = os.path.join(temp_dir, f"{backup_filename_base}.{compress_type}")
+            final_backup_path = temp_archive_path
+            progress_callback(f"Compression auto-tune: {compress_type} level {compression_level} "
+                              f"(sampled {tuning.sample_files} files, {tuning.sample_bytes} bytes).", 9)
+
+        dedup_index = None
+        if dedup and not shard_mode: # Shards deduplizieren jeweils für sich im Worker
+            with metrics.stage("dedup") as stage:
+                dedup_index = DedupIndex.build([p for p in source_paths if os.path.exists(p)])
+                stage.files = dedup_index.files_hashed
+                stage.bytes_in = dedup_index.bytes_hashed
+            if dedup_index.duplicate_files:
+                progress_callback(f"Deduplication: {dedup_index.duplicate_files} duplicate files "
+                                  f"({dedup_index.duplicate_bytes} bytes) stored as references.", 9)
+
+        zdict = None
+        if compression_dictionary and compress_type != "zip":
+            progress_callback("Compression dictionaries apply to zip archives only; skipping.", level="WARNING")
+        elif compression_dictionary:
+            with metrics.stage("dictionary") as stage:
+                zdict, stage.bytes_in, gain = build_dictionary([p for p in source_paths if os.path.exists(p)],
+                                                               -1 if compression_level is None else compression_level)
+                stage.bytes_out = len(zdict) if zdict else 0
+            if zdict:
+                progress_callback(f"Compression dictionary trained: {len(zdict)} bytes, "
+                                  f"{gain:.0%} smaller small files in the sample.", 9)
+            else:
+                progress_callback(f"Compression dictionary skipped: no benefit on the sample ({gain:.0%}).", 9)
 
-        progress_callback("Archiving complete.", 30)
+        prefetch_depth = prefetch_depth_for(source_paths, prefetch_depth)
+        if prefetch_depth:
+            progress_callback(f"Read-ahead enabled: {prefetch_depth} files, "
+                              f"{prefetch_memory // (1024 * 1024)} MB.", level="DEBUG")
 
-        # 2. Encrypt if enabled
+        key_and_salt = None
         if encrypt_enabled:
-            progress_callback("Encrypting archive...", 35)
             if not passphrase:
                 progress_callback("Error: Encryption enabled but no passphrase provided.", level="ERROR")
                 return False, None, None
-            
-            with open(temp_archive_path, "rb") as f_in:
-                data_to_encrypt = f_in.read()
-            
-            encrypted_data = encrypt_data(data_to_encrypt, passphrase)
-            
-            os.remove(temp_archive_path) # Originaldatei löschen
-            final_backup_path = temp_archive_path + ".enc"
-            with open(final_backup_path, "wb") as f_out:
-                f_out.write(encrypted_data)
-            progress_callback("Encryption complete.", 45)
 
-        # 3. Calculate SHA256 Hash
-        progress_callback("Calculating SHA256 hash...", 50)
-        calculated_hash = calculate_sha256(final_backup_path)
-        progress_callback(f"SHA256 Hash: {calculated_hash}", 60, level="INFO")
+            # PBKDF2 (100.000 Iterationen) als eigene Stufe, damit sie in den Metriken sichtbar ist
+            with metrics.stage("kdf"):
+                key_and_salt = derive_key_and_salt(passphrase)
+
+        if shard_mode:
+            # 1.-3. Shards parallel in Worker-Prozessen archivieren, verschlüsseln und hashen
+            progress_callback(f"Archiving {len(shards)} shards in parallel...", 10)
+            with metrics.stage(STAGE_ARCHIVE, bytes_in=scan.bytes, files=scan.files) as stage:
+                shard_entries = build_shards(shards, temp_dir, backup_filename_base, compress_type, key_and_salt, dedup,
+                                             shard_workers, shard_io_budget, prefetch_depth, prefetch_memory,
+                                             progress_model.callback(STAGE_ARCHIVE),
+                                             event_bus.file_archived if event_bus is not None else None,
+                                             progress_callback, compression_level, zdict, low_impact, file_order)
+                stage.bytes_out = sum(entry["size"] for entry in shard_entries)
+            for stage_name in (STAGE_ARCHIVE, STAGE_ENCRYPT, STAGE_HASH):
+                progress_model.finish_stage(stage_name)
+            final_backup_path = write_snapshot_manifest(
+                shard_entries, temp_dir, os.path.basename(temp_archive_path) + (ENCRYPTED_SUFFIX if encrypt_enabled else ""),
+                compress_type, encrypt_enabled)
+            calculated_hash = calculate_sha256(final_backup_path)
+            # Snapshot-Manifest zuletzt: erst dann ist das Backup vollständig
+            upload_paths = [os.path.join(temp_dir, entry["name"]) for entry in shard_entries] + [final_backup_path]
+            expected_hashes = {entry["name"]: entry["sha256"] for entry in shard_entries}
+            expected_hashes[os.path.basename(final_backup_path)] = calculated_hash
+            progress_callback(f"{len(shard_entries)} shards archived. Snapshot manifest SHA256: {calculated_hash}", 60)
+        else:
+            # 1. Archive sources
+            with metrics.stage(STAGE_ARCHIVE, bytes_in=scan.bytes, files=scan.files) as stage:
+                archive_progress = progress_model.callback(STAGE_ARCHIVE)
+                if throttle is not None:
+                    archive_progress = throttle.wrap(archive_progress)
+                stage.bytes_out = write_archive(temp_archive_path, [(p, os.path.basename(p)) for p in source_paths], compress_type,
+                                                archive_progress, dedup_index, prefetch_depth,
+                                                prefetch_memory, event_bus.file_archived if event_bus is not None else None,
+                                                progress_callback, compresslevel=compression_level, zdict=zdict,
+                                                drop_cache=drop_cache, file_order=file_order)
+
+            progress_model.finish_stage(STAGE_ARCHIVE)
+            progress_model.set_archive_size(stage.bytes_out)
+            if throttle is not None and throttle.paused_seconds:
+                progress_callback(f"Low-impact mode: archiving paused {throttle.paused_seconds:.0f} s for system load.")
+            progress_callback("Archiving complete.", 30)
+
+            if volume_size:
+                # 2./3. In Volumes zerlegen (und dabei verschlüsseln), Hash pro Volume
+                progress_callback(f"Splitting archive into volumes of {volume_size} bytes...", 35)
+                split_stage = STAGE_ENCRYPT if encrypt_enabled else STAGE_HASH
+                progress_model.start_stage(split_stage)
+                with metrics.stage("split", bytes_in=os.path.getsize(temp_archive_path)) as stage:
+                    manifest, upload_paths = split_into_volumes(
+                        temp_archive_path, temp_dir, os.path.basename(temp_archive_path) + (".enc" if encrypt_enabled else ""),
+                        volume_size, key_and_salt, progress_model.callback(split_stage))
+                    manifest["compress_type"] = compress_type
+                    final_backup_path = write_manifest(manifest, temp_dir)
+                    stage.bytes_out = sum(volume["size"] for volume in manifest["volumes"])
+                os.remove(temp_archive_path)
+                progress_model.finish_stage(STAGE_ENCRYPT)
+                progress_model.finish_stage(STAGE_HASH)
+                calculated_hash = calculate_sha256(final_backup_path)
+                upload_paths.append(final_backup_path) # Manifest zuletzt: erst dann ist das Backup vollständig
+                expected_hashes = {volume["name"]: volume["sha256"] for volume in manifest["volumes"]}
+                expected_hashes[os.path.basename(final_backup_path)] = calculated_hash
+                progress_callback(f"Archive split into {len(manifest['volumes'])} volumes. Manifest SHA256: {calculated_hash}", 60)
+            else:
+                # 2. Encrypt if enabled
+                if encrypt_enabled:
+                    progress_callback("Encrypting archive...", 35)
+                    progress_model.start_stage(STAGE_ENCRYPT)
+                    encrypted_path = temp_archive_path + ".enc"
+                    with metrics.stage(STAGE_ENCRYPT, bytes_in=os.path.getsize(temp_archive_path)) as stage:
+                        encrypt_file(temp_archive_path, encrypted_path, passphrase,
+                                     progress_model.callback(STAGE_ENCRYPT), key_and_salt=key_and_salt)
+                        stage.bytes_out = os.path.getsize(encrypted_path)
+
+                    os.remove(temp_archive_path) # Originaldatei löschen
+                    final_backup_path = encrypted_path
+                    progress_model.finish_stage(STAGE_ENCRYPT)
+                    progress_callback("Encryption complete.", 45)
+
+                # 3. Calculate SHA256 Hash
+                progress_callback("Calculating SHA256 hash...", 50)
+                progress_model.set_total(STAGE_HASH, os.path.getsize(final_backup_path))
+                progress_model.start_stage(STAGE_HASH)
+                with metrics.stage(STAGE_HASH, bytes_in=os.path.getsize(final_backup_path)):
+                    calculated_hash = calculate_sha256(final_backup_path, progress_model.callback(STAGE_HASH))
+                progress_model.finish_stage(STAGE_HASH)
+                progress_callback(f"SHA256 Hash: {calculated_hash}", 60, level="INFO")
+                upload_paths = [final_backup_path]
+                expected_hashes = {os.path.basename(final_backup_path): calculated_hash}
 
         # 4. Upload to destinations
+        upload_size = sum(os.path.getsize(path) for path in upload_paths)
+        for destination in destinations:
+            progress_model.set_total(upload_stage(destination), upload_size)
+        workers = max(1, volume_workers) if len(upload_paths) > 1 else 1
         upload_success = True
-        
-        # Upload to NAS
-        if nas_path:
-            progress_callback(f"Uploading to NAS: {nas_path}", 65)
-            try:
-                dest_nas_path = os.path.join(nas_path, os.path.basename(final_backup_path))
-                shutil.copy2(final_backup_path, dest_nas_path)
-                progress_callback(f"Backup uploaded to NAS: {dest_nas_path}", 75)
-            except Exception as e:
-                progress_callback(f"Error uploading to NAS: {e}", level="ERROR")
-                upload_success = False
 
-        # Upload to Hetzner Storage Box (SFTP)
-        if hetzner_host and hetzner_password:
-            progress_callback(f"Uploading to Hetzner Storage Box ({hetzner_host})...", 80)
-            sftp_client = None
-            transport = None
+        def on_retry(stage_name):
+            def retry(name, attempt, error):
+                metrics.add_retry(stage_name)
+                progress_callback(f"Upload of {name} failed (attempt {attempt}/{UPLOAD_RETRIES}): {error}. Retrying...", level="WARNING")
+            return retry
+        
+        def on_verified(destination):
+            def verified(result):
+                metrics.add_verification(destination.name, result)
+                progress_callback(f"Remote verification of {result.file} ({result.method}): {'OK' if result.ok else 'FAILED'}",
+                                  level="INFO" if result.ok else "ERROR")
+            return verified
+
+        # Upload to NAS, Hetzner Storage Box (SFTP) and further destinations
+        for index, destination in enumerate(targets):
+            stage_name = upload_stage(destination.name)
+            progress_callback(f"Uploading to {destination.label}...", 65 + 25 * index // len(targets))
             try:
-                # Assuming username is part of hetzner_host (user@host:port) or passed separately
-                # For SFTP, we pass username explicitly to get_sftp_client
-                username_for_sftp = hetzner_host.split('@')[0] if '@' in hetzner_host else "your_sftp_user" # Default if not in host string
-                
-                sftp_client, transport = get_sftp_client(hetzner_host, username_for_sftp, hetzner_password)
-                
-                remote_path = os.path.basename(final_backup_path)
-                sftp_client.put(final_backup_path, remote_path)
-                progress_callback(f"Backup uploaded to Hetzner Storage Box: {remote_path}", 90)
+                progress_model.start_stage(stage_name)
+                with metrics.stage(stage_name, bytes_in=upload_size) as stage:
+                    # Parallele Volume-/Shard-Uploads brauchen eigene Sitzungen bzw. Verbindungen
+                    upload_files(destination.uploader(expected_hashes if verify_uploads else None,
+                                                      on_verified(destination), parallel=workers > 1),
+                                 upload_paths, progress_model.callback(stage_name), on_retry(stage_name), workers)
+                    stage.bytes_out = upload_size
+                progress_model.finish_stage(stage_name)
+                progress_callback(f"Backup uploaded to {destination.label}: {os.path.basename(final_backup_path)}",
+                                  65 + 25 * (index + 1) // len(targets))
             except Exception as e:
-                progress_callback(f"Error uploading to Hetzner Storage Box: {e}", level="ERROR")
+                progress_callback(f"Error uploading to {destination.label}: {e}", level="ERROR")
                 upload_success = False
-            finally:
-                if sftp_client:
-                    sftp_client.close()
-                if transport:
-                    transport.close()
+                if len(upload_paths) > 1: # ohne Manifest sind hochgeladene Volumes/Shards nutzlos
+                    try:
+                        destination.remove_uploaded([os.path.basename(path) for path in upload_paths])
+                    except Exception as cleanup_error:
+                        progress_callback(f"Could not remove partial uploads from {destination.label}: {cleanup_error}",
+                                          level="WARNING")
 
         if upload_success:
             progress_callback("All uploads completed.", 95)
@@ -235,12 +1691,23 @@ def perform_backup(source_paths, nas_path, hetzner_host, hetzner_password,
             progress_callback("Warning: Some uploads failed.", level="WARNING")
             return False, calculated_hash, os.path.basename(final_backup_path) # Return hash and filename even if upload partially fails
 
+        if unchanged is not None:
+            try:
+                unchanged.record(state_key, fingerprint, os.path.basename(final_backup_path), calculated_hash)
+            except OSError as e:
+                progress_callback(f"Could not save the source fingerprint: {e}", level="WARNING")
+        run_success = True
         return True, calculated_hash, os.path.basename(final_backup_path)
 
     except Exception as e:
         progress_callback(f"An unexpected error occurred during backup: {e}", level="ERROR")
         return False, None, None
     finally:
+        for target in targets:
+            target.close()
+        if restore_priority is not None:
+            restore_priority()
+        metrics.finish(run_success, os.path.basename(final_backup_path) if calculated_hash else metrics.unchanged_of)
         # Clean up temporary archive file
         if os.path.exists(final_backup_path):
             os.remove(final_backup_path)
@@ -248,23 +1715,276 @@ def perform_backup(source_paths, nas_path, hetzner_host, hetzner_password,
         elif os.path.exists(temp_archive_path): # falls Verschlüsselung fehlschlug
              os.remove(temp_archive_path)
              progress_callback(f"Temporary archive deleted: {temp_archive_path}", 100)
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 # ====================================================================================================
 # RESTORE LOGIC
 # ====================================================================================================
 
-def perform_restore(source_type, source_path, destination_path, overwrite_existing, sftp_config, log_callback):
+SPARSE_RESTORE_MIN_SIZE = 1024 * 1024
+SPARSE_RESTORE_MIN_RATIO = 64 # Null-Bereiche komprimieren etwa 1000:1, normale Daten selten über 10:1
+ENCRYPTED_SUFFIX = ".enc"
+STAGING_PREFIX = ".backuptool-restore-" # im Ziel, damit das Übernehmen ein os.replace ist
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _zip_member_target(destination_path, info):
+    # Gleiche Bereinigung wie zipfile.ZipFile.extract: keine Laufwerke, absoluten Pfade oder ".."
+    arcname = info.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir)]
+    return os.path.join(destination_path, *parts)
+
+
+def _restore_link(source_path, target_path, kind):
+    """Legt ein dedupliziertes Mitglied wieder an: Hardlink (Fallback Kopie) oder eigenständige Kopie."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    if kind == LINK_HARDLINK:
+        try:
+            os.link(source_path, target_path)
+            return
+        except OSError:
+            pass # z.B. Dateisystem ohne Hardlinks: Inhalt ist derselbe, also kopieren
+    shutil.copy2(source_path, target_path)
+
+
+def _extract_zip(archive_path, destination_path, overwrite_existing, log_callback):
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref, open(archive_path, "rb") as raw_fp:
+        zdict = load_dictionary(zip_ref)
+        links = []
+        if LINKS_MEMBER in zip_ref.namelist():
+            links = json.loads(zip_ref.read(LINKS_MEMBER).decode("utf-8")).get("links", [])
+        for info in zip_ref.infolist():
+            member = info.filename
+            if member.startswith(METADATA_DIR):
+                continue
+            member_path = os.path.join(destination_path, member)
+            if overwrite_existing or not os.path.exists(member_path):
+                if uses_dictionary(info):
+                    target = _zip_member_target(destination_path, info)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, "wb") as f:
+                        f.write(read_dictionary_member(raw_fp, info, zdict))
+                elif (not info.is_dir() and info.file_size >= SPARSE_RESTORE_MIN_SIZE
+                        and info.compress_size * SPARSE_RESTORE_MIN_RATIO < info.file_size):
+                    # Vermutlich eine Sparse-Datei: Null-Blöcke als Löcher anlegen statt schreiben
+                    target = _zip_member_target(destination_path, info)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zip_ref.open(info) as src:
+                        write_sparse(src, target, info.file_size)
+                else:
+                    zip_ref.extract(info, destination_path)
+                log_callback(f"Extracted {member}", level="DEBUG")
+            else:
+                log_callback(f"Skipped {member} (file exists and overwrite is false)", level="DEBUG")
+
+        for link in links:
+            target = _zip_member_target(destination_path, zipfile.ZipInfo(link["name"]))
+            if overwrite_existing or not os.path.exists(target):
+                _restore_link(_zip_member_target(destination_path, zipfile.ZipInfo(link["target"])), target, link["type"])
+                log_callback(f"Restored {link['name']} ({link['type']} of {link['target']})", level="DEBUG")
+            else:
+                log_callback(f"Skipped {link['name']} (file exists and overwrite is false)", level="DEBUG")
+
+
+def _inside(base, path):
+    """True, wenn path (Symlinks in den Elternverzeichnissen aufgelöst) unter base liegt."""
+    base = os.path.realpath(base)
+    path = os.path.join(os.path.realpath(os.path.dirname(os.path.join(base, path))), os.path.basename(path))
+    return path == base or path.startswith(os.path.join(base, ""))
+
+
+def _extract_tar_members(tar_ref, destination_path, overwrite_existing, log_callback, staging_path=None):
+    # Iteration statt getmembers(): funktioniert auch mit Stream-Modus ("r|gz") ohne Zurückspulen.
+    # Mit staging_path wird dorthin entpackt; destination_path entscheidet nur, was übersprungen wird.
+    extract_path = staging_path or destination_path
+    for member in tar_ref:
+        # Wie _zip_member_target: nichts außerhalb des Ziels schreiben oder (über Hardlinks) lesen.
+        # Kein tarfile-Filter "data": der lehnt auch gesicherte Symlinks mit absolutem Ziel ab.
+        if not _inside(extract_path, member.name) or (member.islnk() and not _inside(extract_path, member.linkname)):
+            log_callback(f"Skipped {member.name}: path outside the restore destination", level="WARNING")
+            continue
+        member_path = os.path.join(destination_path, member.name)
+        if overwrite_existing or not os.path.exists(member_path):
+            is_copy = member.pax_headers.get(DEDUP_PAX_KEY) == LINK_COPY
+            if member.islnk() and (is_copy or staging_path):
+                # Deduplizierte Kopie: wieder als eigenständige Datei anlegen, nicht als Hardlink.
+                # Im Staging kann das Original auch übersprungen worden sein und schon im Ziel liegen.
+                link_source = os.path.join(extract_path, member.linkname)
+                if not os.path.lexists(link_source):
+                    link_source = os.path.join(destination_path, member.linkname)
+                target_path = os.path.join(extract_path, member.name)
+                _restore_link(link_source, target_path, LINK_COPY if is_copy else LINK_HARDLINK)
+                os.utime(target_path, (member.mtime, member.mtime))
+            else:
+                tar_ref.extract(member, extract_path)
+            log_callback(f"Extracted {member.name}", level="DEBUG")
+        else:
+            log_callback(f"Skipped {member.name} (file exists and overwrite is false)", level="DEBUG")
+
+
+def _commit_staging(staging_path, destination_path):
+    """Verschiebt die entpackten Dateien aus staging_path an ihren Platz unter destination_path."""
+    created_dirs = []
+    for root, dirs, files in os.walk(staging_path):
+        target_root = os.path.normpath(os.path.join(destination_path, os.path.relpath(root, staging_path)))
+        for name in list(dirs):
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            if os.path.islink(source): # Symlink auf ein Verzeichnis: wie eine Datei verschieben
+                dirs.remove(name)
+                files.append(name)
+            elif not os.path.isdir(target):
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.mkdir(target)
+                created_dirs.append((source, target))
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target_root, name))
+    # Rechte und Zeitstempel neuer Verzeichnisse erst zum Schluss setzen (das Verschieben ändert mtime)
+    for source, target in reversed(created_dirs):
+        shutil.copystat(source, target)
+
+
+def _extract_encrypted(archive_path, destination_path, overwrite_existing, log_callback, passphrase):
+    """
+    Entschlüsselt ein .enc-Archiv im Datenstrom (konstanter Speicher) und gibt das erkannte Format zurück.
+    Nichts wird ins Ziel übernommen, bevor der GCM-Tag am Ende des Archivs geprüft ist:
+
+    - tar.gz: Entschlüsseln und Entpacken in einem Durchlauf in ein Staging-Verzeichnis im Ziel,
+              nach erfolgreicher Prüfung per os.replace an die endgültigen Pfade verschoben.
+    - ZIP:    Braucht wahlfreien Zugriff (Verzeichnis am Ende); wird blockweise in eine Datei im
+              Staging-Verzeichnis entschlüsselt und erst nach der Prüfung entpackt.
+    """
+    if not passphrase:
+        raise ValueError("Archive is encrypted but no passphrase was provided.")
+    staging_path = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=destination_path)
+    try:
+        with open(archive_path, "rb") as f_in:
+            reader = io.BufferedReader(DecryptingReader(f_in, passphrase), buffer_size=COPY_BLOCK_SIZE)
+            if reader.peek(len(GZIP_MAGIC)).startswith(GZIP_MAGIC):
+                with tarfile.open(fileobj=reader, mode="r|gz") as tar_ref:
+                    _extract_tar_members(tar_ref, destination_path, overwrite_existing, log_callback, staging_path)
+                # tarfile hört beim Ende-Marker auf; der Rest (gzip-Trailer) muss für die Tag-Prüfung gelesen werden
+                for _ in iter(lambda: reader.read(COPY_BLOCK_SIZE), b""):
+                    pass
+                log_callback("Archive authenticated, moving restored files into place.", level="INFO")
+                _commit_staging(staging_path, destination_path)
+                return "TAR.GZ"
+
+            plain_path = os.path.join(staging_path, os.path.basename(archive_path)[:-len(ENCRYPTED_SUFFIX)])
+            with open(plain_path, "wb") as f_out:
+                shutil.copyfileobj(reader, f_out, COPY_BLOCK_SIZE)
+        log_callback("Archive authenticated, extracting.", level="INFO")
+        _extract_zip(plain_path, destination_path, overwrite_existing, log_callback)
+        return "ZIP"
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+
+def _restore_volumes(source, source_path, destination_path, overwrite_existing, log_callback, metrics, passphrase,
+                     workers):
+    """
+    Stellt ein Multi-Volume-Backup wieder her; TAR-Archive werden direkt aus den Volumes entpackt.
+    Wie bei _extract_encrypted landet nichts im Ziel, bevor das letzte Volume geprüft ist: TAR-Archive
+    werden in ein Staging-Verzeichnis im Ziel entpackt und erst danach übernommen.
+    """
+    temp_dir = tempfile.mkdtemp(prefix="backup_tool_restore_")
+    staging_path = None
+    try:
+        volumes = DestinationVolumeSource(source, source_path, log_callback)
+        manifest = volumes.read_manifest()
+        log_callback(f"Restoring {manifest['archive']} from {len(manifest['volumes'])} volumes.", level="INFO")
+        with metrics.stage("extract", bytes_in=manifest["archive_size"]):
+            if manifest.get("compress_type") == "tar.gz":
+                stream = io.BufferedReader(VolumeStream(iter_volume_plaintext(volumes, manifest, passphrase, temp_dir, workers)),
+                                           buffer_size=COPY_BLOCK_SIZE)
+                staging_path = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=destination_path)
+                try:
+                    with tarfile.open(fileobj=stream, mode="r|gz") as tar_ref:
+                        _extract_tar_members(tar_ref, destination_path, overwrite_existing, log_callback, staging_path)
+                    # Restliche Volumes (gzip-Trailer) noch holen und prüfen lassen
+                    for _ in iter(lambda: stream.read(COPY_BLOCK_SIZE), b""):
+                        pass
+                finally:
+                    stream.close()
+                log_callback("All volumes verified, moving restored files into place.", level="INFO")
+                _commit_staging(staging_path, destination_path)
+            else:
+                archive_path = os.path.join(temp_dir, manifest["archive"])
+                reassemble_volumes(volumes, passphrase, archive_path, temp_dir, workers)
+                _extract_zip(archive_path, destination_path, overwrite_existing, log_callback)
+        log_callback(f"Successfully restored from {len(manifest['volumes'])} volumes to {destination_path}", level="INFO")
+        return True, "Restore completed successfully."
+    except Exception as e:
+        return False, f"Failed to restore volumes of {os.path.basename(source_path)}: {e}"
+    finally:
+        if staging_path:
+            shutil.rmtree(staging_path, ignore_errors=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _restore_snapshot(source, source_type, source_path, destination_path, overwrite_existing, sftp_config, log_callback,
+                      metrics, bandwidth, passphrase):
+    """Stellt die Shards eines Snapshots nacheinander in dasselbe Ziel wieder her."""
+    try:
+        manifest = source.read_json(source_path)
+    except Exception as e:
+        return False, f"Failed to read snapshot manifest {os.path.basename(source_path)}: {e}"
+    shards = manifest.get("shards", [])
+    log_callback(f"Restoring {manifest['archive']} from {len(shards)} shards.", level="INFO")
+    for shard in shards:
+        success, message = perform_restore(source_type, source.sibling(source_path, shard["name"]), destination_path,
+                                           overwrite_existing, sftp_config, log_callback, metrics, bandwidth, passphrase,
+                                           source=source)
+        if not success:
+            return False, f"Restore of shard {shard['name']} failed: {message}"
+    log_callback(f"Successfully restored from {len(shards)} shards to {destination_path}", level="INFO")
+    return True, "Restore completed successfully."
+
+
+def _restore_reference(source, source_type, source_path, destination_path, overwrite_existing, sftp_config,
+                       log_callback, metrics, bandwidth, passphrase, volume_workers):
+    """Stellt das Backup wieder her, auf das eine Referenz zeigt (liegt im selben Verzeichnis)."""
+    try:
+        reference = source.read_json(source_path)
+    except Exception as e:
+        return False, f"Failed to read reference {os.path.basename(source_path)}: {e}"
+    log_callback(f"{os.path.basename(source_path)} refers to unchanged backup {reference['target']}.", level="INFO")
+    return perform_restore(source_type, source.sibling(source_path, reference["target"]), destination_path,
+                           overwrite_existing, sftp_config, log_callback, metrics, bandwidth, passphrase, volume_workers,
+                           source=source)
+
+
+def perform_restore(source_type, source_path, destination_path, overwrite_existing, sftp_config, log_callback,
+                    metrics=None, bandwidth=None, passphrase=None, volume_workers=DEFAULT_VOLUME_WORKERS, source=None):
     """
     Führt eine Wiederherstellung aus.
 
     Args:
-        source_type (str): 'nas_local' oder 'hetzner_sftp'.
-        source_path (str): Der Pfad zum Archiv (lokal oder auf SFTP-Server).
+        source_type (str): 'nas_local', 'hetzner_sftp' oder ein anderer Name, wenn source übergeben wird.
+        source_path (str): Der Pfad zum Archiv (lokal, auf dem SFTP-Server bzw. im Ziel source).
         destination_path (str): Der Zielpfad für die Wiederherstellung.
         overwrite_existing (bool): True, um existierende Dateien zu überschreiben.
         sftp_config (dict): SFTP-Verbindungsinformationen (host, port, username, password) wenn source_type 'hetzner_sftp' ist.
         log_callback (function): Callback-Funktion zum Loggen von Nachrichten.
+        metrics (metrics.RunMetrics): Optional, misst die Stufen 'download' und 'extract'.
+        bandwidth (bandwidth.BandwidthLimiter): Optional, begrenzt den SFTP-Download.
+        passphrase (str): Für verschlüsselte Archive (.enc) und Multi-Volume-Backups (source_path ist dann das Manifest).
+            Ein Snapshot-Manifest (.snapshot.json) stellt alle Shards des Snapshots wieder her,
+            eine Referenz (.ref) das Backup, auf das sie zeigt.
+        volume_workers (int): Anzahl Volumes, die parallel geladen, geprüft und entschlüsselt werden.
+        source (Destination): Optional, Ziel, aus dem gelesen wird (z.B. s3_destination.S3Destination);
+            ohne wird es aus source_type und sftp_config gebildet.
     """
+    if metrics is None:
+        metrics = RunMetrics(job="restore")
+    if bandwidth is not None and bandwidth.log is None:
+        bandwidth.log = log_callback
     log_callback(f"Starting restore from {source_type} path: {source_path} to {destination_path}", level="INFO")
 
     if not os.path.exists(destination_path):
@@ -274,116 +1994,171 @@ def perform_restore(source_type, source_path, destination_path, overwrite_existi
         except OSError as e:
             return False, f"Failed to create destination directory {destination_path}: {e}"
 
-    # Determine the archive path on the local filesystem (after download if SFTP)
-    local_archive_path = None
-
-    if source_type == "nas_local":
-        local_archive_path = source_path
-    elif source_type == "hetzner_sftp":
+    owned_source = source is None
+    if owned_source:
         try:
-            log_callback(f"Attempting to download archive from SFTP: {source_path}", level="INFO")
-            
-            transport = paramiko.Transport((sftp_config['host'], sftp_config['port']))
-            transport.connect(username=sftp_config['username'], password=sftp_config['password'])
-            sftp = paramiko.SFTPClient.from_transport(transport)
-
-            # Create a temporary file for the downloaded archive
-            temp_dir = os.path.join(os.path.expanduser("~"), ".backup_tool", "temp_restore")
-            os.makedirs(temp_dir, exist_ok=True)
-            local_archive_path = os.path.join(temp_dir, os.path.basename(source_path))
-
-            # Download the file
-            sftp.get(source_path, local_archive_path)
-            log_callback(f"Successfully downloaded {source_path} to {local_archive_path}", level="INFO")
-
-        except paramiko.AuthenticationException:
-            return False, "SFTP Authentication failed. Check username/password."
-        except paramiko.SSHException as e:
-            return False, f"Could not establish SFTP connection or transfer file: {e}"
-        except Exception as e:
-            return False, f"An unexpected error occurred during SFTP download: {e}"
-        finally:
-            if 'sftp' in locals() and sftp:
-                sftp.close()
-            if 'transport' in locals() and transport:
-                transport.close()
-    else:
-        return False, "Invalid source type specified for restore."
+            source = restore_source(source_type, sftp_config, bandwidth)
+        except ValueError as e:
+            return False, str(e)
+    try:
+        if is_reference(source_path):
+            return _restore_reference(source, source_type, source_path, destination_path, overwrite_existing,
+                                      sftp_config, log_callback, metrics, bandwidth, passphrase, volume_workers)
+        if is_volume_manifest(source_path):
+            return _restore_volumes(source, source_path, destination_path, overwrite_existing, log_callback, metrics,
+                                    passphrase, volume_workers)
+        if is_snapshot_manifest(source_path):
+            return _restore_snapshot(source, source_type, source_path, destination_path, overwrite_existing,
+                                     sftp_config, log_callback, metrics, bandwidth, passphrase)
+        return _restore_archive(source, source_path, destination_path, overwrite_existing, log_callback, metrics,
+                                passphrase)
+    finally:
+        if owned_source:
+            source.close()
 
-    if not local_archive_path or not os.path.exists(local_archive_path):
-        return False, f"Archive file not found locally: {local_archive_path}"
 
-    # Proceed with extraction based on file type
+def _restore_archive(source, source_path, destination_path, overwrite_existing, log_callback, metrics, passphrase):
+    """Holt ein einzelnes Archiv vom Ziel (entfernte Ziele in ein Temp-Verzeichnis) und entpackt es."""
+    temp_dir = tempfile.mkdtemp(prefix="backup_tool_restore_")
     try:
-        if zipfile.is_zipfile(local_archive_path):
-            with zipfile.ZipFile(local_archive_path, 'r') as zip_ref:
-                for member in zip_ref.namelist():
-                    member_path = os.path.join(destination_path, member)
-                    if overwrite_existing or not os.path.exists(member_path):
-                        zip_ref.extract(member, destination_path)
-                        log_callback(f"Extracted {member}", level="DEBUG")
-                    else:
-                        log_callback(f"Skipped {member} (file exists and overwrite is false)", level="DEBUG")
-            log_callback(f"Successfully restored from ZIP archive {local_archive_path} to {destination_path}", level="INFO")
-            
-        elif tarfile.is_tarfile(local_archive_path):
-            with tarfile.open(local_archive_path, 'r:gz') as tar_ref: # Assuming it's a .tar.gz
-                for member in tar_ref.getmembers():
-                    member_path = os.path.join(destination_path, member.name)
-                    if overwrite_existing or not os.path.exists(member_path):
-                        tar_ref.extract(member, destination_path)
-                        log_callback(f"Extracted {member.name}", level="DEBUG")
-                    else:
-                        log_callback(f"Skipped {member.name} (file exists and overwrite is false)", level="DEBUG")
-            log_callback(f"Successfully restored from TAR.GZ archive {local_archive_path} to {destination_path}", level="INFO")
-
+        # Determine the archive path on the local filesystem (after download from remote destinations)
+        if source.remote:
+            try:
+                log_callback(f"Downloading archive from {source.label}: {source_path}", level="INFO")
+                with metrics.stage("download") as stage:
+                    local_archive_path, _ = source.fetch(source_path, temp_dir)
+                    stage.bytes_out = os.path.getsize(local_archive_path)
+                log_callback(f"Successfully downloaded {source_path} to {local_archive_path}", level="INFO")
+            except Exception as e:
+                return False, f"Could not download {source_path} from {source.label}: {e}"
         else:
-            return False, "Unsupported archive format. Only .zip and .tar.gz are supported."
-        
-        return True, "Restore completed successfully."
+            local_archive_path, _ = source.fetch(source_path, temp_dir)
 
-    except Exception as e:
-        return False, f"Failed to extract archive {os.path.basename(local_archive_path)}: {e}"
+        if not local_archive_path or not os.path.exists(local_archive_path):
+            return False, f"Archive file not found locally: {local_archive_path}"
+
+        # Proceed with extraction based on file type
+        try:
+            with metrics.stage("extract", bytes_in=os.path.getsize(local_archive_path)):
+                if local_archive_path.endswith(ENCRYPTED_SUFFIX):
+                    archive_format = _extract_encrypted(local_archive_path, destination_path, overwrite_existing,
+                                                        log_callback, passphrase)
+                    log_callback(f"Successfully restored from encrypted {archive_format} archive {local_archive_path} to {destination_path}", level="INFO")
+
+                elif zipfile.is_zipfile(local_archive_path):
+                    _extract_zip(local_archive_path, destination_path, overwrite_existing, log_callback)
+                    log_callback(f"Successfully restored from ZIP archive {local_archive_path} to {destination_path}", level="INFO")
+
+                elif tarfile.is_tarfile(local_archive_path):
+                    with tarfile.open(local_archive_path, 'r:gz') as tar_ref: # Assuming it's a .tar.gz
+                        _extract_tar_members(tar_ref, destination_path, overwrite_existing, log_callback)
+                    log_callback(f"Successfully restored from TAR.GZ archive {local_archive_path} to {destination_path}", level="INFO")
+
+                else:
+                    return False, "Unsupported archive format. Only .zip and .tar.gz are supported."
+
+            return True, "Restore completed successfully."
+
+        except Exception as e:
+            return False, f"Failed to extract archive {os.path.basename(local_archive_path)}: {e}"
     finally:
-        # Clean up temporary downloaded file if it came from SFTP
-        if source_type == "hetzner_sftp" and os.path.exists(local_archive_path):
-            try:
-                os.remove(local_archive_path)
-                log_callback(f"Cleaned up temporary downloaded archive: {local_archive_path}", level="DEBUG")
-            except Exception as e:
-                log_callback(f"Warning: Could not remove temporary archive {local_archive_path}: {e}", level="WARNING")
+        # Clean up temporary downloaded file from remote destinations
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
 
+def _listing_cache_key(source, source_backup_path):
+    """Schlüssel für den Listing-Cache aus Ort, Pfad, Größe und mtime (nur ein stat, keine Übertragung)."""
+    path = source_backup_path if source.remote else os.path.abspath(source_backup_path)
+    size, mtime = source.stat(path)
+    return cache_key(source.location, path, size, mtime)
 
 
 def get_archive_contents(source_backup_path, is_encrypted, passphrase,
                          is_sftp_source, sftp_host, sftp_username, sftp_password,
-                         progress_callback):
+                         progress_callback, bandwidth=None, cache=None, source=None):
     """
     Ruft den Inhalt eines Backup-Archivs ab, ohne es vollständig wiederherzustellen.
+    bandwidth (bandwidth.BandwidthLimiter) begrenzt den SFTP-Download.
+    cache (listing_cache.ListingCache) liefert bereits gelesene Archive ohne Download/Entschlüsselung.
+    source (Destination) ersetzt is_sftp_source und die SFTP-Zugangsdaten (z.B. für S3).
     """
-    temp_download_path = None
+    if source is None:
+        source = (SFTPDestination(sftp_host, sftp_username, sftp_password, None, bandwidth) if is_sftp_source
+                  else LocalDestination())
+        try:
+            return get_archive_contents(source_backup_path, is_encrypted, passphrase, is_sftp_source, sftp_host,
+                                        sftp_username, sftp_password, progress_callback, bandwidth, cache, source)
+        finally:
+            source.close()
+
+    temp_download_dir = None
+    temp_volume_dir = None
     archive_file_to_process = source_backup_path
+    actual_archive_path_for_read = None
     contents = []
+    listing_key = None
+
+    if is_reference(source_backup_path):
+        # Referenz auf ein unverändertes Backup: dessen Inhalt (und Cache-Eintrag)
+        try:
+            reference = source.read_json(source_backup_path)
+        except Exception as e:
+            progress_callback(f"Error reading reference for content view: {e}", level="ERROR")
+            return None
+        target = reference["target"]
+        return get_archive_contents(source.sibling(source_backup_path, target),
+                                    target.endswith(ENCRYPTED_SUFFIX), # Manifeste tragen ihr eigenes Flag
+                                    passphrase, is_sftp_source, sftp_host, sftp_username, sftp_password,
+                                    progress_callback, bandwidth, cache, source)
+
+    if is_snapshot_manifest(source_backup_path):
+        # Snapshot: Inhalte aller Shards aneinandergehängt (jeder Shard hat seinen eigenen Cache-Eintrag)
+        try:
+            manifest = source.read_json(source_backup_path)
+        except Exception as e:
+            progress_callback(f"Error reading snapshot manifest for content view: {e}", level="ERROR")
+            return None
+        for shard in manifest.get("shards", []):
+            shard_contents = get_archive_contents(
+                source.sibling(source_backup_path, shard["name"]), manifest.get("encrypted", False),
+                passphrase, is_sftp_source, sftp_host, sftp_username, sftp_password, progress_callback, bandwidth,
+                cache, source)
+            if shard_contents is None:
+                return None
+            contents += shard_contents
+        return contents
 
     try:
-        if is_sftp_source:
-            progress_callback(f"Downloading archive from SFTP to view contents: {sftp_host}/{source_backup_path}", 10)
-            temp_download_path = os.path.join(tempfile.gettempdir(), os.path.basename(source_backup_path))
-            sftp_client = None
-            transport = None
+        if cache is not None:
+            try:
+                listing_key = _listing_cache_key(source, source_backup_path)
+            except Exception as e: # Fehler meldet gleich der normale Weg
+                progress_callback(f"Listing cache lookup skipped: {e}", level="DEBUG")
+            cached = cache.get(listing_key) if listing_key else None
+            if cached is not None:
+                progress_callback(f"Archive contents loaded from listing cache ({len(cached)} files).", 100)
+                return cached
+
+        if is_volume_manifest(source_backup_path):
+            # Multi-Volume-Backup: Volumes laden, prüfen, entschlüsseln und zusammensetzen
+            progress_callback(f"Reassembling volumes for content view: {source_backup_path}", 10)
+            volumes = DestinationVolumeSource(source, source_backup_path, progress_callback)
+            temp_volume_dir = tempfile.mkdtemp(prefix="backup_tool_view_")
+            manifest = volumes.read_manifest()
+            archive_name = manifest["archive"][:-len(".enc")] if manifest["archive"].endswith(".enc") else manifest["archive"]
+            archive_file_to_process = os.path.join(temp_volume_dir, archive_name)
+            reassemble_volumes(volumes, passphrase, archive_file_to_process, temp_volume_dir)
+            is_encrypted = False
+            progress_callback("Volumes reassembled for content view.", 60)
+        elif source.remote:
+            progress_callback(f"Downloading archive from {source.label} to view contents: {source_backup_path}", 10)
+            temp_download_dir = tempfile.mkdtemp(prefix="backup_tool_view_")
             try:
-                sftp_client, transport = get_sftp_client(sftp_host, sftp_username, sftp_password)
-                sftp_client.get(source_backup_path, temp_download_path)
-                archive_file_to_process = temp_download_path
-                progress_callback("SFTP download complete for content view.", 30)
+                archive_file_to_process, _ = source.fetch(source_backup_path, temp_download_dir)
+                progress_callback("Download complete for content view.", 30)
             except Exception as e:
-                progress_callback(f"Error downloading from SFTP for content view: {e}", level="ERROR")
+                progress_callback(f"Error downloading from {source.label} for content view: {e}", level="ERROR")
                 return None
-            finally:
-                if sftp_client:
-                    sftp_client.close()
-                if transport:
-                    transport.close()
         else:
             if not os.path.exists(source_backup_path):
                 progress_callback(f"Error: Local backup file not found for content view: {source_backup_path}", level="ERROR")
@@ -399,16 +2174,9 @@ def get_archive_contents(source_backup_path, is_encrypted, passphrase,
                 return None
             
             try:
-                with open(archive_file_to_process, "rb") as f_in:
-                    encrypted_data = f_in.read()
-                
-                decrypted_data = decrypt_data(encrypted_data, passphrase)
-                
                 temp_decrypted_path = os.path.join(tempfile.gettempdir(), "decrypted_view_" + os.path.basename(source_backup_path).replace(".enc", ""))
-                with open(temp_decrypted_path, "wb") as f_out:
-                    f_out.write(decrypted_data)
-                
-                actual_archive_path_for_read = temp_decrypted_path
+                actual_archive_path_for_read = temp_decrypted_path # wird auch bei Fehlern aufgeräumt
+                decrypt_file(archive_file_to_process, temp_decrypted_path, passphrase) # blockweise statt im RAM
                 progress_callback("Decryption complete for content view.", 60)
             except ValueError as ve:
                 progress_callback(f"Decryption error for content view: {ve}", level="ERROR")
@@ -422,7 +2190,7 @@ def get_archive_contents(source_backup_path, is_encrypted, passphrase,
         if actual_archive_path_for_read.endswith(".tar.gz"):
             try:
                 with tarfile.open(actual_archive_path_for_read, "r:gz") as tar:
-                    contents = [member.name for member in tar.getmembers() if member.isreg()] # Nur reguläre Dateien
+                    contents = [member.name for member in tar.getmembers() if member.isreg() or member.islnk()] # Nur Dateien (inkl. Duplikate)
                 progress_callback("Tar.gz contents listed.", 90)
             except tarfile.ReadError as e:
                 progress_callback(f"Error reading tar.gz file: {e}. File might be corrupted or not a valid tar.gz.", level="ERROR")
@@ -430,7 +2198,9 @@ def get_archive_contents(source_backup_path, is_encrypted, passphrase,
         elif actual_archive_path_for_read.endswith(".zip"):
             try:
                 with zipfile.ZipFile(actual_archive_path_for_read, 'r') as zipf:
-                    contents = [info.filename for info in zipf.infolist() if not info.is_dir()] # Nur Dateien, keine Verzeichnisse
+                    contents = [info.filename for info in zipf.infolist() if not info.is_dir() and not info.filename.startswith(METADATA_DIR)] # Nur Dateien, keine Verzeichnisse
+                    if LINKS_MEMBER in zipf.namelist(): # deduplizierte Dateien
+                        contents += [link["name"] for link in json.loads(zipf.read(LINKS_MEMBER).decode("utf-8")).get("links", [])]
                 progress_callback("Zip contents listed.", 90)
             except zipfile.BadZipFile as e:
                 progress_callback(f"Error reading zip file: {e}. File might be corrupted or not a valid zip.", level="ERROR")
@@ -439,6 +2209,11 @@ def get_archive_contents(source_backup_path, is_encrypted, passphrase,
             progress_callback(f"Error: Unknown archive format for content view: {os.path.basename(actual_archive_path_for_read)}", level="ERROR")
             return None
 
+        if listing_key:
+            try:
+                cache.put(listing_key, contents)
+            except OSError as e:
+                progress_callback(f"Could not store listing in cache: {e}", level="WARNING")
         progress_callback("Archive contents retrieved successfully.", 100)
         return contents
 
@@ -447,18 +2222,38 @@ def get_archive_contents(source_backup_path, is_encrypted, passphrase,
         return None
     finally:
         # Temporäre Dateien bereinigen
-        if temp_download_path and os.path.exists(temp_download_path):
-            os.remove(temp_download_path)
-            progress_callback(f"Temporary download file deleted for content view: {temp_download_path}", 100)
+        if temp_download_dir:
+            shutil.rmtree(temp_download_dir, ignore_errors=True)
+            progress_callback(f"Temporary download deleted for content view: {archive_file_to_process}", 100)
         
         if actual_archive_path_for_read and actual_archive_path_for_read != source_backup_path and os.path.exists(actual_archive_path_for_read):
             os.remove(actual_archive_path_for_read)
             progress_callback(f"Temporary decrypted file deleted for content view: {actual_archive_path_for_read}", 100)
+        if temp_volume_dir:
+            shutil.rmtree(temp_volume_dir, ignore_errors=True)
 
 # ====================================================================================================
 # RETENTION POLICY LOGIC (NEU)
 # ====================================================================================================
 
+def parse_backup_filename(entry):
+    """
+    Zeitstempel eines Backup-Archivs (Beispiel: backup_20250622_180000.tar.gz.enc) oder None für
+    andere Dateien, einzelne Volumes und unfertige Uploads.
+    """
+    if not entry.startswith("backup_") or not ('.tar.gz' in entry or '.zip' in entry) or is_volume_or_partial(entry):
+        return None
+    try:
+        # Extrahiere Datum und Uhrzeit
+        parts = entry.split('_')
+        date_str = parts[1] # YYYYMMDD
+        time_str = parts[2].split('.')[0] # HHMMSS
+        return datetime.strptime(f"{date_str}_{time_str}", "%Y%m%d_%H%M%S")
+    except (IndexError, ValueError):
+        # Dateien, die nicht unserem Format entsprechen
+        return None
+
+
 def get_backup_files_in_directory(path, is_sftp, sftp_client=None):
     """
     Listet Backup-Dateien in einem Verzeichnis auf (lokal oder SFTP),
@@ -471,37 +2266,17 @@ def get_backup_files_in_directory(path, is_sftp, sftp_client=None):
         try:
             # listdir gibt nur Dateinamen zurück, keine Pfade
             for entry in sftp_client.listdir(path):
-                # Beispiel: backup_20250622_180000.tar.gz.enc
-                if entry.startswith("backup_") and ('.tar.gz' in entry or '.zip' in entry):
-                    try:
-                        # Extrahiere Datum und Uhrzeit
-                        parts = entry.split('_')
-                        date_str = parts[1] # YYYYMMDD
-                        time_str = parts[2].split('.')[0] # HHMMSS
-                        
-                        dt_obj = datetime.strptime(f"{date_str}_{time_str}", "%Y%m%d_%H%M%S")
-                        backup_files.append((dt_obj, entry))
-                    except (IndexError, ValueError):
-                        # Ignoriere Dateien, die nicht unserem Format entsprechen
-                        continue
+                dt_obj = parse_backup_filename(entry)
+                if dt_obj is not None:
+                    backup_files.append((dt_obj, entry))
         except Exception as e:
             raise Exception(f"Failed to list SFTP directory {path}: {e}")
     else:
         try:
             for entry in os.listdir(path):
-                # Beispiel: backup_20250622_180000.tar.gz.enc
-                if entry.startswith("backup_") and ('.tar.gz' in entry or '.zip' in entry):
-                    try:
-                        # Extrahiere Datum und Uhrzeit
-                        parts = entry.split('_')
-                        date_str = parts[1] # YYYYMMDD
-                        time_str = parts[2].split('.')[0] # HHMMSS
-                        
-                        dt_obj = datetime.strptime(f"{date_str}_{time_str}", "%Y%m%d_%H%M%S")
-                        backup_files.append((dt_obj, entry))
-                    except (IndexError, ValueError):
-                        # Ignoriere Dateien, die nicht unserem Format entsprechen
-                        continue
+                dt_obj = parse_backup_filename(entry)
+                if dt_obj is not None:
+                    backup_files.append((dt_obj, entry))
         except Exception as e:
             raise Exception(f"Failed to list local directory {path}: {e}")
             
@@ -510,37 +2285,78 @@ def get_backup_files_in_directory(path, is_sftp, sftp_client=None):
     return backup_files
 
 
-def delete_backup_file(path, filename, is_sftp, sftp_client=None):
+def list_backups(destination):
+    """Wie get_backup_files_in_directory, aber für ein Ziel (Destination): (datetime_obj, filename), älteste zuerst."""
+    backup_files = []
+    for entry in destination.list_names():
+        dt_obj = parse_backup_filename(entry)
+        if dt_obj is not None:
+            backup_files.append((dt_obj, entry))
+    backup_files.sort(key=lambda x: x[0])
+    return backup_files
+
+
+def delete_backup(destination, filename):
     """
-    Löscht eine einzelne Backup-Datei.
+    Löscht ein Backup auf einem Ziel (bei einem Volume- oder Snapshot-Manifest samt aller Volumes bzw. Shards).
+    Gibt (erfolg, meldung) zurück.
     """
-    # Für SFTP ist 'path' der Remote-Pfad (oft nur '.') und 'filename' ist der Dateiname
-    # Für lokale Dateien ist 'path' das Verzeichnis und 'filename' der Dateiname
-    
-    if is_sftp:
-        full_path_remote = os.path.join(path, filename).replace("\\", "/") # SFTP nutzt Forward Slashes
+    if is_volume_manifest(filename) or is_snapshot_manifest(filename):
+        # Multi-Volume-Backup/Snapshot: erst die Volumes bzw. Shards, zuletzt das Manifest (sonst blieben verwaiste Dateien)
         try:
-            sftp_client.remove(full_path_remote)
-            return True, f"Successfully deleted SFTP file: {full_path_remote}"
-        except paramiko.SFTPError as e:
-            return False, f"SFTP error deleting {full_path_remote}: {e}"
+            manifest = destination.read_json(filename)
+            for volume in manifest.get("volumes", []) + manifest.get("shards", []):
+                try:
+                    destination.remove(destination.sibling(filename, volume["name"]))
+                except (IOError, OSError):
+                    pass # bereits gelöscht
         except Exception as e:
-            return False, f"Error deleting SFTP file {full_path_remote}: {e}"
-    else:
-        full_path_local = os.path.join(path, filename)
-        try:
-            os.remove(full_path_local)
-            return True, f"Successfully deleted local file: {full_path_local}"
-        except OSError as e:
-            return False, f"OS error deleting {full_path_local}: {e}"
-        except Exception as e:
-            return False, f"Error deleting local file {full_path_local}: {e}"
-
+            return False, f"Error deleting volumes of {filename}: {e}"
 
-def apply_retention_policy(policy_settings, nas_path, hetzner_host, hetzner_password, progress_callback):
+    try:
+        destination.remove(filename)
+        return True, f"Successfully deleted {filename} on {destination.label}"
+    except Exception as e:
+        return False, f"Error deleting {filename} on {destination.label}: {e}"
+
+
+def _retention_candidates(backup_files, retention_type, retention_value, retention_unit):
+    """Backups (älteste zuerst), die nach der Richtlinie gelöscht werden."""
+    files_to_delete = []
+    if retention_type == "count":
+        # Behalte die N neuesten Backups
+        if len(backup_files) > retention_value:
+            files_to_delete = backup_files[:-retention_value] # Lösche die ältesten
+    elif retention_type == "age":
+        cutoff_date = datetime.now()
+        if retention_unit == "days":
+            cutoff_date -= timedelta(days=retention_value)
+        elif retention_unit == "weeks":
+            cutoff_date -= timedelta(weeks=retention_value)
+        elif retention_unit == "months":
+            # Für Monate und Jahre ist relativedelta von dateutil genauer.
+            # Wenn Sie python-dateutil installiert haben, verwenden Sie es:
+            # from dateutil.relativedelta import relativedelta
+            # cutoff_date -= relativedelta(months=retention_value)
+
+            # Ohne relativedelta: Einfache Annäherung (30.4 Tage/Monat, 365 Tage/Jahr)
+            cutoff_date -= timedelta(days=retention_value * 30.4)
+        elif retention_unit == "years":
+            # cutoff_date -= relativedelta(years=retention_value)
+            cutoff_date -= timedelta(days=retention_value * 365) # Vereinfachung
+
+        for dt_obj, filename in backup_files:
+            if dt_obj < cutoff_date:
+                files_to_delete.append((dt_obj, filename))
+    return files_to_delete
+
+
+def apply_retention_policy(policy_settings, nas_path, hetzner_host, hetzner_password, progress_callback,
+                           sftp_pool=None, extra_destinations=None):
     """
     Wendet die Aufbewahrungsrichtlinie auf die Backup-Ziele an.
-    policy_settings: Dictionary mit 'enabled', 'type', 'value', 'unit', 'nas', 'hetzner'
+    policy_settings: Dictionary mit 'enabled', 'type', 'value', 'unit' und je Ziel einem Schalter
+    ('nas', 'hetzner', bzw. der name weiterer Ziele aus extra_destinations, z.B. 's3').
     """
     if not policy_settings.get('enabled'):
         progress_callback("Retention policy is disabled. Skipping.", 100, level="INFO")
@@ -553,113 +2369,37 @@ def apply_retention_policy(policy_settings, nas_path, hetzner_host, hetzner_pass
     retention_unit = policy_settings.get('unit', 'days') # Nur relevant für Typ 'age'
 
     overall_success = True
-
-    # --- Apply to NAS ---
-    if policy_settings.get('nas') and nas_path:
-        progress_callback(f"Applying retention to NAS: {nas_path}", 10)
+    # SFTP-Backups liegen im Root-Verzeichnis des SFTP-Accounts
+    destinations = [destination for destination in backup_destinations(nas_path, hetzner_host, hetzner_password,
+                                                                        sftp_pool, None, extra_destinations)
+                    if policy_settings.get(destination.name)]
+
+    for index, destination in enumerate(destinations):
+        start = 10 + 80 * index // len(destinations)
+        span = 80 // len(destinations)
+        progress_callback(f"Applying retention to {destination.label}...", start)
         try:
-            backup_files = get_backup_files_in_directory(nas_path, is_sftp=False)
-            files_to_delete = []
-
-            if retention_type == "count":
-                # Behalte die N neuesten Backups
-                if len(backup_files) > retention_value:
-                    files_to_delete = backup_files[:-retention_value] # Lösche die ältesten
-            elif retention_type == "age":
-                cutoff_date = datetime.now()
-                if retention_unit == "days":
-                    cutoff_date -= timedelta(days=retention_value)
-                elif retention_unit == "weeks":
-                    cutoff_date -= timedelta(weeks=retention_value)
-                elif retention_unit == "months":
-                    # Für Monate und Jahre ist relativedelta von dateutil genauer.
-                    # Wenn Sie python-dateutil installiert haben, verwenden Sie es:
-                    # from dateutil.relativedelta import relativedelta
-                    # cutoff_date -= relativedelta(months=retention_value)
-                    
-                    # Ohne relativedelta: Einfache Annäherung (30.4 Tage/Monat, 365 Tage/Jahr)
-                    cutoff_date -= timedelta(days=retention_value * 30.4) 
-                elif retention_unit == "years":
-                    # cutoff_date -= relativedelta(years=retention_value)
-                    cutoff_date -= timedelta(days=retention_value * 365) # Vereinfachung
-                
-                for dt_obj, filename in backup_files:
-                    if dt_obj < cutoff_date:
-                        files_to_delete.append((dt_obj, filename))
-
-            if files_to_delete:
-                progress_callback(f"Found {len(files_to_delete)} old NAS backups to delete...", 20)
-                for i, (dt_obj, filename) in enumerate(files_to_delete):
-                    success, msg = delete_backup_file(nas_path, filename, is_sftp=False)
-                    progress_callback(msg, 20 + (i / len(files_to_delete)) * 30)
-                    if not success:
-                        overall_success = False
-                        progress_callback(f"Failed to delete NAS file: {filename} - {msg}", level="ERROR")
-            else:
-                progress_callback("No old NAS backups to delete.", 40)
-
-        except Exception as e:
-            overall_success = False
-            progress_callback(f"Error applying retention to NAS: {e}", 0, level="ERROR")
-
-    # --- Apply to Hetzner Storage Box ---
-    if policy_settings.get('hetzner') and hetzner_host and hetzner_password:
-        progress_callback(f"Applying retention to Hetzner Storage Box ({hetzner_host})...", 50)
-        sftp_client = None
-        transport = None
-        try:
-            # Extrahiere Benutzername und Host/Port aus hetzner_host
-            username = hetzner_host.split('@')[0] if '@' in hetzner_host else "your_sftp_user" # Default
-            
-            sftp_client, transport = get_sftp_client(hetzner_host, username, hetzner_password)
-            
-            # Annahme: SFTP-Backups liegen im Root-Verzeichnis des SFTP-Accounts
-            sftp_backup_path = "." # Aktuelles Verzeichnis
-
-            backup_files = get_backup_files_in_directory(sftp_backup_path, is_sftp=True, sftp_client=sftp_client)
-            files_to_delete = []
-
-            if retention_type == "count":
-                if len(backup_files) > retention_value:
-                    files_to_delete = backup_files[:-retention_value] # Lösche die ältesten
-            elif retention_type == "age":
-                cutoff_date = datetime.now()
-                if retention_unit == "days":
-                    cutoff_date -= timedelta(days=retention_value)
-                elif retention_unit == "weeks":
-                    cutoff_date -= timedelta(weeks=retention_value)
-                elif retention_unit == "months":
-                    # Wenn relativedelta verfügbar, hier verwenden
-                    # cutoff_date -= relativedelta(months=retention_value)
-                    cutoff_date -= timedelta(days=retention_value * 30.4) 
-                elif retention_unit == "years":
-                    # cutoff_date -= relativedelta(years=retention_value)
-                    cutoff_date -= timedelta(days=retention_value * 365)
-                
-                for dt_obj, filename in backup_files:
-                    if dt_obj < cutoff_date:
-                        files_to_delete.append((dt_obj, filename))
+            # Nur eine Auflistung pro Ziel (bei S3 serverseitig über list_objects_v2)
+            backup_files = list_backups(destination)
+            files_to_delete = _retention_candidates(backup_files, retention_type, retention_value, retention_unit)
+            files_to_delete = _protect_referenced(destination, backup_files, files_to_delete, progress_callback)
 
             if files_to_delete:
-                progress_callback(f"Found {len(files_to_delete)} old Hetzner backups to delete...", 60)
-                for i, (dt_obj, filename) in enumerate(files_to_delete):
-                    # Für SFTP delete_backup_file, path ist der 'remote_path' ('.'), filename ist der Dateiname
-                    success, msg = delete_backup_file(sftp_backup_path, filename, is_sftp=True, sftp_client=sftp_client)
-                    progress_callback(msg, 60 + (i / len(files_to_delete)) * 30)
+                progress_callback(f"Found {len(files_to_delete)} old backups to delete on {destination.label}...", start)
+                for i, (_, filename) in enumerate(files_to_delete):
+                    success, msg = delete_backup(destination, filename)
+                    progress_callback(msg, start + (i / len(files_to_delete)) * span)
                     if not success:
                         overall_success = False
-                        progress_callback(f"Failed to delete Hetzner file: {filename} - {msg}", level="ERROR")
+                        progress_callback(f"Failed to delete {filename} on {destination.label} - {msg}", level="ERROR")
             else:
-                progress_callback("No old Hetzner backups to delete.", 90)
+                progress_callback(f"No old backups to delete on {destination.label}.", start + span)
 
         except Exception as e:
             overall_success = False
-            progress_callback(f"Error applying retention to Hetzner: {e}", 0, level="ERROR")
+            progress_callback(f"Error applying retention to {destination.label}: {e}", 0, level="ERROR")
         finally:
-            if sftp_client:
-                sftp_client.close()
-            if transport:
-                transport.close()
+            destination.close()
 
     progress_callback("Retention policy application finished.", 100, level="INFO")
     return overall_success
@@ -0,0 +1,268 @@
+import threading
+import time
+from datetime import datetime
+
+
+# ====================================================================================================
+# BANDWIDTH CONTROL
+# ====================================================================================================
+#
+# Uploads und Downloads per SFTP laufen durch einen BandwidthLimiter (Token-Bucket). Das Limit kommt
+# aus Tageszeit-Profilen in config.json:
+#
+#   "bandwidth_profiles": [
+#       {"days": "mon-fri", "start": "07:00", "end": "19:00", "limit_mbps": 20, "adaptive": true},
+#       {"days": "sat", "start": "09:00", "end": "13:00", "limit_mbps": 50}
+#   ],
+#   "bandwidth_default_mbps": 0      # außerhalb aller Profile; 0/fehlend = volle Geschwindigkeit
+#
+# limit_mbps ist in Megabit/s (wie Uplinks angegeben werden). Profile mit "adaptive": true messen
+# regelmäßig die Round-Trip-Zeit der SFTP-Verbindung (ein stat() reiht sich hinter die laufenden
+# Schreibanfragen ein und misst damit auch die Warteschlange im Uplink). Steigt die RTT deutlich
+# über den Ruhewert, wird die Rate multiplikativ gesenkt, sonst schrittweise bis zum Profil-Limit
+# angehoben (AIMD). Außerhalb der Profile läuft der Transfer wieder mit voller Geschwindigkeit.
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SCHEDULE_CHECK_SECONDS = 5.0
+PROBE_INTERVAL_SECONDS = 2.0
+MIN_RATE = 64 * 1024 # Bytes/s, darunter wird im adaptiven Modus nicht gedrosselt
+BURST_SECONDS = 0.25 # Bucket-Größe als Anteil einer Sekunde bei aktueller Rate
+_UNSET = object()
+
+
+def mbps_to_bytes(mbps):
+    return int(float(mbps) * 1000 * 1000 / 8) if mbps else None
+
+
+def _parse_days(days):
+    if not days:
+        return set(range(7))
+    if isinstance(days, str):
+        days = [part.strip() for part in days.lower().split(",")]
+    result = set()
+    for part in days:
+        part = part.strip().lower()
+        if "-" in part:
+            start, end = (WEEKDAYS.index(p[:3]) for p in part.split("-", 1))
+            day = start
+            while True:
+                result.add(day)
+                if day == end:
+                    break
+                day = (day + 1) % 7
+        else:
+            result.add(WEEKDAYS.index(part[:3]))
+    return result
+
+
+def _parse_minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class BandwidthProfile:
+    def __init__(self, days=None, start="00:00", end="24:00", limit_mbps=None, adaptive=False):
+        self.days = _parse_days(days)
+        self.start = _parse_minutes(start)
+        self.end = _parse_minutes(end)
+        self.limit = mbps_to_bytes(limit_mbps)
+        self.adaptive = bool(adaptive)
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry.get('days'), entry.get('start', "00:00"), entry.get('end', "24:00"),
+                   entry.get('limit_mbps'), entry.get('adaptive', False))
+
+    def matches(self, moment):
+        minute = moment.hour * 60 + moment.minute
+        if self.start <= self.end:
+            return moment.weekday() in self.days and self.start <= minute < self.end
+        # Über Mitternacht (z.B. 22:00-06:00): der Morgen gehört zum Profil des Vortags
+        if minute >= self.start:
+            return moment.weekday() in self.days
+        return minute < self.end and (moment.weekday() - 1) % 7 in self.days
+
+
+class TokenBucket:
+    """Thread-sicherer Token-Bucket; rate=None bedeutet unbegrenzt."""
+
+    def __init__(self, rate=None, clock=time.monotonic, sleep=time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.rate = rate
+        self._tokens = 0.0
+        self._last = clock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self._tokens = min(self._tokens, self._burst())
+
+    def _burst(self):
+        return max(self.rate * BURST_SECONDS, 32 * 1024) if self.rate else 0.0
+
+    def consume(self, nbytes):
+        """Bucht nbytes ab und schläft, bis die entstandene Schuld abgebaut ist."""
+        with self._lock:
+            now = self._clock()
+            if not self.rate:
+                self._last = now
+                return
+            self._tokens = min(self._burst(), self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+
+
+class SharedTokenBucket:
+    """
+    Token-Bucket mit fester Rate für mehrere Prozesse (z.B. die Shard-Worker in backup_logic):
+    Guthaben und Zeitpunkt liegen in einem multiprocessing.Array, time.monotonic gilt systemweit.
+    Wird den Prozessen beim Start übergeben (initargs), nicht gepickelt.
+    """
+
+    def __init__(self, rate, context=None):
+        import multiprocessing
+
+        self.rate = rate
+        self._state = (context or multiprocessing).Array("d", [0.0, time.monotonic()]) # Guthaben, letzte Buchung
+
+    def consume(self, nbytes):
+        """Bucht nbytes ab und schläft, bis die entstandene Schuld abgebaut ist."""
+        burst = max(self.rate * BURST_SECONDS, 32 * 1024)
+        with self._state.get_lock():
+            now = time.monotonic()
+            tokens = min(burst, self._state[0] + (now - self._state[1]) * self.rate) - nbytes
+            self._state[0] = tokens
+            self._state[1] = now
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+class AdaptiveRate:
+    """AIMD-Regler: senkt die Rate bei steigender RTT, hebt sie sonst bis zur Obergrenze an."""
+
+    def __init__(self, ceiling=None, floor=MIN_RATE, tolerance=1.5, slack=0.03):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.tolerance = tolerance
+        self.slack = slack # Sekunden, die auch bei sehr kleiner Basis-RTT toleriert werden
+        self.base_rtt = None
+        self.rate = ceiling
+
+    def update(self, rtt, throughput):
+        """rtt in Sekunden, throughput in Bytes/s seit der letzten Messung; gibt die neue Rate zurück."""
+        if self.base_rtt is None or rtt < self.base_rtt:
+            self.base_rtt = rtt
+        else:
+            self.base_rtt *= 1.01 # langsam nachgeben, falls sich die Route geändert hat
+
+        congested = rtt > self.base_rtt * self.tolerance + self.slack
+        if congested:
+            current = self.rate or throughput or self.floor
+            self.rate = max(self.floor, int(min(current, throughput or current) * 0.7))
+        elif self.rate is not None:
+            step = max(self.floor, (self.ceiling or self.rate) // 20)
+            self.rate = self.rate + step
+            if self.ceiling is not None:
+                self.rate = min(self.rate, self.ceiling)
+            elif throughput and self.rate > throughput * 2:
+                self.rate = None # Rate liegt weit über dem Erreichten: die Leitung ist die Grenze
+        return self.rate
+
+
+class BandwidthLimiter:
+    """
+    Begrenzt Transfers nach Tageszeit-Profil. throttle(nbytes) nach jedem übertragenen Block aufrufen;
+    mit probe (Funktion ohne Argumente, z.B. lambda: sftp.stat(".")) regelt ein adaptives Profil
+    anhand der gemessenen RTT.
+    """
+
+    def __init__(self, profiles=(), default_limit=None, clock=time.monotonic, now=datetime.now):
+        self.profiles = list(profiles)
+        self.default_limit = default_limit
+        self._clock = clock
+        self._now = now
+        self.bucket = TokenBucket(clock=clock)
+        self._lock = threading.Lock()
+        self._profile = _UNSET # erster throttle()-Aufruf wählt das Profil
+        self._adaptive = None
+        self._next_schedule_check = 0.0
+        self._next_probe = 0.0
+        self._bytes_since_probe = 0
+        self._probe_started = clock()
+        self.log = None
+
+    @property
+    def enabled(self):
+        return bool(self.profiles or self.default_limit)
+
+    def current_limit(self):
+        return self.bucket.rate
+
+    def _select_profile(self):
+        moment = self._now()
+        for profile in self.profiles:
+            if profile.matches(moment):
+                return profile
+        return None
+
+    def _check_schedule(self, now):
+        if self._profile is not _UNSET and now < self._next_schedule_check:
+            return
+        self._next_schedule_check = now + SCHEDULE_CHECK_SECONDS
+        profile = self._select_profile()
+        if profile is not self._profile:
+            self._profile = profile
+            self._adaptive = AdaptiveRate(ceiling=profile.limit) if profile and profile.adaptive else None
+            limit = profile.limit if profile else self.default_limit
+            self.bucket.set_rate(limit)
+            if self.log:
+                text = f"{limit * 8 / 1e6:.1f} Mbit/s" if limit else "unlimited"
+                self.log(f"Bandwidth limit: {text}{' (adaptive)' if self._adaptive else ''}", level="INFO")
+
+    def throttle(self, nbytes, probe=None):
+        if not self.enabled:
+            return
+        run_probe = False
+        with self._lock:
+            now = self._clock()
+            self._check_schedule(now)
+            self._bytes_since_probe += nbytes
+            if self._adaptive is not None and probe is not None and now >= self._next_probe:
+                self._next_probe = now + PROBE_INTERVAL_SECONDS
+                run_probe = True
+        if run_probe:
+            self._probe(probe)
+        self.bucket.consume(nbytes)
+
+    def _probe(self, probe):
+        start = self._clock()
+        try:
+            probe()
+        except Exception:
+            return # Messung ist optional; der Transfer selbst meldet echte Fehler
+        now = self._clock()
+        with self._lock:
+            if self._adaptive is None:
+                return
+            elapsed = max(now - self._probe_started, 1e-6)
+            throughput = self._bytes_since_probe / elapsed
+            self._bytes_since_probe = 0
+            self._probe_started = now
+            previous = self.bucket.rate
+            rate = self._adaptive.update(now - start, throughput)
+        if rate != previous:
+            self.bucket.set_rate(rate)
+
+
+def limiter_from_config(config):
+    """BandwidthLimiter aus 'bandwidth_profiles'/'bandwidth_default_mbps' oder None, wenn nichts konfiguriert ist."""
+    profiles = [BandwidthProfile.from_dict(entry) for entry in config.get('bandwidth_profiles', [])]
+    default_limit = mbps_to_bytes(config.get('bandwidth_default_mbps'))
+    if not profiles and not default_limit:
+        return None
+    return BandwidthLimiter(profiles, default_limit)
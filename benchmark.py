@@ -0,0 +1,521 @@
+"""
+Benchmark suite for BackupTool.
+
+Generates a reproducible synthetic source tree, serves a "remote" directory with
+the in-process SFTP server from sftp_fixture.py and measures the real entry points
+end to end: perform_backup, perform_restore, get_archive_contents and
+apply_retention_policy. Results are stored as JSON so a branch can be compared
+with a baseline:
+
+    python benchmark.py run --label main --scale 0.2
+    git checkout my-branch
+    python benchmark.py run --label my-branch --scale 0.2
+    python benchmark.py compare benchmark_results/main.json benchmark_results/my-branch.json
+
+Dataset profiles (combined into one tree, sizes multiplied by --scale):
+    small       many small, compressible text files in nested directories
+    large       a few large, partly compressible files
+    media       incompressible random data (like photos/videos)
+    sparse      files that are mostly holes
+    mixed       small files of several types (json, csv, py, log, xml) interleaved in each directory
+
+The backup_*_order_* scenarios archive the same tree with each file ordering strategy
+(see file_order.py); compare their archive_bytes and wall times with backup_zip_nas/backup_tar_nas.
+The restore_* scenarios compare a checksum of the restored tree with the dataset after each
+run (not timed), so a benchmark run also proves the round trip.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_RESULTS_DIR = "benchmark_results"
+DATASET_MANIFEST = ".benchmark_dataset.json"
+PASSPHRASE = "benchmark-passphrase"
+
+# Anzahl/Größen bei --scale 1.0
+DATASET_PROFILES = {
+    "small": {"files": 20000, "min_size": 200, "max_size": 16 * 1024, "fanout": 40},
+    "large": {"files": 3, "size": 256 * 1024 * 1024},
+    "media": {"files": 40, "size": 8 * 1024 * 1024},
+    "sparse": {"files": 4, "size": 512 * 1024 * 1024, "data_extents": 8, "extent_size": 1024 * 1024},
+    "mixed": {"files": 10000, "min_lines": 10, "max_lines": 120, "fanout": 50},
+}
+
+WORDS = ("backup restore archive sftp storage box retention policy schedule nas local encrypted "
+         "compression level daily weekly monthly config password hash verify log error warning").split()
+
+
+# ====================================================================
+# DATASET GENERATOR
+# ====================================================================
+def _text_block(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return (" ".join(words)[:size]).encode("ascii")
+
+
+def _random_bytes(rng, size):
+    # Random.randbytes gibt es erst ab Python 3.9
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def _write_small_files(root, rng, spec, scale):
+    count = max(1, int(spec["files"] * scale))
+    for i in range(count):
+        directory = os.path.join(root, "small", f"d{i % spec['fanout']:03d}", f"s{(i // spec['fanout']) % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i:06d}.txt"), "wb") as f:
+            f.write(_text_block(rng, rng.randint(spec["min_size"], spec["max_size"])))
+    return count
+
+
+def _write_large_files(root, rng, spec, scale):
+    directory = os.path.join(root, "large")
+    os.makedirs(directory, exist_ok=True)
+    size = max(1024 * 1024, int(spec["size"] * scale))
+    block = 1024 * 1024
+    for i in range(spec["files"]):
+        with open(os.path.join(directory, f"large_{i}.dat"), "wb") as f:
+            written = 0
+            while written < size:
+                # Abwechselnd Text und Zufall: ergibt ein mittleres Kompressionsverhältnis
+                chunk = _text_block(rng, block // 2) + _random_bytes(rng, block // 2)
+                f.write(chunk[:size - written])
+                written += len(chunk)
+    return spec["files"]
+
+
+def _write_media_files(root, rng, spec, scale):
+    directory = os.path.join(root, "media")
+    os.makedirs(directory, exist_ok=True)
+    count = max(1, int(spec["files"] * scale))
+    for i in range(count):
+        with open(os.path.join(directory, f"IMG_{i:04d}.jpg"), "wb") as f:
+            remaining = spec["size"]
+            while remaining > 0:
+                chunk = min(remaining, 1024 * 1024)
+                f.write(_random_bytes(rng, chunk))
+                remaining -= chunk
+    return count
+
+
+def _write_sparse_files(root, rng, spec, scale):
+    directory = os.path.join(root, "sparse")
+    os.makedirs(directory, exist_ok=True)
+    size = max(16 * 1024 * 1024, int(spec["size"] * scale))
+    for i in range(spec["files"]):
+        with open(os.path.join(directory, f"disk_{i}.img"), "wb") as f:
+            f.truncate(size)
+            for extent in range(spec["data_extents"]):
+                f.seek(extent * (size // spec["data_extents"]))
+                f.write(_random_bytes(rng, min(spec["extent_size"], size // spec["data_extents"])))
+    return spec["files"]
+
+
+_MIXED_LINES = {
+    ".json": lambda rng, i: f'  {{"id": {i}, "name": "item-{rng.randint(0, 999)}", "enabled": '
+                            f'{rng.choice(["true", "false"])}, "weight": {rng.random():.4f}}},',
+    ".csv": lambda rng, i: f"{i},{rng.randint(0, 99999)},{rng.random():.6f},{rng.choice(WORDS)},{rng.randint(1, 12)}",
+    ".py": lambda rng, i: f"    result_{i} = compute_{rng.choice(WORDS)}(value, retries={rng.randint(1, 5)})",
+    ".log": lambda rng, i: f"2024-01-{rng.randint(1, 28):02d} 03:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} "
+                           f"[{rng.choice(['INFO', 'DEBUG', 'WARNING'])}] {rng.choice(WORDS)} {rng.choice(WORDS)} id={i}",
+    ".xml": lambda rng, i: f'  <entry key="{rng.choice(WORDS)}" index="{i}">{rng.randint(0, 99999)}</entry>',
+}
+
+
+def _write_mixed_files(root, rng, spec, scale):
+    count = max(1, int(spec["files"] * scale))
+    extensions = sorted(_MIXED_LINES)
+    for i in range(count):
+        directory = os.path.join(root, "mixed", f"d{i % spec['fanout']:03d}")
+        os.makedirs(directory, exist_ok=True)
+        # Typen wechseln von Datei zu Datei: in Namensreihenfolge liegen nie zwei gleiche nebeneinander
+        extension = extensions[i % len(extensions)]
+        lines = [_MIXED_LINES[extension](rng, n) for n in range(rng.randint(spec["min_lines"], spec["max_lines"]))]
+        with open(os.path.join(directory, f"f_{i:06d}{extension}"), "w", encoding="ascii") as f:
+            f.write("\n".join(lines) + "\n")
+    return count
+
+
+_GENERATORS = {
+    "small": _write_small_files,
+    "large": _write_large_files,
+    "media": _write_media_files,
+    "sparse": _write_sparse_files,
+    "mixed": _write_mixed_files,
+}
+
+
+def generate_dataset(root, profiles=("small", "large", "media", "sparse", "mixed"), scale=1.0, seed=0):
+    """
+    Erzeugt den Testbaum deterministisch (gleicher seed/scale = gleiche Bytes). Ein vorhandener
+    Baum mit identischem Manifest wird wiederverwendet.
+    """
+    params = {"profiles": sorted(profiles), "scale": scale, "seed": seed, "specs": DATASET_PROFILES}
+    manifest_path = os.path.join(root, DATASET_MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("params") == json.loads(json.dumps(params)):
+            return manifest
+        shutil.rmtree(root)
+
+    os.makedirs(root, exist_ok=True)
+    rng = random.Random(seed)
+    files = {}
+    for profile in sorted(profiles):
+        files[profile] = _GENERATORS[profile](root, rng, DATASET_PROFILES[profile], scale)
+
+    apparent = allocated = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            st = os.lstat(os.path.join(dirpath, name))
+            apparent += st.st_size
+            allocated += getattr(st, "st_blocks", st.st_size // 512) * 512
+    manifest = {"params": params, "files": files, "apparent_bytes": apparent, "allocated_bytes": allocated}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def tree_digest(root):
+    """SHA256 über relative Pfade und Inhalte aller Dateien unter root (in fester Reihenfolge)."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, names in os.walk(root):
+        dirnames.sort()
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).replace(os.sep, "/").encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_retention_fixture(directory, count, extension=".zip"):
+    """Legt 'count' leere Backup-Dateien mit absteigenden Zeitstempeln (je 1 Tag) an."""
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now()
+    for i in range(count):
+        stamp = (now - timedelta(days=i)).strftime("backup_%Y%m%d_%H%M%S")
+        open(os.path.join(directory, stamp + extension), "wb").close()
+
+
+# ====================================================================
+# MEASUREMENT
+# ====================================================================
+def _quiet(message, percentage=None, level="INFO"):
+    if level == "ERROR":
+        print(f"    [ERROR] {message}", file=sys.stderr)
+
+
+def _measure(func, repeat, setup=None, teardown=None):
+    """Führt func 'repeat' mal aus; setup() liefert das Argument, teardown(arg, result) räumt auf."""
+    samples = []
+    extra = None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = func(arg)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        samples.append({"wall_seconds": wall, "cpu_seconds": cpu})
+        extra = result
+        if teardown:
+            teardown(arg, result)
+    walls = [s["wall_seconds"] for s in samples]
+    return {
+        "repeat": repeat,
+        "wall_min": min(walls),
+        "wall_median": statistics.median(walls),
+        "cpu_median": statistics.median(s["cpu_seconds"] for s in samples),
+        "samples": samples,
+    }, extra
+
+
+def run_benchmarks(workdir, scale, repeat, profiles, scenarios=None):
+    from backup_logic import perform_backup, perform_restore, get_archive_contents, apply_retention_policy
+    from metrics import RunMetrics
+    from sftp_fixture import LocalSFTPServer
+
+    source = os.path.join(workdir, "source")
+    manifest = generate_dataset(source, profiles=profiles, scale=scale)
+    print(f"Dataset: {sum(manifest['files'].values())} files, {manifest['apparent_bytes'] / 2**20:.1f} MB "
+          f"({manifest['allocated_bytes'] / 2**20:.1f} MB allocated)")
+
+    results = {}
+    remote_root = os.path.join(workdir, "remote")
+    shutil.rmtree(remote_root, ignore_errors=True)
+
+    with LocalSFTPServer(remote_root) as server:
+        archives = {}
+        source_digest = []
+
+        def backup_case(name, compress_type, encrypt, to_sftp, **backup_kwargs):
+            def setup():
+                nas = tempfile.mkdtemp(prefix="nas_", dir=workdir)
+                return nas
+
+            def run(nas):
+                run_metrics = RunMetrics(job=name)
+                ok, _, filename = perform_backup(
+                    [source], None if to_sftp else nas,
+                    server.host_string if to_sftp else None, server.password if to_sftp else None,
+                    compress_type, encrypt, PASSPHRASE if encrypt else None, _quiet, metrics=run_metrics,
+                    **backup_kwargs)
+                if not ok:
+                    raise RuntimeError(f"{name}: perform_backup failed")
+                return filename, run_metrics
+
+            def teardown(nas, result):
+                filename, _ = result
+                stored = os.path.join(remote_root if to_sftp else nas, filename)
+                keep = os.path.join(workdir, f"{name}_{filename}")
+                os.replace(stored, keep)
+                if archives.get(name) not in (None, keep):
+                    os.remove(archives[name]) # Archiv der vorherigen Wiederholung
+                archives[name] = keep
+                shutil.rmtree(nas, ignore_errors=True)
+
+            stats, (_, run_metrics) = _measure(run, repeat, setup, teardown)
+            stats["archive_bytes"] = os.path.getsize(archives[name])
+            stats["throughput_mb_s"] = manifest["apparent_bytes"] / 2**20 / stats["wall_median"]
+            stats["stages"] = {stage.name: round(stage.wall_seconds, 4) for stage in run_metrics.stages}
+            return stats
+
+        def restore_case(name, archive_key, from_sftp):
+            def setup():
+                if from_sftp:
+                    shutil.copy(archives[archive_key], os.path.join(remote_root, os.path.basename(archives[archive_key])))
+                return tempfile.mkdtemp(prefix="restore_", dir=workdir)
+
+            def run(dest):
+                if from_sftp:
+                    ok, message = perform_restore("hetzner_sftp", "/" + os.path.basename(archives[archive_key]), dest,
+                                                  True, server.sftp_config, _quiet)
+                else:
+                    ok, message = perform_restore("nas_local", archives[archive_key], dest, True, {}, _quiet)
+                if not ok:
+                    raise RuntimeError(f"{name}: {message}")
+
+            def teardown(dest, _):
+                # Außerhalb der Zeitmessung: der wiederhergestellte Baum muss dem Datensatz entsprechen
+                if not source_digest:
+                    source_digest.append(tree_digest(source))
+                restored = tree_digest(os.path.join(dest, os.path.basename(source)))
+                shutil.rmtree(dest, ignore_errors=True)
+                remote_copy = os.path.join(remote_root, os.path.basename(archives[archive_key]))
+                if os.path.exists(remote_copy):
+                    os.remove(remote_copy)
+                if restored != source_digest[0]:
+                    raise RuntimeError(f"{name}: restored tree differs from the dataset")
+
+            stats, _ = _measure(run, repeat, setup, teardown)
+            stats["throughput_mb_s"] = manifest["apparent_bytes"] / 2**20 / stats["wall_median"]
+            stats["verified"] = True
+            return stats
+
+        def contents_case(name, archive_key, encrypted):
+            def run(_):
+                contents = get_archive_contents(archives[archive_key], encrypted, PASSPHRASE if encrypted else None,
+                                                False, None, None, None, _quiet)
+                if contents is None:
+                    raise RuntimeError(f"{name}: get_archive_contents failed")
+                return len(contents)
+
+            stats, entries = _measure(run, repeat)
+            stats["entries"] = entries
+            return stats
+
+        def retention_case(name, to_sftp, count=500, keep=10):
+            policy = {'enabled': True, 'type': 'count', 'value': keep, 'unit': 'days',
+                      'nas': not to_sftp, 'hetzner': to_sftp}
+
+            def setup():
+                directory = remote_root if to_sftp else tempfile.mkdtemp(prefix="retention_", dir=workdir)
+                make_retention_fixture(directory, count)
+                return directory
+
+            def run(directory):
+                if not apply_retention_policy(policy, None if to_sftp else directory,
+                                              server.host_string if to_sftp else None,
+                                              server.password if to_sftp else None, _quiet):
+                    raise RuntimeError(f"{name}: apply_retention_policy failed")
+
+            def teardown(directory, _):
+                if to_sftp:
+                    for entry in os.listdir(directory):
+                        if entry.startswith("backup_"):
+                            os.remove(os.path.join(directory, entry))
+                else:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+            stats, _ = _measure(run, repeat, setup, teardown)
+            stats["files"] = count
+            return stats
+
+        cases = [
+            ("backup_zip_nas", lambda n: backup_case(n, "zip", False, False)),
+            ("backup_tar_nas", lambda n: backup_case(n, "tar.gz", False, False)),
+            ("backup_zip_encrypted_sftp", lambda n: backup_case(n, "zip", True, True)),
+            ("backup_tar_encrypted_sftp", lambda n: backup_case(n, "tar.gz", True, True)),
+            # Lesereihenfolge (file_order.py): inode/physical wirken auf die Plattenzugriffe, type auf die
+            # Kompression im tar.gz-Stream; ZIP komprimiert jede Datei für sich
+            ("backup_zip_order_inode", lambda n: backup_case(n, "zip", False, False, file_order="inode")),
+            ("backup_zip_order_physical", lambda n: backup_case(n, "zip", False, False, file_order="physical")),
+            ("backup_tar_order_inode", lambda n: backup_case(n, "tar.gz", False, False, file_order="inode")),
+            ("backup_tar_order_physical", lambda n: backup_case(n, "tar.gz", False, False, file_order="physical")),
+            ("backup_tar_order_type", lambda n: backup_case(n, "tar.gz", False, False, file_order="type")),
+            ("restore_zip_nas", lambda n: restore_case(n, "backup_zip_nas", False)),
+            ("restore_tar_sftp", lambda n: restore_case(n, "backup_tar_nas", True)),
+            ("contents_zip", lambda n: contents_case(n, "backup_zip_nas", False)),
+            ("contents_tar_encrypted", lambda n: contents_case(n, "backup_tar_encrypted_sftp", True)),
+            ("retention_nas", lambda n: retention_case(n, False)),
+            ("retention_sftp", lambda n: retention_case(n, True)),
+        ]
+        for name, case in cases:
+            if scenarios and name not in scenarios and not any(name.startswith(s) for s in scenarios):
+                continue
+            print(f"  {name} ...", end="", flush=True)
+            try:
+                results[name] = case(name)
+                size = results[name].get("archive_bytes")
+                print(f" {results[name]['wall_median']:.3f} s" + (f", {size / 2**20:.2f} MB" if size else ""))
+            except (RuntimeError, KeyError) as e:
+                # KeyError: der Fall braucht ein Archiv aus einem übersprungenen Backup-Fall
+                results[name] = {"error": str(e)}
+                print(f" skipped ({e})")
+
+    return manifest, results
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ====================================================================
+# COMPARISON
+# ====================================================================
+def compare_results(baseline, candidate, threshold=10.0):
+    """Gibt (Zeilen, Regressionen) zurück; Regression = Median-Wandzeit > threshold % langsamer."""
+    lines = [f"{'scenario':32} {'baseline':>10} {'candidate':>10} {'change':>9}"]
+    regressions = []
+    for name in sorted(set(baseline["results"]) | set(candidate["results"])):
+        base = baseline["results"].get(name, {})
+        cand = candidate["results"].get(name, {})
+        if "wall_median" not in base or "wall_median" not in cand:
+            lines.append(f"{name:32} {'-':>10} {'-':>10} {'n/a':>9}")
+            continue
+        change = (cand["wall_median"] - base["wall_median"]) / base["wall_median"] * 100 if base["wall_median"] else 0.0
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            marker = "  faster"
+        lines.append(f"{name:32} {base['wall_median']:>9.3f}s {cand['wall_median']:>9.3f}s {change:>+8.1f}%{marker}")
+    return lines, regressions
+
+
+# ====================================================================
+# COMMAND LINE
+# ====================================================================
+def cmd_run(args):
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "backuptool_benchmark")
+    os.makedirs(workdir, exist_ok=True)
+    profiles = args.profiles.split(",")
+    print(f"Running benchmarks in {workdir} (scale {args.scale}, repeat {args.repeat})")
+    manifest, results = run_benchmarks(workdir, args.scale, args.repeat, profiles,
+                                       scenarios=args.only.split(",") if args.only else None)
+
+    report = {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": {"commit": _git("rev-parse", "HEAD"), "branch": _git("rev-parse", "--abbrev-ref", "HEAD")},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dict({k: manifest[k] for k in ("files", "apparent_bytes", "allocated_bytes")}, scale=args.scale),
+        "results": results,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{args.label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            lines, regressions = compare_results(json.load(f), report, args.threshold)
+        print("\n".join(lines))
+        return 1 if regressions else 0
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    if baseline.get("dataset") != candidate.get("dataset"):
+        print("Warning: the two runs used different datasets; timings are not directly comparable.")
+    lines, regressions = compare_results(baseline, candidate, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"{len(regressions)} scenario(s) slower than {args.threshold:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="BackupTool benchmark suite.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Generate the dataset and run all scenarios.")
+    run.add_argument("--label", default=_git("rev-parse", "--abbrev-ref", "HEAD") or "run",
+                     help="Name of the result file (default: current git branch).")
+    run.add_argument("--scale", type=float, default=0.1, help="Dataset size factor (1.0 = ~2.5 GB apparent).")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported.")
+    run.add_argument("--profiles", default="small,large,media,sparse,mixed", help="Comma-separated dataset profiles.")
+    run.add_argument("--only", help="Comma-separated scenario names or prefixes (e.g. backup,contents_zip).")
+    run.add_argument("--workdir", help="Working directory (default: <tmp>/backuptool_benchmark).")
+    run.add_argument("--keep", action="store_true", help="Keep the working directory and dataset for the next run.")
+    run.add_argument("--results-dir", default=DEFAULT_RESULTS_DIR)
+    run.add_argument("--baseline", help="Compare against this result file after the run.")
+    run.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent.")
+    run.set_defaults(func=cmd_run)
+
+    compare = subparsers.add_parser("compare", help="Compare two result files.")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent.")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+import errno
+import hashlib
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from progress import ScanResult, prescan_sources
+from sparse import allocated_size
+
+
+# ====================================================================================================
+# CHANGE JOURNAL
+# ====================================================================================================
+#
+# Der Vorab-Scan (progress.prescan_sources) macht vor jedem Backup ein lstat auf jede Datei. Bei
+# Millionen Dateien dauert das länger als das Backup der Änderungen. Unter Linux kann der
+# Scheduler-Dienst (scheduler.py) deshalb pro Quelle einen ChangeWatcher mitlaufen lassen:
+#
+# - Der Watcher setzt inotify-Watches auf alle Verzeichnisse der Quelle (ctypes, keine Abhängigkeit)
+#   und hängt geänderte Pfade an ein Journal im App-Datenordner an (change_journal/<key>.journal):
+#     F<pfad>\0   Inhalt oder Attribute einer Datei im Verzeichnis des Pfads geändert
+#     D<pfad>\0   Verzeichnis angelegt, gelöscht oder verschoben
+# - JournaledScan hält pro Verzeichnis die Anzahl und Bytes der direkt enthaltenen Dateien in
+#   einem Index (<key>.index). Beim nächsten Lauf werden nur die Verzeichnisse aus dem Journal neu
+#   gelesen, neue Verzeichnisse komplett; der Rest kommt aus dem Index.
+# - Jeder Watcher-Start beginnt eine neue Sitzung mit leerem Journal. Der Index merkt sich Sitzung
+#   und Journal-Position. Passt die Sitzung nicht (Watcher war gestoppt, inotify-Warteschlange
+#   übergelaufen, Journal zu groß) oder ist der Heartbeat des Watchers veraltet, wird wieder voll
+#   gescannt - ein Journal mit Lücken wird nie verwendet.
+# - Der Fingerabdruck für 'skip_unchanged' (source_fingerprint.py) nutzt das Journal ebenfalls:
+#   Kam seit dem letzten vollen Backup in derselben Sitzung kein Eintrag hinzu, wird der gespeicherte
+#   Fingerabdruck übernommen statt den Baum erneut zu durchlaufen. Eine Änderung, die der Watcher
+#   noch nicht geschrieben hat (bis FLUSH_SECONDS), fällt erst beim nächsten Lauf auf.
+# - Grenze: Die Deduplizierung ('dedup_enabled', dedup.py) braucht Größe und Inode jeder Datei und
+#   durchläuft die Quellen weiterhin komplett; mit Journal lohnt sie sich für sehr große Bäume nicht.
+#
+# fanotify bräuchte CAP_SYS_ADMIN und meldet ohne FAN_REPORT_DFID_NAME keine Pfade; inotify reicht
+# für einzelne Quellbäume. Die Grenze fs.inotify.max_user_watches muss zur Verzeichniszahl passen,
+# sonst meldet der Watcher einen Fehler und die Backups scannen weiter voll.
+
+CHANGE_JOURNAL_DIRNAME = "change_journal"
+HEARTBEAT_SECONDS = 30
+STALE_SECONDS = 3 * HEARTBEAT_SECONDS
+FLUSH_SECONDS = 1.0
+MAX_JOURNAL_BYTES = 256 * 1024 * 1024
+INDEX_FORMAT = b"BTJ1"
+READ_SIZE = 64 * 1024
+
+RECORD_FILE = b"F"
+RECORD_DIR = b"D"
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+def journal_key(source_paths):
+    """Kennung einer Quellmenge (Dateinamen im Journal-Ordner)."""
+    roots = sorted(os.path.abspath(p) for p in source_paths)
+    return hashlib.sha256("\0".join(roots).encode("utf-8", "surrogateescape")).hexdigest()[:16]
+
+
+def _watched_roots(source_paths):
+    return sorted({os.path.abspath(p) for p in source_paths if os.path.isdir(p) and not os.path.islink(p)})
+
+
+def _under(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _write_json_atomic(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def inotify_available():
+    return sys.platform.startswith("linux")
+
+
+class ChangeWatcher:
+    """
+    Schreibt Änderungen unter den Verzeichnissen in source_paths ins Journal (eigener Thread).
+    start() gibt False zurück, wenn inotify nicht verfügbar ist.
+    """
+
+    def __init__(self, source_paths, directory, log=None):
+        self.roots = _watched_roots(source_paths)
+        self.directory = directory
+        self.log = log or (lambda message, percentage=None, level="INFO": None)
+        key = journal_key(source_paths)
+        self.journal_path = os.path.join(directory, key + ".journal")
+        self.state_path = os.path.join(directory, key + ".watcher.json")
+        self.session = None
+        self._libc = None
+        self._fd = None
+        self._watches = {} # wd -> Verzeichnispfad
+        self._pending = [] # noch nicht geschriebene Journal-Einträge
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- inotify -------------------------------------------------------
+    def _init_inotify(self):
+        import ctypes
+
+        if self._libc is None:
+            self._libc = ctypes.CDLL(None, use_errno=True)
+            self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._fd = fd
+
+    def _add_watch(self, path):
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return # inzwischen gelöscht oder nicht lesbar: der Scan meldet das wie bisher
+            raise OSError(error, os.strerror(error), path)
+        self._watches[wd] = path
+
+    def _add_tree(self, path):
+        """Watches auf path und alle Unterverzeichnisse (folgt keinen Symlinks)."""
+        self._add_watch(path)
+        for root, dirs, _ in os.walk(path):
+            for name in dirs:
+                child = os.path.join(root, name)
+                if not os.path.islink(child):
+                    self._add_watch(child)
+
+    def _remove_tree(self, path):
+        for wd, watched in list(self._watches.items()):
+            if _under(watched, path):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            raise OverflowError("inotify event queue overflowed")
+        directory = self._watches.get(wd)
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        if directory is None:
+            return
+        path = os.path.join(directory, name) if name else directory
+        if not name: # Ereignis am Verzeichnis selbst (nur für die Wurzeln nicht auch beim Elternteil)
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF) and path in self.roots:
+                self._pending.append(RECORD_DIR + os.fsencode(path))
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                self._remove_tree(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path) # Inhalt, der vor dem Watch entstand, liest der Scan komplett
+            if mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                self._pending.append(RECORD_DIR + os.fsencode(path))
+                return
+        self._pending.append(RECORD_FILE + os.fsencode(path))
+
+    def _read_events(self):
+        try:
+            buffer = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            self._handle(wd, mask, os.fsdecode(name))
+
+    # --- Journal und Status -------------------------------------------
+    def _new_session(self, ready=False):
+        self.session = uuid.uuid4().hex
+        self._pending = []
+        with open(self.journal_path, "wb"):
+            pass
+        self._write_state(ready)
+
+    def _write_state(self, ready=True):
+        _write_json_atomic(self.state_path, {"session": self.session, "pid": os.getpid(), "roots": self.roots,
+                                             "ready": ready, "heartbeat": time.time()})
+
+    def _flush(self):
+        if not self._pending:
+            return
+        records = b"\0".join(dict.fromkeys(self._pending)) + b"\0" # doppelte Einträge einer Runde einmal
+        self._pending = []
+        with open(self.journal_path, "ab") as f:
+            f.write(records)
+            size = f.tell()
+        if size > MAX_JOURNAL_BYTES:
+            raise OverflowError(f"journal exceeded {MAX_JOURNAL_BYTES} bytes")
+
+    # --- Ablauf --------------------------------------------------------
+    def start(self):
+        if not inotify_available() or not self.roots:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="change-journal", daemon=True)
+        self._thread.start()
+        return True
+
+    def _start_session(self):
+        """
+        Neue Sitzung mit frischem inotify-Deskriptor und Watches auf allen Wurzeln. Nach einem Überlauf
+        fehlen sonst Watches für Verzeichnisse, die in den verlorenen Ereignissen angelegt wurden.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches = {}
+        self._init_inotify()
+        self._new_session(ready=False)
+        for root in self.roots:
+            self._add_tree(root)
+        self._write_state(ready=True) # erst jetzt ist jede Änderung im Journal
+
+    def _run(self):
+        try:
+            self._start_session()
+            self.log(f"Change journal active for {', '.join(self.roots)} ({len(self._watches)} directories).", level="INFO")
+            next_heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+            while not self._stop.is_set():
+                readable, _, _ = select.select([self._fd], [], [], FLUSH_SECONDS)
+                try:
+                    if readable:
+                        self._read_events()
+                    self._flush()
+                except OverflowError as e:
+                    # Lücke im Journal: neue Sitzung mit neuen Watches, der nächste Lauf scannt voll
+                    self.log(f"Change journal reset ({e}); the next backup does a full scan.", level="WARNING")
+                    self._start_session()
+                if time.monotonic() >= next_heartbeat:
+                    self._write_state()
+                    next_heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+        except OSError as e:
+            hint = " (raise fs.inotify.max_user_watches)" if e.errno == errno.ENOSPC else ""
+            self.log(f"Change journal stopped: {e}{hint}. Backups use full scans.", level="ERROR")
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            try:
+                os.remove(self.state_path) # ohne Watcher kein gültiges Journal
+            except OSError:
+                pass
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# ====================================================================================================
+# JOURNALED PRE-SCAN
+# ====================================================================================================
+
+def _scan_directory(path):
+    """(Dateien, Bytes) der direkt in path liegenden Nicht-Verzeichnisse oder None, wenn path fehlt."""
+    files = 0
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            if entry.is_dir(): # wie os.walk: Symlinks auf Verzeichnisse sind keine Dateien
+                continue
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        files += 1
+        total += allocated_size(st)
+    return [files, total]
+
+
+def _walk_into(dirs, path):
+    for root, _, _ in os.walk(path):
+        counts = _scan_directory(root)
+        if counts is not None:
+            dirs[root] = counts
+
+
+def _remove_subtree(dirs, path):
+    for directory in [d for d in dirs if _under(d, path)]:
+        del dirs[directory]
+
+
+class JournaledScan:
+    """
+    Ersatz für progress.prescan_sources, der bei laufendem Watcher nur die Änderungen seit dem
+    letzten Lauf liest. Ohne gültiges Journal wird voll gescannt (und der Index neu aufgebaut).
+    """
+
+    def __init__(self, source_paths, directory, log=None):
+        self.source_paths = list(source_paths)
+        self.roots = _watched_roots(source_paths)
+        self.log = log or (lambda message, percentage=None, level="INFO": None)
+        key = journal_key(source_paths)
+        self.journal_path = os.path.join(directory, key + ".journal")
+        self.state_path = os.path.join(directory, key + ".watcher.json")
+        self.index_path = os.path.join(directory, key + ".index")
+        self.mode = None # "journal", "full" oder "unavailable" nach dem ersten Aufruf
+        self.changed_paths = 0
+        self._dirs = None
+
+    def _watcher_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not state.get("ready") or state.get("roots") != self.roots
+                or time.time() - state.get("heartbeat", 0) > STALE_SECONDS or not _pid_alive(state.get("pid", 0))):
+            return None
+        return state
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            if not data.startswith(INDEX_FORMAT):
+                return None
+            return json.loads(zlib.decompress(data[len(INDEX_FORMAT):]).decode("utf-8", "surrogateescape"))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+    def _save_index(self, session, offset):
+        data = json.dumps({"session": session, "offset": offset, "dirs": self._dirs}, ensure_ascii=False)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(INDEX_FORMAT + zlib.compress(data.encode("utf-8", "surrogateescape"), 6))
+        os.replace(temp_path, self.index_path)
+
+    def _read_journal(self, start):
+        """Einträge ab start bis zum letzten vollständigen Eintrag; gibt (einträge, neue_position) zurück."""
+        with open(self.journal_path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b"\0") + 1
+        return [record for record in data[:end].split(b"\0") if record], start + end
+
+    def _apply(self, records):
+        for record in dict.fromkeys(records):
+            kind, path = record[:1], os.fsdecode(record[1:])
+            if kind == RECORD_DIR:
+                # Verzeichnisse zählen im Elternverzeichnis nicht mit, nur ihr Teilbaum ändert sich
+                _remove_subtree(self._dirs, path)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    _walk_into(self._dirs, path)
+                continue
+            parent = os.path.dirname(path)
+            counts = _scan_directory(parent)
+            if counts is None:
+                _remove_subtree(self._dirs, parent)
+            else:
+                self._dirs[parent] = counts
+
+    def _refresh(self):
+        state = self._watcher_state()
+        if state is None:
+            self.mode = "unavailable"
+            self.log("Change journal not available (watcher not running); full pre-scan.", level="DEBUG")
+            return
+        index = self._load_index()
+        if index is not None and index.get("session") == state["session"]:
+            try:
+                records, offset = self._read_journal(index.get("offset", 0))
+            except OSError:
+                records = None
+            # Hat der Watcher inzwischen eine neue Sitzung begonnen, fehlen Einträge
+            current = self._watcher_state()
+            if records is not None and current is not None and current["session"] == state["session"]:
+                self._dirs = index["dirs"]
+                self._apply(records)
+                self.mode = "journal"
+                self.changed_paths = len(records)
+                self.log(f"Pre-scan from change journal: {len(records)} changes since the last run.", level="INFO")
+                self._save_index(state["session"], offset)
+                return
+
+        # Neue Sitzung, Überlauf oder erster Lauf: voll scannen; Änderungen ab hier kommen ins Journal
+        try:
+            offset = os.path.getsize(self.journal_path)
+        except OSError:
+            offset = 0
+        self._dirs = {}
+        for root in self.roots:
+            _walk_into(self._dirs, root)
+        self.mode = "full"
+        self.log("Change journal has no usable history (new watcher session or overflow); full pre-scan.", level="INFO")
+        self._save_index(state["session"], offset)
+
+    def position(self):
+        """
+        Aktuelle Stelle im Journal ({'session', 'offset'}) bei laufendem Watcher, sonst None. Nur wenn
+        alle Quellen beobachtete Verzeichnisse sind (Einzeldateien stehen nie im Journal).
+        """
+        if len(self.roots) != len(self.source_paths):
+            return None
+        state = self._watcher_state()
+        if state is None:
+            return None
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                if offset:
+                    f.seek(offset - 1)
+                    if f.read(1) != b"\0":
+                        return None # Eintrag wird gerade geschrieben
+        except OSError:
+            return None
+        return {"session": state["session"], "offset": offset}
+
+    def unchanged_since(self, position):
+        """True, wenn der Watcher seit position (aus position()) ohne Unterbrechung lief und nichts meldete."""
+        current = self.position()
+        return (current is not None and current == {"session": position.get("session"),
+                                                    "offset": position.get("offset")})
+
+    def prescan(self, paths):
+        """Wie progress.prescan_sources(paths) für Pfade unterhalb der Quellen dieses Scans."""
+        if self.mode is None:
+            self._refresh()
+        if self._dirs is None:
+            return prescan_sources(paths)
+        files = 0
+        total = 0
+        for path in paths:
+            path = os.path.abspath(path)
+            if not any(_under(path, root) for root in self.roots) or not os.path.isdir(path):
+                result = prescan_sources([path]) # Einzeldateien und Quellen ohne Watcher direkt
+                files += result.files
+                total += result.bytes
+                continue
+            for directory, (dir_files, dir_bytes) in self._dirs.items():
+                if _under(directory, path):
+                    files += dir_files
+                    total += dir_bytes
+        return ScanResult(files, total)
+
+
+def journaled_scan_from_config(config, app_data_dir, source_paths, log=None):
+    """JournaledScan, wenn 'change_journal_enabled' gesetzt ist und inotify verfügbar ist, sonst None."""
+    if not config.get('change_journal_enabled', False) or not inotify_available():
+        return None
+    return JournaledScan(source_paths, os.path.join(app_data_dir, CHANGE_JOURNAL_DIRNAME), log)
@@ -0,0 +1,358 @@
+"""
+Headless command line interface for BackupTool.
+
+Runs backups, restores, listings, verification and retention without importing
+tkinter/ttkthemes. backup_logic, paramiko and cryptography are only imported by
+the subcommands that need them, so `cli.py --help` or a NAS-only job starts fast
+(check with `python -X importtime cli.py --help`).
+
+Examples:
+    python cli.py backup
+    python cli.py restore /mnt/nas/backup_20250622_180000.zip /tmp/restore
+    python cli.py list --hetzner
+    python cli.py list --contents /mnt/nas/backup_20250622_180000.zip
+    python cli.py verify /mnt/nas/backup_20250622_180000.zip --sha256 <hash>
+    python cli.py retention
+    python cli.py backup --profile sampling
+    python cli.py scheduled --verbose   # used by cron / Windows Task Scheduler
+    python cli.py daemon                # resident scheduler service (scheduler.py)
+"""
+import argparse
+import datetime
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+from bandwidth import limiter_from_config
+from config_manager import ConfigManager
+from job_config import (backup_arguments_from_config, export_metrics, hetzner_host_string, retention_settings_from_config,
+                        s3_destination_from_config, sftp_config_from_config, stage_profiler)
+
+
+# ====================================================================
+# LOGGING
+# ====================================================================
+class CliLogger:
+    """Progress/log callback compatible with backup_logic (message, percentage=None, level=...)."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+
+    def __call__(self, message, percentage=None, level="INFO"):
+        if level == "DEBUG" and not self.verbose:
+            return
+        timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
+        stream = sys.stderr if level == "ERROR" else sys.stdout
+        print(f"{timestamp} [{level}] {message}", file=stream, flush=True)
+
+
+@contextmanager
+def progress_reporter(progress_model, log, interval):
+    """Logs the progress model's percentage, MB/s and ETA every `interval` seconds (0 = off)."""
+    stop = threading.Event()
+
+    def _run():
+        while not stop.wait(interval):
+            if progress_model.scan is not None:
+                log(f"Progress: {progress_model.snapshot().format()}", level="INFO")
+
+    thread = None
+    if interval > 0:
+        thread = threading.Thread(target=_run, name="progress-reporter", daemon=True)
+        thread.start()
+    try:
+        yield progress_model
+    finally:
+        stop.set()
+        if thread:
+            thread.join()
+
+
+# ====================================================================
+# SUBCOMMANDS
+# ====================================================================
+def cmd_backup(args, config, log):
+    from backup_logic import perform_backup
+
+    kwargs = backup_arguments_from_config(
+        config,
+        source_path=args.source,
+        nas_enabled=True if args.nas else None,
+        hetzner_enabled=False if args.no_hetzner else None,
+        archive_format=args.format,
+        compression_level=args.compression,
+        s3_enabled=False if args.no_s3 else None,
+    )
+    if args.nas:
+        kwargs['nas_path'] = args.nas
+
+    if not kwargs['source_paths']:
+        log("Backup skipped: no source path configured.", level="WARNING")
+        return 2
+    if not kwargs['nas_path'] and not kwargs['hetzner_host'] and not kwargs['extra_destinations']:
+        log("Backup skipped: no destination enabled or configured.", level="WARNING")
+        return 2
+    if kwargs['hetzner_host'] and not kwargs['hetzner_password']:
+        log("Backup skipped: Hetzner destination enabled but credentials not configured.", level="WARNING")
+        return 2
+
+    from metrics import RunMetrics
+    from progress import ProgressModel
+
+    with stage_profiler(args.profile, config, args.job, log) as profiler:
+        run_metrics = RunMetrics(job=args.job, profiler=profiler)
+        with progress_reporter(ProgressModel(), log, args.progress_interval) as progress_model:
+            success, calculated_hash, filename = perform_backup(progress_callback=log,
+                                                                progress_model=progress_model,
+                                                                metrics=run_metrics, **kwargs)
+    export_metrics(run_metrics, config, log)
+    if success:
+        log(f"Backup {filename} completed. SHA256: {calculated_hash}", level="INFO")
+        return 0
+    log(f"Backup failed{f' ({filename})' if filename else ''}.", level="ERROR")
+    return 1
+
+
+def cmd_restore(args, config, log):
+    from backup_logic import perform_restore
+    from metrics import RunMetrics
+
+    source = None
+    if args.s3:
+        source = s3_destination_from_config(config)
+        if source is None:
+            log("No S3 destination configured.", level="ERROR")
+            return 2
+    source_type = "s3" if args.s3 else "hetzner_sftp" if args.hetzner else "nas_local"
+    sftp_config = sftp_config_from_config(config) if args.hetzner else {}
+    with stage_profiler(args.profile, config, "restore", log) as profiler:
+        success, message = perform_restore(source_type, args.archive, args.destination,
+                                           not args.no_overwrite, sftp_config, log,
+                                           metrics=RunMetrics(job="restore", profiler=profiler),
+                                           bandwidth=limiter_from_config(config) if args.hetzner else None,
+                                           passphrase=config.get('encryption_password', ''), source=source)
+    log(message, level="INFO" if success else "ERROR")
+    return 0 if success else 1
+
+
+def cmd_list(args, config, log):
+    from backup_logic import get_archive_contents, get_backup_files_in_directory, get_sftp_client, list_backups
+
+    source = None
+    if args.s3:
+        source = s3_destination_from_config(config)
+        if source is None:
+            log("No S3 destination configured.", level="ERROR")
+            return 2
+
+    if args.contents:
+        from listing_cache import listing_cache_from_config
+
+        sftp = sftp_config_from_config(config)
+        is_encrypted = args.contents.endswith(".enc") # manifests carry their own flag
+        cache = None if args.no_cache else listing_cache_from_config(config, ConfigManager().app_data_dir)
+        contents = get_archive_contents(args.contents, is_encrypted, config.get('encryption_password', ''),
+                                        args.hetzner, hetzner_host_string(config), sftp['username'],
+                                        sftp['password'], log,
+                                        bandwidth=limiter_from_config(config) if args.hetzner else None,
+                                        cache=cache, source=source)
+        if contents is None:
+            return 1
+        for name in contents:
+            print(name)
+        return 0
+
+    if source is not None:
+        backup_files = list_backups(source)
+    elif args.hetzner:
+        sftp_client, transport = get_sftp_client(hetzner_host_string(config), config.get('hetzner_username', ''),
+                                                 config.get('hetzner_password', ''))
+        try:
+            backup_files = get_backup_files_in_directory(args.path or ".", is_sftp=True, sftp_client=sftp_client)
+        finally:
+            sftp_client.close()
+            transport.close()
+    else:
+        path = args.path or config.get('destination_path', '')
+        if not path:
+            log("No NAS/Local destination path configured.", level="ERROR")
+            return 2
+        backup_files = get_backup_files_in_directory(path, is_sftp=False)
+
+    for dt_obj, filename in backup_files:
+        print(f"{dt_obj:%Y-%m-%d %H:%M:%S}  {filename}")
+    return 0
+
+
+def cmd_verify(args, config, log):
+    import tarfile
+    import zipfile
+    from backup_logic import calculate_sha256
+
+    if not os.path.exists(args.archive):
+        log(f"Archive not found: {args.archive}", level="ERROR")
+        return 1
+
+    calculated_hash = calculate_sha256(args.archive)
+    log(f"SHA256: {calculated_hash}", level="INFO")
+    if args.sha256 and args.sha256.lower() != calculated_hash:
+        log(f"Hash mismatch: expected {args.sha256}", level="ERROR")
+        return 1
+
+    try:
+        if args.archive.endswith(".enc"):
+            from backup_logic import DecryptingReader
+
+            with open(args.archive, "rb") as f_in:
+                reader = DecryptingReader(f_in, config.get('encryption_password', ''))
+                while reader.read(1024 * 1024): # the tag is checked when the end is reached
+                    pass
+            log("Encrypted archive authenticated successfully.", level="INFO")
+        elif zipfile.is_zipfile(args.archive):
+            from zip_dictionary import testzip
+
+            bad_member = testzip(args.archive) # also checks members compressed with a trained dictionary
+            if bad_member:
+                log(f"Corrupt member in zip archive: {bad_member}", level="ERROR")
+                return 1
+            log("Zip archive verified successfully.", level="INFO")
+        elif tarfile.is_tarfile(args.archive):
+            with tarfile.open(args.archive, "r:*") as tar:
+                for member in tar:
+                    if member.isreg():
+                        with tar.extractfile(member) as member_file:
+                            while member_file.read(1024 * 1024):
+                                pass
+            log("Tar archive verified successfully.", level="INFO")
+        else:
+            log("Unsupported archive format.", level="ERROR")
+            return 1
+    except Exception as e:
+        log(f"Archive verification failed: {e}", level="ERROR")
+        return 1
+    return 0
+
+
+def cmd_retention(args, config, log):
+    from backup_logic import apply_retention_policy
+
+    policy_settings = retention_settings_from_config(config)
+    s3_destination = s3_destination_from_config(config)
+    success = apply_retention_policy(policy_settings, config.get('destination_path', ''),
+                                     hetzner_host_string(config), config.get('hetzner_password', ''), log,
+                                     extra_destinations=[s3_destination] if s3_destination else None)
+    return 0 if success else 1
+
+
+def cmd_scheduled(args, config, log):
+    """Backup followed by the retention policy, driven entirely by the saved configuration."""
+    from scheduler import DEFAULT_JOB_NAME, job_lock
+
+    # Shares the lock with the scheduler service's default job, so runs never overlap
+    with job_lock(ConfigManager().app_data_dir, DEFAULT_JOB_NAME) as lock:
+        if not lock.acquire():
+            log("Another backup run is still in progress. Skipping this scheduled run.", level="WARNING")
+            return 3
+        log("Starting scheduled backup run...", level="INFO")
+        backup_args = argparse.Namespace(source=None, nas=None, no_hetzner=False, no_s3=False, format=None,
+                                         compression=None, progress_interval=args.progress_interval,
+                                         job=DEFAULT_JOB_NAME, profile=args.profile)
+        result = cmd_backup(backup_args, config, log)
+        if result == 0 and config.get('retention_enabled', False):
+            result = cmd_retention(args, config, log)
+        log("Scheduled backup run finished.", level="INFO")
+        return result
+
+
+def cmd_daemon(args, config, log):
+    from scheduler import SchedulerDaemon
+
+    return SchedulerDaemon(ConfigManager(), log, tick_seconds=args.tick).run(once=args.once)
+
+
+PROFILE_CHOICES = ("full", "sampling", "off")
+PROFILE_HELP = ("Profile each stage: 'full' = cProfile + tracemalloc, 'sampling' = cheap stack sampling, "
+                "'off' overrides the config's profile_mode. Reports go to <app data>/profiles/.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="backuptool", description="BackupTool command line interface.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Also print DEBUG messages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup = subparsers.add_parser("backup", help="Create a backup using the saved configuration.")
+    backup.add_argument("--source", help="Override the configured source folder.")
+    backup.add_argument("--nas", help="Back up to this NAS/Local folder (overrides the configuration).")
+    backup.add_argument("--no-hetzner", action="store_true", help="Skip the Hetzner Storage Box upload.")
+    backup.add_argument("--no-s3", action="store_true", help="Skip the S3 upload.")
+    backup.add_argument("--format", choices=["zip", "tar.gz"], help="Override the archive format.")
+    backup.add_argument("--compression", choices=["None", "Fast", "Default", "Best", "Auto"],
+                        help="Override the compression level; Auto measures format and level on a sample.")
+    backup.add_argument("--progress-interval", type=float, default=10.0, metavar="SECONDS",
+                        help="Log percentage, MB/s and ETA every SECONDS seconds (0 disables, default: 10).")
+    backup.add_argument("--profile", nargs="?", const="full", choices=PROFILE_CHOICES, help=PROFILE_HELP)
+    backup.set_defaults(func=cmd_backup, job="cli")
+
+    restore = subparsers.add_parser("restore", help="Restore an archive to a folder.")
+    restore.add_argument("archive", help="Local/NAS archive path, or remote path with --hetzner/--s3.")
+    restore.add_argument("destination", help="Destination folder.")
+    restore.add_argument("--hetzner", action="store_true", help="Download the archive from the Hetzner Storage Box.")
+    restore.add_argument("--s3", action="store_true", help="Download the archive (object name) from the S3 bucket.")
+    restore.add_argument("--no-overwrite", action="store_true", help="Keep existing files.")
+    restore.add_argument("--profile", nargs="?", const="full", choices=PROFILE_CHOICES, help=PROFILE_HELP)
+    restore.set_defaults(func=cmd_restore)
+
+    listing = subparsers.add_parser("list", help="List backups on a destination, or the contents of one archive.")
+    listing.add_argument("--path", help="Directory to list (defaults to the configured destination).")
+    listing.add_argument("--hetzner", action="store_true", help="List on the Hetzner Storage Box.")
+    listing.add_argument("--s3", action="store_true", help="List in the configured S3 bucket/prefix.")
+    listing.add_argument("--contents", metavar="ARCHIVE", help="List the files inside this archive.")
+    listing.add_argument("--no-cache", action="store_true", help="Ignore the listing cache and read the archive.")
+    listing.set_defaults(func=cmd_list)
+
+    verify = subparsers.add_parser("verify", help="Check hash and integrity of a local archive.")
+    verify.add_argument("archive")
+    verify.add_argument("--sha256", help="Expected SHA256 hash.")
+    verify.set_defaults(func=cmd_verify)
+
+    retention = subparsers.add_parser("retention", help="Apply the configured retention policy.")
+    retention.set_defaults(func=cmd_retention)
+
+    scheduled = subparsers.add_parser("scheduled", help="Backup + retention, as run by cron/Task Scheduler.")
+    scheduled.add_argument("--verbose", dest="scheduled_verbose", action="store_true", help=argparse.SUPPRESS)
+    scheduled.add_argument("--progress-interval", type=float, default=60.0, metavar="SECONDS",
+                           help="Log percentage, MB/s and ETA every SECONDS seconds (0 disables, default: 60).")
+    scheduled.add_argument("--profile", nargs="?", const="full", choices=PROFILE_CHOICES, help=PROFILE_HELP)
+    scheduled.set_defaults(func=cmd_scheduled)
+
+    daemon = subparsers.add_parser("daemon", help="Run the resident scheduler service (see scheduler.py).")
+    daemon.add_argument("--once", action="store_true", help="Run queued and missed jobs, then exit.")
+    daemon.add_argument("--tick", type=float, default=15, help="Seconds between schedule checks (default 15).")
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    log = CliLogger(verbose=args.verbose or getattr(args, 'scheduled_verbose', False))
+
+    config_manager = ConfigManager()
+    config = config_manager.load_config()
+    if not config:
+        log("Could not load configuration. Configure BackupTool in the GUI first.", level="ERROR")
+        return 2
+
+    try:
+        return args.func(args, config, log)
+    except KeyboardInterrupt:
+        log("Interrupted.", level="WARNING")
+        return 130
+    except Exception as e:
+        log(f"An unexpected error occurred: {e}", level="ERROR")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
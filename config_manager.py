@@ -1,6 +1,5 @@
 import json
 import os
-from cryptography.fernet import Fernet
 import base64
 import hashlib
 
@@ -9,8 +8,15 @@ class ConfigManager:
         self.app_data_dir = self._get_app_data_directory()
         self.config_filepath = os.path.join(self.app_data_dir, config_filename)
         self.key_filepath = os.path.join(self.app_data_dir, key_filename)
-        self.fernet = self._load_or_generate_key()
+        self._fernet = None # Loaded on first use so the headless CLI does not import cryptography needlessly
         self.config = {} # To hold the loaded config data
+        os.makedirs(self.app_data_dir, exist_ok=True) # Ensure directory exists
+
+    @property
+    def fernet(self):
+        if self._fernet is None:
+            self._fernet = self._load_or_generate_key()
+        return self._fernet
 
     def _get_app_data_directory(self):
         """Determines the appropriate application data directory based on OS."""
@@ -28,6 +34,8 @@ class ConfigManager:
         
     def _load_or_generate_key(self):
         """Loads the encryption key or generates a new one if it doesn't exist."""
+        from cryptography.fernet import Fernet
+
         os.makedirs(self.app_data_dir, exist_ok=True) # Ensure directory exists
         if os.path.exists(self.key_filepath):
             with open(self.key_filepath, "rb") as key_file:
@@ -91,6 +99,12 @@ class ConfigManager:
             self.config = {}
             return {}
 
+    def get_config(self):
+        """Returns the loaded configuration, loading it from disk on first access."""
+        if not self.config:
+            self.load_config()
+        return self.config
+
     def save_config(self, config_data, encryption_password=None, hetzner_password=None):
         """
         Saves configuration to the file, encrypting sensitive fields.
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import stat
+
+
+# ====================================================================================================
+# INTRA-BACKUP DEDUPLICATION
+# ====================================================================================================
+#
+# Vor dem Archivieren sucht ein Durchlauf über die Quellen nach Dateien, deren Inhalt schon einmal im
+# Archiv landet:
+#
+# - Hardlinks: gleiche (st_dev, st_ino).
+# - Gleicher Inhalt: erst nach Größe gruppiert, nur Gruppen mit mehreren Dateien werden gehasht.
+#
+# Die erste Datei einer Gruppe wird normal archiviert, alle weiteren nur als Verweis darauf:
+#
+# - tar.gz: Hardlink-Einträge (LNKTYPE). Bei Kopien (gleicher Inhalt, aber eigene Datei) trägt der
+#           Eintrag den PAX-Header BACKUPTOOL.dedup=copy; der Restore legt dafür wieder eine
+#           eigenständige Kopie an. Fremde tar-Programme erzeugen einen Hardlink mit gleichem Inhalt
+#           (GNU tar warnt dabei über den unbekannten Header).
+# - ZIP:    ZIP kennt keine Links. Die Verweise stehen im Mitglied .backuptool/links.json, der Restore
+#           legt Hardlinks bzw. Kopien an. Fremde Programme entpacken jeden Inhalt genau einmal.
+#
+# Ändert sich eine Datei zwischen Analyse und Archivieren (Größe oder mtime), wird sie normal
+# archiviert.
+#
+# Deshalb nur auf Wunsch ('dedup_enabled' in config.json, Standard aus): Fremde unzip-Programme
+# verlieren die Kopien aus links.json, fremde tar-Programme machen aus unabhängigen Kopien Hardlinks
+# (eine Änderung trifft dann beide). Dazu kommt ein zusätzlicher Durchlauf mit lstat über alle Quellen.
+
+DEDUP_MIN_SIZE = 1024 # kleinere Dateien: Verweis spart kaum etwas, Hashen kostet trotzdem
+DEDUP_PAX_KEY = "BACKUPTOOL.dedup"
+METADATA_DIR = ".backuptool/"
+LINKS_MEMBER = METADATA_DIR + "links.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+LINK_HARDLINK = "hardlink"
+LINK_COPY = "copy"
+
+
+def _walk_files(source_paths):
+    for path in source_paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, _, names in os.walk(path):
+            for name in names:
+                yield os.path.join(root, name)
+
+
+def _sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class DedupIndex:
+    """
+    Ergebnis der Analyse; link_target(path, arcname) wird vom Archivierer in Schreibreihenfolge
+    für jede reguläre Datei aufgerufen.
+    """
+
+    def __init__(self):
+        self._entries = {} # Pfad -> (inode_key, content_key, size, mtime_ns)
+        self._first = {} # Schlüssel -> arcname der zuerst archivierten Datei
+        self.duplicate_files = 0
+        self.duplicate_bytes = 0
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+
+    @classmethod
+    def build(cls, source_paths, min_size=DEDUP_MIN_SIZE):
+        index = cls()
+        by_size = {}
+        for path in _walk_files(source_paths):
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            inode_key = ("inode", st.st_dev, st.st_ino) if st.st_nlink > 1 else None
+            index._entries[path] = (inode_key, None, st.st_size, st.st_mtime_ns)
+            if st.st_size >= min_size:
+                by_size.setdefault(st.st_size, []).append(path)
+
+        for size, paths in by_size.items():
+            if len(paths) < 2:
+                continue
+            digests = {} # Inode -> Hash: Hardlinks derselben Datei nur einmal lesen
+            for path in paths:
+                inode_key = index._entries[path][0]
+                try:
+                    digest = digests.get(inode_key) if inode_key else None
+                    if digest is None:
+                        digest = _sha256(path)
+                        index.files_hashed += 1
+                        index.bytes_hashed += size
+                        if inode_key:
+                            digests[inode_key] = digest
+                except OSError:
+                    continue
+                entry = index._entries[path]
+                index._entries[path] = (entry[0], ("sha256", size, digest), entry[2], entry[3])
+
+        # Statistik: jede Datei außer der ersten ihres Inhalts/ihrer Inode ist ein Duplikat
+        inodes_seen = set()
+        contents_seen = set()
+        for inode_key, content_key, size, _ in index._entries.values():
+            if (inode_key and inode_key in inodes_seen) or (content_key and content_key in contents_seen):
+                index.duplicate_files += 1
+                index.duplicate_bytes += size
+            if inode_key:
+                inodes_seen.add(inode_key)
+            if content_key:
+                contents_seen.add(content_key)
+
+        # Nur Pfade behalten, die überhaupt einen Verweis bekommen können
+        index._entries = {path: entry for path, entry in index._entries.items() if entry[0] or entry[1]}
+        return index
+
+    def link_target(self, path, arcname):
+        """
+        Gibt (arcname_des_originals, LINK_HARDLINK|LINK_COPY) zurück, wenn path nur als Verweis
+        archiviert werden muss, sonst None (und merkt sich arcname als Original).
+        """
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        inode_key, content_key, size, mtime_ns = entry
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+        if st.st_size != size or st.st_mtime_ns != mtime_ns:
+            return None # seit der Analyse geändert
+
+        result = None
+        if inode_key and inode_key in self._first:
+            result = (self._first[inode_key], LINK_HARDLINK)
+        elif content_key and content_key in self._first:
+            result = (self._first[content_key], LINK_COPY)
+        for key in (inode_key, content_key):
+            if key and key not in self._first:
+                self._first[key] = arcname
+        return result
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+# ====================================================================================================
+# EVENT BUS
+# ====================================================================================================
+#
+# Backup-Threads melden Fortschritt über einen EventBus statt für jede Datei einen formatierten
+# String in die GUI zu schicken. publish() ist billig (Lock + Zähler/Deque); der Konsument holt sich
+# in festen Abständen (z.B. 10 Hz) mit drain() einen zusammengefassten EventBatch ab. Log-Zeilen
+# landen zusätzlich in einem begrenzten Ringpuffer (history), den die Log-Ansicht darstellt.
+
+@dataclass(frozen=True)
+class LogEvent:
+    message: str
+    level: str = "INFO"
+    timestamp: float = field(default_factory=time.time)
+
+    def format(self):
+        stamp = time.strftime("[%Y-%m-%d %H:%M:%S]", time.localtime(self.timestamp))
+        return f"{stamp} [{self.level}] {self.message}"
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    percentage: float
+    stage: str = ""
+
+
+@dataclass(frozen=True)
+class FileArchivedEvent:
+    path: str
+    size: int = 0
+
+
+@dataclass
+class EventBatch:
+    """Alles, was seit dem letzten drain() passiert ist, zusammengefasst."""
+    log_events: List[LogEvent]
+    files_archived: int
+    bytes_archived: int
+    total_files_archived: int
+    total_bytes_archived: int
+    last_file: Optional[str]
+    percentage: Optional[float]
+    stage: Optional[str]
+    dropped_log_events: int
+
+
+class EventBus:
+    """Thread-sicherer Sammelpunkt für Fortschritts- und Log-Events mit gedrosselter Auslieferung."""
+
+    def __init__(self, history_size=5000, max_pending_log_events=10000):
+        self.history = deque(maxlen=history_size) # Ringpuffer für die Log-Ansicht
+        self._pending_logs = deque(maxlen=max_pending_log_events)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._files = 0
+        self._bytes = 0
+        self._total_files = 0
+        self._total_bytes = 0
+        self._last_file = None
+        self._percentage = None
+        self._stage = None
+
+    def publish(self, event):
+        with self._lock:
+            if isinstance(event, FileArchivedEvent):
+                self._files += 1
+                self._bytes += event.size
+                self._total_files += 1
+                self._total_bytes += event.size
+                self._last_file = event.path
+            elif isinstance(event, ProgressEvent):
+                self._percentage = event.percentage
+                if event.stage:
+                    self._stage = event.stage
+            elif isinstance(event, LogEvent):
+                if len(self._pending_logs) == self._pending_logs.maxlen:
+                    self._dropped += 1
+                self._pending_logs.append(event)
+                self.history.append(event)
+
+    def log(self, message, percentage=None, level="INFO"):
+        """Adapter mit der Signatur der bisherigen progress_callback-Funktionen."""
+        self.publish(LogEvent(str(message), level))
+        if percentage is not None:
+            self.publish(ProgressEvent(percentage))
+
+    def file_archived(self, path, size=0):
+        self.publish(FileArchivedEvent(path, size))
+
+    def reset_counters(self):
+        with self._lock:
+            self._files = self._bytes = self._total_files = self._total_bytes = 0
+            self._last_file = self._percentage = self._stage = None
+
+    def history_snapshot(self):
+        with self._lock:
+            return list(self.history)
+
+    def drain(self):
+        """Gibt einen EventBatch zurück oder None, wenn seit dem letzten Aufruf nichts passiert ist."""
+        with self._lock:
+            if not self._pending_logs and not self._files and self._percentage is None and not self._dropped:
+                return None
+            batch = EventBatch(
+                log_events=list(self._pending_logs),
+                files_archived=self._files,
+                bytes_archived=self._bytes,
+                total_files_archived=self._total_files,
+                total_bytes_archived=self._total_bytes,
+                last_file=self._last_file,
+                percentage=self._percentage,
+                stage=self._stage,
+                dropped_log_events=self._dropped,
+            )
+            self._pending_logs.clear()
+            self._files = self._bytes = self._dropped = 0
+            self._percentage = None
+            return batch
@@ -0,0 +1,151 @@
+"""
+Shared mapping from the saved configuration to backup_logic's parameters.
+
+Used by the command line interface (cli.py), the resident scheduler service
+(scheduler.py) and the GUI (main.py), so all three run a job with the same
+arguments. Like cli.py it does not import backup_logic, paramiko or tkinter.
+"""
+from contextlib import contextmanager
+
+from autotune import AUTO, compression_level_value, tuning_settings_from_config
+from bandwidth import limiter_from_config, mbps_to_bytes
+from change_journal import journaled_scan_from_config
+from low_impact import low_impact_from_config
+from source_fingerprint import unchanged_detector_from_config
+from config_manager import ConfigManager
+
+
+# ====================================================================
+# CONFIG -> backup_logic PARAMETERS
+# ====================================================================
+def hetzner_host_string(config):
+    """Builds the 'user@host:port' string that backup_logic.get_sftp_client expects."""
+    host = config.get('hetzner_host', '')
+    if not host:
+        return ''
+    username = config.get('hetzner_username', '')
+    port = config.get('hetzner_port', '23') or '23'
+    if username and '@' not in host:
+        host = f"{username}@{host}"
+    if ':' not in host.split('@')[-1]:
+        host = f"{host}:{port}"
+    return host
+
+
+def sftp_config_from_config(config):
+    """SFTP connection dict as used by backup_logic.perform_restore."""
+    return {
+        'host': config.get('hetzner_host', ''),
+        'port': int(config.get('hetzner_port', 23) or 23),
+        'username': config.get('hetzner_username', ''),
+        'password': config.get('hetzner_password', ''),
+    }
+
+
+def s3_destination_from_config(config):
+    """S3Destination from the 's3_*' keys, or None when the S3 destination is off (boto3 is only imported then)."""
+    if not config.get('destination_s3_enabled', False):
+        return None
+    from s3_destination import s3_destination_from_config as from_config
+
+    return from_config(config, limiter_from_config(config))
+
+
+def backup_arguments_from_config(config, source_path=None, nas_enabled=None, hetzner_enabled=None,
+                                 archive_format=None, compression_level=None, s3_enabled=None):
+    """
+    Maps the saved configuration (and optional overrides) to perform_backup's keyword arguments.
+    Passwords in 'config' are expected as returned by ConfigManager.load_config (already decrypted).
+    """
+    source_path = source_path or config.get('source_path', '')
+    if nas_enabled is None:
+        nas_enabled = config.get('destination_nas_enabled', False)
+    if hetzner_enabled is None:
+        hetzner_enabled = config.get('destination_hetzner_enabled', False)
+    s3_destination = s3_destination_from_config(config) if s3_enabled is not False else None
+    compression_level = compression_level or config.get('compression_level', 'Default')
+
+    return {
+        'source_paths': [source_path] if source_path else [],
+        'nas_path': config.get('destination_path', '') if nas_enabled else None,
+        'hetzner_host': hetzner_host_string(config) if hetzner_enabled else None,
+        'hetzner_password': config.get('hetzner_password', '') if hetzner_enabled else None,
+        'compress_type': archive_format or config.get('archive_format', 'zip'),
+        'encrypt_enabled': bool(config.get('encryption_enabled', False)),
+        'passphrase': config.get('encryption_password', ''),
+        # 'compression_level': None/Fast/Default/Best, or Auto to measure format and level on a sample
+        'compression_level': compression_level_value(compression_level),
+        'autotune': tuning_settings_from_config(config, mbps_to_bytes(config.get('bandwidth_default_mbps')))
+                    if compression_level == AUTO else None,
+        # 'compression_dictionary_enabled': train a deflate dictionary for many small similar files (zip only)
+        'compression_dictionary': bool(config.get('compression_dictionary_enabled', False)),
+        # 'low_impact_enabled': lower CPU/IO priority, drop read files from the page cache, pause under load
+        'low_impact': low_impact_from_config(config),
+        # 'file_order': walk (default), inode, physical (HDD-friendly) or type (groups similar files)
+        'file_order': config.get('file_order') or None,
+        'bandwidth': limiter_from_config(config) if hetzner_enabled else None,
+        # 'volume_size_mb' > 0 splits the archive into volumes plus a manifest
+        'volume_size': int(float(config.get('volume_size_mb', 0) or 0) * 1024 * 1024) or None,
+        'volume_workers': int(config.get('volume_upload_workers', 4) or 4),
+        # 'dedup_enabled': store hard links and identical files once (opt-in; changes the archive layout)
+        'dedup': bool(config.get('dedup_enabled', False)),
+        'verify_uploads': bool(config.get('verify_uploads', True)),
+        # read-ahead for network sources; without 'prefetch_depth' it is chosen per file system
+        'prefetch_depth': config.get('prefetch_depth'),
+        'prefetch_memory': int(float(config.get('prefetch_memory_mb', 64) or 64) * 1024 * 1024),
+        # 'shard_mode' ("per_root" or "balanced") builds several archives in parallel worker processes
+        'shard_mode': config.get('shard_mode') or None,
+        'shard_count': config.get('shard_count'),
+        'shard_workers': config.get('shard_workers'),
+        'shard_io_budget': int(float(config.get('shard_io_limit_mb', 0) or 0) * 1024 * 1024) or None,
+        # 'change_journal_enabled': pre-scan from the scheduler service's inotify journal (Linux)
+        'change_journal': journaled_scan_from_config(config, ConfigManager().app_data_dir, [source_path])
+                          if source_path else None,
+        # 'skip_unchanged': off (default), skip, or reference (upload a small pointer to the last backup)
+        'unchanged': unchanged_detector_from_config(config, ConfigManager().app_data_dir),
+        # 'destination_s3_enabled' + 's3_bucket': S3-compatible bucket, uploaded with parallel multipart parts
+        'extra_destinations': [s3_destination] if s3_destination else [],
+    }
+
+
+def export_metrics(run_metrics, config, log=None):
+    """Run metrics -> JSON history in the app data dir, plus the optional node_exporter textfile."""
+    from metrics import export_run_metrics
+
+    export_run_metrics(run_metrics, ConfigManager().app_data_dir, config.get('metrics_textfile_path'), log)
+
+
+def retention_settings_from_config(config):
+    """Retention policy dict as used by backup_logic.apply_retention_policy."""
+    return {
+        'enabled': config.get('retention_enabled', False),
+        'type': config.get('retention_type', 'count'),
+        'value': int(config.get('retention_value', 5)),
+        'unit': config.get('retention_unit', 'days'),
+        'nas': config.get('retention_nas', False),
+        'hetzner': config.get('retention_hetzner', False),
+        's3': config.get('retention_s3', False),
+    }
+
+
+# ====================================================================
+# PROFILING
+# ====================================================================
+@contextmanager
+def stage_profiler(mode, config, job, log):
+    """
+    Yields a profiling.StageProfiler (or None) for one run. `mode` comes from --profile;
+    without it the config's 'profile_mode' applies, so scheduled runs can keep sampling on.
+    """
+    mode = mode or config.get('profile_mode') or "off"
+    if mode == "off":
+        yield None
+        return
+    from profiling import StageProfiler, profile_output_dir, DEFAULT_SAMPLE_INTERVAL
+
+    profiler = StageProfiler(profile_output_dir(ConfigManager().app_data_dir, job), mode=mode,
+                             interval=float(config.get('profile_sample_interval', DEFAULT_SAMPLE_INTERVAL)))
+    try:
+        yield profiler
+    finally:
+        log(f"Profile ({mode}) written to {profiler.close()}", level="INFO")
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+
+
+# ====================================================================================================
+# ARCHIVE LISTING CACHE
+# ====================================================================================================
+#
+# "Inhalt anzeigen" muss ein Archiv herunterladen, entschlüsseln und lesen. Das Ergebnis wird im
+# App-Datenordner unter listing_cache/ abgelegt, damit das erneute Ansehen desselben Backups nichts
+# mehr überträgt:
+#
+# - Schlüssel: Ort (lokal oder user@host) + Pfad + Größe + mtime bzw. SHA256 des Archivs. Ein neu
+#   hochgeladenes Archiv unter gleichem Namen bekommt damit automatisch einen neuen Eintrag.
+# - Format:   Namen sortiert und per Front-Coding gespeichert (Länge des gemeinsamen Präfixes mit dem
+#             Vorgänger + Rest), danach zlib-komprimiert. Archivpfade teilen lange Präfixe; ein
+#             Eintrag mit 100.000 Dateien belegt typischerweise wenige hundert KB.
+# - LRU:      Jeder Treffer setzt die mtime der Cache-Datei; übersteigt der Cache max_bytes, werden
+#             die am längsten nicht benutzten Einträge gelöscht.
+#
+# Die Dateinamen verschlüsselter Archive liegen damit unverschlüsselt im App-Datenordner (wie im
+# Restore-Log). 'listing_cache_mb': 0 in config.json schaltet den Cache ab.
+
+LISTING_CACHE_DIRNAME = "listing_cache"
+DEFAULT_LISTING_CACHE_MB = 64
+ENTRY_SUFFIX = ".lst"
+FORMAT_VERSION = b"BTL1"
+
+
+def cache_key(location, path, size=None, mtime=None, sha256=None):
+    """Schlüssel eines Archivs; sha256 (falls bekannt) ersetzt Größe und mtime."""
+    identity = sha256 if sha256 else f"{size}:{int(mtime or 0)}"
+    return hashlib.sha256(f"{location}\0{path}\0{identity}".encode("utf-8")).hexdigest()
+
+
+def encode_listing(names):
+    """Sortiert und front-codiert die Namen und komprimiert sie."""
+    lines = []
+    previous = ""
+    for name in sorted(names):
+        common = 0
+        limit = min(len(name), len(previous))
+        while common < limit and name[common] == previous[common]:
+            common += 1
+        lines.append(f"{common}\0{name[common:]}")
+        previous = name
+    return FORMAT_VERSION + zlib.compress("\0".join(lines).encode("utf-8"), 9)
+
+
+def decode_listing(data):
+    if not data.startswith(FORMAT_VERSION):
+        raise ValueError("Unknown listing cache format.")
+    text = zlib.decompress(data[len(FORMAT_VERSION):]).decode("utf-8")
+    if not text:
+        return []
+    fields = text.split("\0")
+    names = []
+    previous = ""
+    for common, rest in zip(fields[0::2], fields[1::2]):
+        previous = previous[:int(common)] + rest
+        names.append(previous)
+    return names
+
+
+class ListingCache:
+    """Größenbegrenzter LRU-Cache für Archiv-Inhaltslisten (thread-sicher, ein Eintrag pro Datei)."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_LISTING_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Gibt die gespeicherte Liste zurück oder None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                names = decode_listing(f.read())
+            os.utime(path) # zuletzt benutzt
+            return names
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error, UnicodeDecodeError):
+            self.discard(key) # beschädigter Eintrag: neu erzeugen lassen
+            return None
+
+    def put(self, key, names):
+        data = encode_listing(names)
+        if len(data) > self.max_bytes:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def discard(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Löscht die am längsten nicht benutzten Einträge, bis der Cache unter max_bytes liegt."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+def listing_cache_from_config(config, app_data_dir):
+    """ListingCache unter app_data_dir oder None, wenn 'listing_cache_mb' 0 ist."""
+    max_mb = config.get('listing_cache_mb', DEFAULT_LISTING_CACHE_MB)
+    if not max_mb:
+        return None
+    return ListingCache(os.path.join(app_data_dir, LISTING_CACHE_DIRNAME), int(max_mb * 1024 * 1024))
@@ -0,0 +1,79 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+LEVEL_COLORS = {
+    "INFO": "white",
+    "WARNING": "yellow",
+    "ERROR": "red",
+    "DEBUG": "lightgray",
+}
+
+
+class VirtualLogView(ttk.Frame):
+    """
+    Virtualized log view: the Text widget only ever holds the visible window of lines.
+    The lines themselves live in a bounded ring buffer (EventBus.history); the scrollbar
+    maps onto that buffer, so a million log lines cost no more than a screenful.
+    """
+
+    def __init__(self, parent, line_source, height=10, **text_options):
+        super().__init__(parent)
+        self.line_source = line_source # callable returning a list of LogEvent
+        self.visible_lines = height
+        self.top = 0
+        self.follow_tail = True
+        self._lines = []
+
+        self.text = tk.Text(self, height=height, state="disabled", wrap="none", **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.text.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        for level, color in LEVEL_COLORS.items():
+            self.text.tag_configure(level, foreground=color)
+
+        self.text.bind("<MouseWheel>", self._on_mousewheel)
+        self.text.bind("<Button-4>", lambda event: self._scroll_by(-3)) # X11 wheel up
+        self.text.bind("<Button-5>", lambda event: self._scroll_by(3)) # X11 wheel down
+
+    def refresh(self):
+        """Re-reads the ring buffer and redraws the visible window (call after new events arrived)."""
+        self._lines = self.line_source()
+        if self.follow_tail:
+            self.top = max(0, len(self._lines) - self.visible_lines)
+        self._render()
+
+    def _render(self):
+        total = len(self._lines)
+        self.top = max(0, min(self.top, total - self.visible_lines))
+        window = self._lines[self.top:self.top + self.visible_lines]
+
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        for event in window:
+            self.text.insert(tk.END, event.format() + "\n", event.level)
+        self.text.config(state="disabled")
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.visible_lines) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _scroll_by(self, lines):
+        self.top += lines
+        self.follow_tail = self.top + self.visible_lines >= len(self._lines)
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.top = int(float(amount) * len(self._lines))
+            self.follow_tail = self.top + self.visible_lines >= len(self._lines)
+            self._render()
+        elif action == "scroll":
+            step = self.visible_lines if unit == "pages" else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_mousewheel(self, event):
+        self._scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
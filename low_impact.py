@@ -0,0 +1,227 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+# ====================================================================================================
+# LOW-IMPACT I/O MODE
+# ====================================================================================================
+#
+# Ein nächtliches Backup liest jede Datei einmal und verdrängt dabei den Page-Cache, den z.B. eine
+# Datenbank am nächsten Morgen wieder braucht. Im Low-Impact-Modus:
+#
+# - Page-Cache: jede Datei wird mit POSIX_FADV_NOREUSE geöffnet und nach dem Lesen mit
+#   POSIX_FADV_DONTNEED freigegeben (release_cache). Seiten, die schon vorher im Cache lagen und
+#   von anderen Prozessen benutzt werden, verwirft der Kernel dabei nur, wenn sie sauber sind;
+#   das Backup selbst hinterlässt keine Seiten mehr. Ohne posix_fadvise (Windows, macOS) ohne Wirkung.
+# - Priorität: lower_priority senkt CPU- (nice) und I/O-Priorität (ioprio_set, Klasse idle bzw.
+#   best-effort 7) des aufrufenden Threads. Unter Linux gelten beide pro Thread und werden an neue
+#   Threads vererbt - die Thread-Pools von ZIP-Writer, Prefetch und Upload laufen also ebenso
+#   niedrig, der GUI-Thread nicht. Unter Windows: THREAD_MODE_BACKGROUND_BEGIN (CPU und I/O).
+#   Eine gesenkte nice-Stufe lässt sich ohne Rechte nicht wieder anheben; perform_backup läuft
+#   deshalb in einem eigenen Thread (GUI, Scheduler) oder als eigener Prozess (CLI).
+# - Last-Drosselung: LoadThrottle hängt am Fortschritt des Archivierens und pausiert, solange die
+#   Load pro CPU über max_load oder der iowait-Anteil über max_iowait liegt (höchstens
+#   MAX_PAUSE_SECONDS am Stück, damit das Backup nie ganz stehen bleibt). Das Backup trägt selbst
+#   zur Last bei; die Schwellen sollten also darüber liegen.
+
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_WHO_PROCESS = 1 # mit einer Thread-ID: nur dieser Thread
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "aarch64": 30, "i686": 289, "i386": 289, "armv7l": 314, "ppc64le": 273}
+IOPRIO_GET_SYSCALL = {"x86_64": 252, "aarch64": 31, "i686": 290, "i386": 290, "armv7l": 315, "ppc64le": 274}
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+THREAD_MODE_BACKGROUND_END = 0x00020000
+
+DEFAULT_NICE = 10
+CHECK_INTERVAL_SECONDS = 1.0
+PAUSE_STEP_SECONDS = 1.0
+MAX_PAUSE_SECONDS = 60.0
+
+
+@dataclass
+class LowImpactSettings:
+    drop_cache: bool = True
+    nice: int = DEFAULT_NICE # Erhöhung der nice-Stufe; 0 = unverändert
+    io_class: str = "idle" # "idle", "best-effort" (Stufe 7) oder "" für unverändert
+    max_load: Optional[float] = None # Load (1 min) pro CPU
+    max_iowait: Optional[float] = None # Prozent iowait seit der letzten Prüfung
+
+
+def release_cache(f, offset=0, length=0):
+    """Gibt die gelesenen Seiten von f (Dateiobjekt oder Deskriptor) im Page-Cache frei; length 0 = bis Dateiende."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(f if isinstance(f, int) else f.fileno(), offset, length, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass # z.B. Pipes oder Dateisysteme ohne fadvise
+
+
+def advise_noreuse(f):
+    """Kündigt an, dass f nur einmal gelesen wird (ab Linux 6.3 landen die Seiten nicht im aktiven Cache)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(f if isinstance(f, int) else f.fileno(), 0, 0, os.POSIX_FADV_NOREUSE)
+    except OSError:
+        pass
+
+
+def _ioprio_syscall(table):
+    machine = os.uname().machine if hasattr(os, "uname") else ""
+    return table.get(machine)
+
+
+def _set_ioprio(value):
+    import ctypes
+
+    number = _ioprio_syscall(IOPRIO_SET_SYSCALL)
+    if number is None:
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, threading.get_native_id(), value) == 0
+
+
+def _get_ioprio():
+    import ctypes
+
+    number = _ioprio_syscall(IOPRIO_GET_SYSCALL)
+    if number is None:
+        return None
+    result = ctypes.CDLL(None, use_errno=True).syscall(number, IOPRIO_WHO_PROCESS, threading.get_native_id())
+    return result if result >= 0 else None
+
+
+def lower_priority(settings, log=None):
+    """
+    Senkt CPU- und I/O-Priorität des aufrufenden Threads (und aller Threads, die er danach startet).
+    Gibt eine Funktion zurück, die den vorherigen Zustand so weit wie ohne Rechte möglich wiederherstellt.
+    """
+    log = log or (lambda message, percentage=None, level="INFO": None)
+    if sys.platform == "win32":
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN):
+            log("Could not enter background processing mode.", level="WARNING")
+            return lambda: None
+        return lambda: kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_END)
+
+    restore = []
+    tid = threading.get_native_id()
+    if settings.nice and hasattr(os, "setpriority"):
+        try:
+            previous = os.getpriority(os.PRIO_PROCESS, tid)
+            os.setpriority(os.PRIO_PROCESS, tid, min(19, previous + settings.nice))
+            restore.append(lambda: os.setpriority(os.PRIO_PROCESS, tid, previous))
+        except OSError as e:
+            log(f"Could not lower CPU priority: {e}", level="WARNING")
+    if settings.io_class and sys.platform.startswith("linux"):
+        previous_io = _get_ioprio()
+        value = (IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT if settings.io_class == "idle"
+                 else IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT | 7)
+        if _set_ioprio(value):
+            if previous_io is not None:
+                restore.append(lambda: _set_ioprio(previous_io))
+        else:
+            log("Could not lower I/O priority.", level="WARNING")
+
+    def _restore():
+        for step in reversed(restore):
+            try:
+                step()
+            except OSError:
+                pass # nice anheben braucht CAP_SYS_NICE: der Thread bleibt niedrig priorisiert
+    return _restore
+
+
+def _cpu_times():
+    """(iowait, gesamt) in Ticks aus /proc/stat oder None."""
+    try:
+        with open("/proc/stat", "r", encoding="ascii") as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    return (fields[4] if len(fields) > 4 else 0), sum(fields[:8])
+
+
+class LoadThrottle:
+    """Pausiert den Aufrufer von throttle(), solange Load oder iowait über den Schwellen liegen."""
+
+    def __init__(self, max_load=None, max_iowait=None, log=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_load = max_load
+        self.max_iowait = max_iowait
+        self.log = log
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._cpu_times = _cpu_times()
+        self.paused_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.max_load or self.max_iowait)
+
+    def _overloaded(self):
+        if self.max_load and hasattr(os, "getloadavg"):
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if load > self.max_load:
+                return f"load {load:.2f} per CPU"
+        if self.max_iowait:
+            current = _cpu_times()
+            previous, self._cpu_times = self._cpu_times, current
+            if current and previous and current[1] > previous[1]:
+                iowait = 100.0 * (current[0] - previous[0]) / (current[1] - previous[1])
+                if iowait > self.max_iowait:
+                    return f"iowait {iowait:.0f}%"
+        return None
+
+    def throttle(self, nbytes=0):
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self._clock()
+            if now < self._next_check:
+                return
+            self._next_check = now + CHECK_INTERVAL_SECONDS
+            reason = self._overloaded()
+            if reason is None:
+                return
+            if self.log:
+                self.log(f"Low-impact mode: pausing ({reason}).", level="INFO")
+            paused = 0.0
+            while reason is not None and paused < MAX_PAUSE_SECONDS:
+                self._sleep(PAUSE_STEP_SECONDS)
+                paused += PAUSE_STEP_SECONDS
+                reason = self._overloaded()
+            self.paused_seconds += paused
+
+    def wrap(self, progress):
+        """progress(nbytes) mit Drosselung davor; ohne Schwellen unverändert."""
+        if not self.enabled:
+            return progress
+
+        def _progress(nbytes):
+            self.throttle(nbytes)
+            if progress:
+                progress(nbytes)
+        return _progress
+
+
+def low_impact_from_config(config):
+    """LowImpactSettings aus config.json ('low_impact_*') oder None, wenn der Modus aus ist."""
+    if not config.get('low_impact_enabled', False):
+        return None
+    return LowImpactSettings(
+        drop_cache=bool(config.get('low_impact_drop_cache', True)),
+        nice=int(config.get('low_impact_nice', DEFAULT_NICE) or 0),
+        io_class=config.get('low_impact_io_class', "idle") or "",
+        max_load=float(config['low_impact_max_load']) if config.get('low_impact_max_load') else None,
+        max_iowait=float(config['low_impact_max_iowait']) if config.get('low_impact_max_iowait') else None,
+    )
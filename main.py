@@ -1,16 +1,34 @@
+import sys
+
+if __name__ == "__main__" and "--run-scheduled-backup" in sys.argv:
+    # Existing cron/schtasks entries call main.py directly. Hand them to the headless CLI
+    # before tkinter/ttkthemes and the GUI are imported.
+    from cli import main as cli_main
+    sys.exit(cli_main(["--verbose", "scheduled"] if "--verbose" in sys.argv else ["scheduled"]))
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import posixpath
 import threading
 import subprocess
 import platform
-import sys
-import datetime # Für Zeitstempel in Logs
 from ttkthemes import ThemedTk
 
 # Importieren Sie Ihre lokalen Module
 from backup_logic import perform_backup, perform_restore, get_archive_contents
 from config_manager import ConfigManager
+from job_config import backup_arguments_from_config, sftp_config_from_config, hetzner_host_string, export_metrics
+from bandwidth import limiter_from_config
+from events import EventBus
+from metrics import RunMetrics
+from progress import ProgressModel
+from log_view import VirtualLogView
+from listing_cache import listing_cache_from_config
+from remote_browser import RemoteBackupBrowser
+from remote_browser_view import RemoteBrowserDialog
+
+EVENT_POLL_INTERVAL_MS = 100 # GUI picks up batched progress/log events at 10 Hz
 
 class BackupToolGUI:
     def __init__(self, root):
@@ -26,6 +44,15 @@ class BackupToolGUI:
         # Ensure the application data directory exists for logs etc.
         os.makedirs(self.app_data_dir, exist_ok=True)
 
+        # Only one backup/restore at a time from the GUI (each one is CPU/IO heavy)
+        self.operation_slot = threading.BoundedSemaphore(1)
+
+        # Worker threads publish progress/log events here; the GUI drains them in batches
+        self.event_bus = EventBus(history_size=5000)
+        self.progress_model = None # set while a backup runs, read by _poll_events()
+        self.remote_browser = None # remote_browser.RemoteBackupBrowser, created on first use
+        self.log_file_path = os.path.join(self.app_data_dir, "backup_tool.log")
+
         # UI Variables for Backup Tab
         self.source_path_var = tk.StringVar()
         self.destination_path_var = tk.StringVar()
@@ -91,8 +118,12 @@ class BackupToolGUI:
         self.progress_bar = ttk.Progressbar(self.progress_frame, orient="horizontal", length=600, mode="indeterminate")
         self.progress_bar.pack(pady=5)
 
-        self.log_text = tk.Text(self.progress_frame, height=10, state="disabled", wrap="word", bg="#333", fg="#eee", font=("Consolas", 9))
-        self.log_text.pack(pady=5, fill="both", expand=True)
+        self.status_var = tk.StringVar()
+        ttk.Label(self.progress_frame, textvariable=self.status_var).pack(anchor="w")
+
+        self.log_view = VirtualLogView(self.progress_frame, self.event_bus.history_snapshot, height=10,
+                                       bg="#333", fg="#eee", font=("Consolas", 9))
+        self.log_view.pack(pady=5, fill="both", expand=True)
 
         # Apply a dark theme (requires ttkthemes)
         try:
@@ -115,6 +146,8 @@ class BackupToolGUI:
         elif platform.system() == "Windows":
             self._on_win_schedule_frequency_change(self.win_schedule_frequency_var.get())
 
+        self.root.after(EVENT_POLL_INTERVAL_MS, self._poll_events)
+
 
     def _load_config(self):
         config_data = self.config_manager.load_config()
@@ -282,7 +315,7 @@ class BackupToolGUI:
         compression_frame.pack(pady=10, fill="x", padx=5)
 
         ttk.Label(compression_frame, text="Compression Level:").grid(row=0, column=0, sticky="w", pady=5)
-        compression_menu = ttk.OptionMenu(compression_frame, self.compression_level_var, self.compression_level_var.get(), "None", "Fast", "Default", "Best")
+        compression_menu = ttk.OptionMenu(compression_frame, self.compression_level_var, self.compression_level_var.get(), "None", "Fast", "Default", "Best", "Auto")
         compression_menu.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
 
         ttk.Label(compression_frame, text="Archive Format:").grid(row=1, column=0, sticky="w", pady=5)
@@ -349,7 +382,14 @@ class BackupToolGUI:
                 messagebox.showerror("Error", "Hetzner Storage Box is enabled as a destination, but credentials are not configured in the 'Settings' tab. Please configure them first.")
                 return
 
-        self.progress_bar.start()
+        if not self.operation_slot.acquire(blocking=False):
+            messagebox.showwarning("Busy", "A backup or restore is already running. Please wait until it has finished.")
+            return
+
+        # Byte-accurate progress: perform_backup feeds the model, _poll_events() shows it
+        self.progress_model = ProgressModel()
+        self.progress_bar.config(mode="determinate", maximum=100, value=0)
+        self.event_bus.reset_counters()
         self.log_message("Starting backup process...", level="INFO")
 
         # Pass self.config_manager to the backup thread to access encrypted credentials
@@ -360,25 +400,40 @@ class BackupToolGUI:
     def _backup_thread(self, source_path, destination_path, dest_nas_enabled, dest_hetzner_enabled,
                        include_subfolders, compression_level, archive_format, config_manager_instance):
         try:
+            # Map the GUI selection onto perform_backup's parameters (shared with the CLI)
+            config = dict(config_manager_instance.get_config())
+            config['destination_path'] = destination_path
+            backup_kwargs = backup_arguments_from_config(config, source_path=source_path,
+                                                         nas_enabled=dest_nas_enabled,
+                                                         hetzner_enabled=dest_hetzner_enabled,
+                                                         archive_format=archive_format,
+                                                         compression_level=compression_level)
+
             # Perform backup using the backup_logic
-            success, message = perform_backup(
-                source_path, destination_path, dest_nas_enabled, dest_hetzner_enabled,
-                include_subfolders, compression_level, archive_format,
-                config_manager_instance, # Pass the config manager instance
-                self.log_message # Pass the logging callback
-            )
+            run_metrics = RunMetrics(job="gui")
+            success, calculated_hash, filename = perform_backup(progress_callback=self.log_message,
+                                                                event_bus=self.event_bus,
+                                                                progress_model=self.progress_model,
+                                                                metrics=run_metrics,
+                                                                **backup_kwargs)
+            export_metrics(run_metrics, config, self.log_message)
 
             self.root.after(0, self.progress_bar.stop)
             if success:
+                message = f"Backup {filename} completed successfully.\nSHA256: {calculated_hash}"
                 self.root.after(0, lambda: messagebox.showinfo("Backup Complete", message))
                 self.log_message(message, level="INFO")
             else:
+                message = "Backup failed. See the log for details."
                 self.root.after(0, lambda: messagebox.showerror("Backup Failed", message))
                 self.log_message(message, level="ERROR")
         except Exception as e:
             self.root.after(0, self.progress_bar.stop)
             self.root.after(0, lambda: messagebox.showerror("Error", f"An unexpected error occurred during backup: {e}"))
             self.log_message(f"An unexpected error occurred during backup: {e}", level="ERROR")
+        finally:
+            self.progress_model = None
+            self.operation_slot.release()
 
     # ====================================================================
     # RESTORE TAB
@@ -411,11 +466,13 @@ class BackupToolGUI:
         self.hetzner_restore_source_path_label.grid(row=1, column=0, sticky="w", pady=5)
         self.hetzner_restore_source_path_entry = ttk.Entry(self.restore_source_path_frame, textvariable=self.hetzner_restore_source_path_var, width=50)
         self.hetzner_restore_source_path_entry.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
-        # No browse button for SFTP path, as it's remote
+        self.browse_hetzner_restore_path_button = ttk.Button(self.restore_source_path_frame, text="Browse", command=self.browse_hetzner_restore_path)
+        self.browse_hetzner_restore_path_button.grid(row=1, column=2, sticky="e", pady=2)
 
         # Initially hide Hetzner specific options (will be shown by _toggle_restore_source_options)
         self.hetzner_restore_source_path_label.grid_remove()
         self.hetzner_restore_source_path_entry.grid_remove()
+        self.browse_hetzner_restore_path_button.grid_remove()
 
         # Restore Destination Path Input
         restore_destination_frame = ttk.LabelFrame(self.restore_frame, text="Restore Destination Path", padding="10")
@@ -435,8 +492,12 @@ class BackupToolGUI:
         self.overwrite_restore_var = tk.BooleanVar(value=True) # Default to overwrite
         ttk.Checkbutton(restore_options_frame, text="Overwrite existing files", variable=self.overwrite_restore_var).pack(anchor="w")
 
-        restore_button = ttk.Button(self.restore_frame, text="Start Restore", command=self.restore_backup)
-        restore_button.pack(pady=10)
+        restore_buttons_frame = ttk.Frame(self.restore_frame)
+        restore_buttons_frame.pack(pady=10)
+        view_contents_button = ttk.Button(restore_buttons_frame, text="View Contents", command=self.view_archive_contents)
+        view_contents_button.pack(side="left", padx=5)
+        restore_button = ttk.Button(restore_buttons_frame, text="Start Restore", command=self.restore_backup)
+        restore_button.pack(side="left", padx=5)
 
         # Initial call to set correct visibility based on default value or loaded config
         self._toggle_restore_source_options()
@@ -450,6 +511,7 @@ class BackupToolGUI:
             self.browse_restore_path_button.grid()
             self.hetzner_restore_source_path_label.grid_remove()
             self.hetzner_restore_source_path_entry.grid_remove()
+            self.browse_hetzner_restore_path_button.grid_remove()
             self.restore_source_path_frame.config(text="Local/NAS Source Archive Path")
         elif selected_source == "hetzner_sftp":
             self.nas_restore_source_path_label.grid_remove()
@@ -457,22 +519,75 @@ class BackupToolGUI:
             self.browse_restore_path_button.grid_remove()
             self.hetzner_restore_source_path_label.grid()
             self.hetzner_restore_source_path_entry.grid()
+            self.browse_hetzner_restore_path_button.grid()
             self.restore_source_path_frame.config(text="Hetzner SFTP Source Archive Path")
         self.restore_source_path_frame.update_idletasks() # Refresh layout
 
 
     def browse_restore_path(self):
         file_selected = filedialog.askopenfilename(
-            filetypes=[("Archive Files", "*.zip *.tar.gz *.tgz *.gz"), ("All Files", "*.*")]
+            filetypes=[("Archive Files", "*.zip *.tar.gz *.tgz *.gz *.enc *.manifest.json *.snapshot.json *.ref"), ("All Files", "*.*")]
         )
         if file_selected:
             self.restore_path_var.set(file_selected)
 
+    def browse_hetzner_restore_path(self):
+        config = self.config_manager.get_config()
+        if not config.get('hetzner_host') or not config.get('hetzner_username') or not config.get('hetzner_password'):
+            messagebox.showerror("Error", "Hetzner Storage Box credentials are not configured in the 'Settings' tab. Please configure them first.")
+            return
+        host_string = hetzner_host_string(config)
+        # One browser (worker thread, open SFTP session, listing cache) per set of credentials
+        if self.remote_browser is None or not self.remote_browser.matches(host_string, config['hetzner_username'], config['hetzner_password']):
+            if self.remote_browser is not None:
+                self.remote_browser.close()
+            self.remote_browser = RemoteBackupBrowser(host_string, config['hetzner_username'], config['hetzner_password'])
+        current = self.hetzner_restore_source_path_var.get().strip()
+        start_path = posixpath.dirname(current) if current.startswith('/') else "."
+        RemoteBrowserDialog(self.root, self.remote_browser, start_path, self.hetzner_restore_source_path_var.set)
+
     def browse_restore_destination(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
             self.restore_destination_var.set(folder_selected)
 
+    def view_archive_contents(self):
+        selected_source = self.restore_source_var.get()
+        if selected_source == "hetzner_sftp":
+            source_path = self.hetzner_restore_source_path_var.get().strip()
+        else:
+            source_path = self.restore_path_var.get()
+        if not source_path:
+            messagebox.showerror("Error", "Please select an archive first.")
+            return
+        config = self.config_manager.get_config()
+        threading.Thread(target=self._view_contents_thread, args=(selected_source, source_path, config), daemon=True).start()
+
+    def _view_contents_thread(self, selected_source, source_path, config):
+        # Runs off the GUI thread: a cache miss downloads and decrypts the whole archive
+        is_sftp = selected_source == "hetzner_sftp"
+        sftp_config = sftp_config_from_config(config)
+        contents = get_archive_contents(source_path, source_path.endswith(".enc"), config.get('encryption_password', ''),
+                                        is_sftp, hetzner_host_string(config), sftp_config['username'], sftp_config['password'],
+                                        self.log_message,
+                                        bandwidth=limiter_from_config(config) if is_sftp else None,
+                                        cache=listing_cache_from_config(config, self.app_data_dir))
+        if contents is None:
+            self.root.after(0, lambda: messagebox.showerror("Error", "Could not read the archive contents. See the log for details."))
+            return
+        self.root.after(0, lambda: self._show_contents_window(source_path, contents))
+
+    def _show_contents_window(self, source_path, contents):
+        window = tk.Toplevel(self.root)
+        window.title(f"Contents of {os.path.basename(source_path)} ({len(contents)} files)")
+        window.geometry("700x500")
+        listbox = tk.Listbox(window, activestyle="none")
+        scrollbar = ttk.Scrollbar(window, orient="vertical", command=listbox.yview)
+        listbox.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        listbox.pack(side="left", fill="both", expand=True)
+        listbox.insert("end", *sorted(contents))
+
     def restore_backup(self):
         restore_destination = self.restore_destination_var.get()
         overwrite_existing = self.overwrite_restore_var.get()
@@ -515,12 +630,8 @@ class BackupToolGUI:
                 messagebox.showerror("Error", "Hetzner Storage Box credentials are not configured in the 'Settings' tab. Please configure them first.")
                 return
             
-            sftp_config = {
-                'host': config['hetzner_host'],
-                'port': int(config.get('hetzner_port', 23)), # Use default 23 if not set
-                'username': config['hetzner_username'],
-                'password': self.config_manager.decrypt_data(config['hetzner_password'])
-            }
+            # load_config() already decrypted the password
+            sftp_config = sftp_config_from_config(config)
 
             if not source_path.startswith('/'):
                 messagebox.showwarning("Warning", "SFTP path should usually start with '/'. Please check the path.")
@@ -529,7 +640,12 @@ class BackupToolGUI:
             messagebox.showerror("Error", "Invalid restore source selected.")
             return
 
+        if not self.operation_slot.acquire(blocking=False):
+            messagebox.showwarning("Busy", "A backup or restore is already running. Please wait until it has finished.")
+            return
+
         # Start restore in a separate thread
+        self.progress_bar.config(mode="indeterminate")
         self.progress_bar.start()
         self.log_message("Starting restore process...", level="INFO")
         threading.Thread(target=self._restore_thread, args=(selected_source, source_path, restore_destination, overwrite_existing, sftp_config)).start()
@@ -537,7 +653,10 @@ class BackupToolGUI:
     def _restore_thread(self, selected_source, source_path, restore_destination, overwrite_existing, sftp_config):
         try:
             # Call perform_restore from backup_logic with all necessary parameters
-            success, message = perform_restore(selected_source, source_path, restore_destination, overwrite_existing, sftp_config, self.log_message)
+            bandwidth = limiter_from_config(self.config_manager.get_config()) if selected_source == "hetzner_sftp" else None
+            success, message = perform_restore(selected_source, source_path, restore_destination, overwrite_existing, sftp_config, self.log_message,
+                                               bandwidth=bandwidth,
+                                               passphrase=self.config_manager.get_config().get('encryption_password', ''))
             
             self.root.after(0, self.progress_bar.stop)
             if success:
@@ -550,6 +669,8 @@ class BackupToolGUI:
             self.root.after(0, self.progress_bar.stop)
             self.root.after(0, lambda: messagebox.showerror("Error", f"An unexpected error occurred during restore: {e}"))
             self.log_message(f"An unexpected error occurred during restore: {e}", level="ERROR")
+        finally:
+            self.operation_slot.release()
 
     # ====================================================================
     # SETTINGS TAB
@@ -898,8 +1019,8 @@ class BackupToolGUI:
                 messagebox.showerror("Input Error", "Custom Cron String must have 5 parts (minute hour day_of_month month day_of_week).")
                 return
 
-        # The command to run your backup tool in scheduled mode
-        script_path = os.path.abspath(__file__) # Path to this main.py file
+        # The command to run your backup tool in scheduled mode (headless CLI, no tkinter needed)
+        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
         # Use sys.executable to ensure the correct Python interpreter is used (e.g., from venv)
         python_executable = sys.executable 
         
@@ -915,7 +1036,7 @@ class BackupToolGUI:
         # Command to be added to cron
         # We redirect output (stdout and stderr) to a log file
         # Ensure paths with spaces are quoted
-        command = f'"{python_executable}" "{script_path}" --run-scheduled-backup --verbose >> "{cron_log_file}" 2>&1'
+        command = f'"{python_executable}" "{script_path}" scheduled --verbose >> "{cron_log_file}" 2>&1'
         
         # Cron job identifier comment
         job_comment = "# BackupTool_ScheduledBackup_Job"
@@ -1057,7 +1178,7 @@ class BackupToolGUI:
             return
 
         task_name = "BackupTool_ScheduledBackup"
-        script_path = os.path.abspath(__file__)
+        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
         python_executable = sys.executable
 
         # Command to be executed by the task scheduler
@@ -1068,7 +1189,7 @@ class BackupToolGUI:
         task_log_file = os.path.join(log_dir, "scheduled_backup.log")
         
         # Enclose paths with spaces in quotes
-        command = f'"{python_executable}" "{script_path}" --run-scheduled-backup --verbose >> "{task_log_file}" 2>&1'
+        command = f'"{python_executable}" "{script_path}" scheduled --verbose >> "{task_log_file}" 2>&1'
         
         # Prepare schtasks arguments
         # /TR "Task Run" - The command to execute
@@ -1195,262 +1316,44 @@ class BackupToolGUI:
     # ====================================================================
     # LOGGING
     # ====================================================================
-    def log_message(self, message, level="INFO"):
-        timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        log_entry = f"{timestamp} [{level}] {message}\n"
-
-        self.root.after(0, lambda: self._update_log_text(log_entry, level))
-
-        # Also write to a persistent log file
-        log_file_path = os.path.join(self.app_data_dir, "backup_tool.log")
-        try:
-            with open(log_file_path, "a", encoding="utf-8") as f:
-                f.write(log_entry)
-        except Exception as e:
-            print(f"Error writing to log file: {e}") # Fallback to console print
-
-    def _update_log_text(self, log_entry, level):
-        self.log_text.config(state="normal")
-        self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END) # Auto-scroll to the end
-
-        # Optional: Apply color tags
-        if level == "INFO":
-            self.log_text.tag_configure("INFO", foreground="white")
-            self.log_text.tag_add("INFO", "end-2l", "end-1c")
-        elif level == "WARNING":
-            self.log_text.tag_configure("WARNING", foreground="yellow")
-            self.log_text.tag_add("WARNING", "end-2l", "end-1c")
-        elif level == "ERROR":
-            self.log_text.tag_configure("ERROR", foreground="red")
-            self.log_text.tag_add("ERROR", "end-2l", "end-1c")
-        elif level == "DEBUG":
-            self.log_text.tag_configure("DEBUG", foreground="lightgray")
-            self.log_text.tag_add("DEBUG", "end-2l", "end-1c")
-
-        self.log_text.config(state="disabled")
+    def log_message(self, message, percentage=None, level="INFO"):
+        # Thread-safe and cheap: the event is only queued, _poll_events() displays and persists it
+        self.event_bus.log(message, percentage, level=level)
+
+    def _poll_events(self):
+        batch = self.event_bus.drain()
+        if batch:
+            if batch.log_events:
+                # Persist the whole batch with a single open/append
+                try:
+                    with open(self.log_file_path, "a", encoding="utf-8") as f:
+                        f.writelines(event.format() + "\n" for event in batch.log_events)
+                        if batch.dropped_log_events:
+                            f.write(f"[{batch.dropped_log_events} log lines dropped: GUI could not keep up]\n")
+                except Exception as e:
+                    print(f"Error writing to log file: {e}") # Fallback to console print
+                self.log_view.refresh()
+            if batch.total_files_archived:
+                status = f"Archived {batch.total_files_archived} files ({batch.total_bytes_archived / (1024 * 1024):.1f} MB)"
+                if batch.last_file:
+                    status += f" - {batch.last_file}"
+                self.status_var.set(status)
+        progress_model = self.progress_model
+        if progress_model is not None and progress_model.scan is not None:
+            snapshot = progress_model.snapshot()
+            self.progress_bar["value"] = snapshot.fraction * 100
+            self.status_var.set(snapshot.format())
+        self.root.after(EVENT_POLL_INTERVAL_MS, self._poll_events)
 
     def run(self):
         self.root.mainloop()
 
-# ====================================================================
-# SCHEDULED BACKUP EXECUTION (When script is run with --run-scheduled-backup)
-# ====================================================================
-def run_scheduled_backup():
-    """
-    Function to be called when the script is run from a scheduler.
-    It performs the backup and then the retention policy.
-    """
-    config_manager = ConfigManager()
-    config = config_manager.load_config()
-
-    if not config:
-        print("Error: Could not load configuration for scheduled backup. Exiting.")
-        return
-
-    # Create a simple logging function for CLI mode
-    def cli_log(message, level="INFO"):
-        timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        print(f"{timestamp} [{level}] {message}")
-
-    cli_log("Starting scheduled backup run...", level="INFO")
-
-    # Retrieve parameters for backup
-    source_path = config.get('source_path')
-    destination_path = config.get('destination_path')
-    dest_nas_enabled = config.get('destination_nas_enabled', False)
-    dest_hetzner_enabled = config.get('destination_hetzner_enabled', False)
-    include_subfolders = config.get('include_subfolders', True)
-    compression_level = config.get('compression_level', 'Default')
-    archive_format = config.get('archive_format', 'zip')
-
-    if not source_path or (not dest_nas_enabled and not dest_hetzner_enabled):
-        cli_log("Scheduled backup skipped: Source path not set or no destinations enabled.", level="WARNING")
-        return
-
-    if dest_nas_enabled and (not destination_path):
-        cli_log("Scheduled backup skipped: NAS/Local destination enabled but path not set.", level="WARNING")
-        return
-    
-    if dest_hetzner_enabled:
-        if not config.get('hetzner_host') or not config.get('hetzner_username') or not config.get('hetzner_password'):
-            cli_log("Scheduled backup skipped: Hetzner destination enabled but credentials not configured.", level="WARNING")
-            return
-
-
-    # Perform the backup
-    backup_success, backup_message = perform_backup(
-        source_path, destination_path, dest_nas_enabled, dest_hetzner_enabled,
-        include_subfolders, compression_level, archive_format,
-        config_manager, cli_log
-    )
-    cli_log(f"Backup result: {backup_message}", level="INFO" if backup_success else "ERROR")
-
-    # ====================================================================
-    # Apply Retention Policy after backup
-    # ====================================================================
-    retention_enabled = config.get('retention_enabled', False)
-    if retention_enabled:
-        cli_log("Applying retention policy...", level="INFO")
-        
-        retention_type = config.get('retention_type', 'count')
-        retention_value = int(config.get('retention_value', 5)) # Ensure it's an int
-        retention_unit = config.get('retention_unit', 'days') # For age-based
-        retention_nas = config.get('retention_nas', False)
-        retention_hetzner = config.get('retention_hetzner', False)
-
-        if not retention_nas and not retention_hetzner:
-            cli_log("Retention policy enabled but no destinations selected for cleanup. Skipping.", level="WARNING")
-            return
-        
-        # Determine paths to clean for NAS/Local
-        if retention_nas and destination_path:
-            cli_log(f"Applying retention to NAS/Local: {destination_path}", level="INFO")
-            try:
-                # Get list of archive files in the destination_path (assuming backups are there)
-                # You might need to refine this to only target files created by this tool
-                archive_files = [
-                    os.path.join(destination_path, f)
-                    for f in os.listdir(destination_path)
-                    if f.endswith(('.zip', '.tar.gz', '.tgz', '.gz')) # Filter for archive types
-                    # Consider adding a specific prefix if your backups have one (e.g., "BackupTool_")
-                ]
-                archive_files.sort(key=os.path.getmtime) # Sort by modification time (oldest first)
-
-                files_to_delete = []
-
-                if retention_type == "count":
-                    if len(archive_files) > retention_value:
-                        files_to_delete = archive_files[:-retention_value] # Keep the newest 'retention_value'
-                        cli_log(f"Retention (count): Found {len(files_to_delete)} old files to delete on NAS/Local.", level="INFO")
-                elif retention_type == "age":
-                    now = datetime.datetime.now()
-                    for f in archive_files:
-                        file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(f))
-                        age = now - file_mtime
-                        
-                        delete = False
-                        if retention_unit == "days" and age.days > retention_value:
-                            delete = True
-                        elif retention_unit == "weeks" and age.days / 7 > retention_value:
-                            delete = True
-                        elif retention_unit == "months" and age.days / 30.44 > retention_value: # Approximation
-                            delete = True
-                        elif retention_unit == "years" and age.days / 365.25 > retention_value: # Approximation
-                            delete = True
-                        
-                        if delete:
-                            files_to_delete.append(f)
-                    cli_log(f"Retention (age): Found {len(files_to_delete)} old files to delete on NAS/Local.", level="INFO")
-                
-                for file_to_delete in files_to_delete:
-                    try:
-                        os.remove(file_to_delete)
-                        cli_log(f"Deleted old backup: {file_to_delete}", level="INFO")
-                    except Exception as e:
-                        cli_log(f"Error deleting {file_to_delete}: {e}", level="ERROR")
-
-            except Exception as e:
-                cli_log(f"Error applying NAS/Local retention policy: {e}", level="ERROR")
-
-
-        # Determine paths to clean for Hetzner
-        if retention_hetzner:
-            cli_log(f"Applying retention to Hetzner Storage Box...", level="INFO")
-            
-            # Retrieve Hetzner credentials
-            hetzner_config = {
-                'host': config['hetzner_host'],
-                'port': int(config.get('hetzner_port', 23)),
-                'username': config['hetzner_username'],
-                'password': config_manager.decrypt_data(config['hetzner_password'])
-            }
-
-            try:
-                import paramiko
-                transport = paramiko.Transport((hetzner_config['host'], hetzner_config['port']))
-                transport.connect(username=hetzner_config['username'], password=hetzner_config['password'])
-                sftp = paramiko.SFTPClient.from_transport(transport)
-
-                # Assume backups are in the root directory or a known subdirectory
-                # You might need a setting for the remote backup folder on Hetzner
-                remote_backup_dir = "/backups" # This should ideally be configurable if not fixed
-
-                # Get list of files on SFTP server
-                sftp_files = []
-                try:
-                    for entry in sftp.listdir_attr(remote_backup_dir):
-                        if entry.filename.endswith(('.zip', '.tar.gz', '.tgz', '.gz')):
-                            sftp_files.append(os.path.join(remote_backup_dir, entry.filename))
-                except FileNotFoundError:
-                    cli_log(f"Remote directory {remote_backup_dir} not found on Hetzner. Skipping retention.", level="WARNING")
-                    return
-
-                sftp_files.sort() # Sorting alphabetically/lexicographically often works for timestamped files
-                
-                files_to_delete_sftp = []
-
-                if retention_type == "count":
-                    if len(sftp_files) > retention_value:
-                        files_to_delete_sftp = sftp_files[:-retention_value] # Keep the newest 'retention_value'
-                        cli_log(f"Retention (count): Found {len(files_to_delete_sftp)} old files to delete on Hetzner.", level="INFO")
-                elif retention_type == "age":
-                    # This is more complex for SFTP as paramiko.SFTPAttributes only has st_mtime (unix timestamp)
-                    now_timestamp = datetime.datetime.now().timestamp()
-                    for f_path in sftp_files:
-                        attrs = sftp.stat(f_path)
-                        file_mtime_timestamp = attrs.st_mtime
-                        age_seconds = now_timestamp - file_mtime_timestamp
-                        
-                        delete = False
-                        if retention_unit == "days" and age_seconds / (24 * 3600) > retention_value:
-                            delete = True
-                        elif retention_unit == "weeks" and age_seconds / (7 * 24 * 3600) > retention_value:
-                            delete = True
-                        elif retention_unit == "months" and age_seconds / (30.44 * 24 * 3600) > retention_value:
-                            delete = True
-                        elif retention_unit == "years" and age_seconds / (365.25 * 24 * 3600) > retention_value:
-                            delete = True
-                        
-                        if delete:
-                            files_to_delete_sftp.append(f_path)
-                    cli_log(f"Retention (age): Found {len(files_to_delete_sftp)} old files to delete on Hetzner.", level="INFO")
-
-                for file_to_delete in files_to_delete_sftp:
-                    try:
-                        sftp.remove(file_to_delete)
-                        cli_log(f"Deleted old Hetzner backup: {file_to_delete}", level="INFO")
-                    except Exception as e:
-                        cli_log(f"Error deleting {file_to_delete} from Hetzner: {e}", level="ERROR")
-
-            except paramiko.AuthenticationException:
-                cli_log("SFTP Authentication failed for Hetzner retention. Check username/password.", level="ERROR")
-            except paramiko.SSHException as e:
-                cli_log(f"Could not establish SFTP connection for Hetzner retention: {e}", level="ERROR")
-            except Exception as e:
-                cli_log(f"An unexpected error occurred during Hetzner retention: {e}", level="ERROR")
-            finally:
-                if 'sftp' in locals() and sftp:
-                    sftp.close()
-                if 'transport' in locals() and transport:
-                    transport.close()
-    else:
-        cli_log("Retention policy not enabled or no destinations selected.", level="INFO")
-
-    cli_log("Scheduled backup run finished.", level="INFO")
-
-
 # ====================================================================
 # MAIN EXECUTION BLOCK
 # ====================================================================
 if __name__ == "__main__":
-    if "--run-scheduled-backup" in sys.argv:
-        # This branch is executed when the script is called by cron/task scheduler
-        # We need a basic ConfigManager instance for it
-        run_scheduled_backup()
-    else:
-        # This branch is executed when the GUI is started normally
-        #root = tk.Tk()
-        root = ThemedTk() # <--- Change this line
-        app = BackupToolGUI(root)
-        app.run()
+    # Scheduled runs (--run-scheduled-backup) are dispatched to cli.py at the top of this file.
+    #root = tk.Tk()
+    root = ThemedTk() # <--- Change this line
+    app = BackupToolGUI(root)
+    app.run()
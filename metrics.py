@@ -0,0 +1,270 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional
+
+
+# ====================================================================================================
+# RUN METRICS
+# ====================================================================================================
+#
+# perform_backup misst jede Stufe (Scan, Archivieren, Schlüsselableitung, Verschlüsseln, Hash,
+# Upload je Ziel) mit Wandzeit, CPU-Zeit, Bytes rein/raus, Dateien und Wiederholungen. Nach dem Lauf
+# wird das Ergebnis als Zeile an eine JSON-Lines-Historie (metrics_history.jsonl im App-Datenordner)
+# angehängt und, wenn 'metrics_textfile_path' konfiguriert ist (Datei oder collector-Verzeichnis),
+# als Textfile für den node_exporter geschrieben.
+#
+# CPU-Zeit ist time.process_time() des ganzen Prozesses: sie enthält die Worker-Threads der Stufe
+# (z.B. die ZIP-Kompression), aber im Scheduler-Dienst auch parallel laufende Jobs.
+
+HISTORY_FILENAME = "metrics_history.jsonl"
+HISTORY_MAX_ENTRIES = 1000
+TEXTFILE_PREFIX = "backuptool"
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    files: int = 0
+    retries: int = 0
+    error: Optional[str] = None
+
+
+class RunMetrics:
+    """
+    Sammelt die Metriken eines Backup-Laufs; stage() ist ein Kontextmanager pro Stufe.
+    Mit profiler (profiling.StageProfiler) wird jede Stufe zusätzlich profiliert.
+    """
+
+    def __init__(self, job="default", profiler=None):
+        self.job = job
+        self.profiler = profiler
+        self.started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.finished_at = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.success = None
+        self.archive_name = None
+        self.compress_type = None
+        self.encrypted = False
+        self.compression_level = None # zlib-Stufe; None = Standard des Formats
+        self.compression_tuning = None # Wahl und Messwerte von autotune.tune_compression
+        self.unchanged_of = None # Quelle unverändert: Name des vorherigen Backups (skip/reference)
+        self.stages = []
+        self.verifications = [] # Ergebnisse der Prüfung hochgeladener Dateien auf dem Server
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, bytes_in=0, files=0):
+        """Misst Wand- und CPU-Zeit; Bytes/Dateien können im Block am StageMetrics-Objekt ergänzt werden."""
+        metrics = StageMetrics(name, bytes_in=bytes_in, files=files)
+        with self._lock:
+            self.stages.append(metrics)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            with self.profiler.stage(name) if self.profiler else nullcontext():
+                yield metrics
+        except Exception as e:
+            metrics.error = str(e) or e.__class__.__name__
+            raise
+        finally:
+            metrics.wall_seconds = time.perf_counter() - wall_start
+            metrics.cpu_seconds = time.process_time() - cpu_start
+
+    def get_stage(self, name):
+        for metrics in self.stages:
+            if metrics.name == name:
+                return metrics
+        return None
+
+    def add_retry(self, name):
+        metrics = self.get_stage(name)
+        if metrics is not None:
+            with self._lock:
+                metrics.retries += 1
+
+    def add_verification(self, destination, result):
+        """result: verify.VerificationResult einer hochgeladenen Datei."""
+        with self._lock:
+            self.verifications.append(dict(result.to_dict(), destination=destination))
+
+    def finish(self, success, archive_name=None):
+        self.success = bool(success)
+        self.archive_name = archive_name
+        self.finished_at = time.time()
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+
+    # --- abgeleitete Kennzahlen -------------------------------------------
+    @property
+    def source_bytes(self):
+        archive = self.get_stage("archive")
+        return archive.bytes_in if archive else 0
+
+    @property
+    def archive_bytes(self):
+        archive = self.get_stage("archive")
+        return archive.bytes_out if archive else 0
+
+    @property
+    def compression_ratio(self):
+        return self.source_bytes / self.archive_bytes if self.archive_bytes else None
+
+    @property
+    def files_per_second(self):
+        archive = self.get_stage("archive")
+        if not archive or not archive.wall_seconds:
+            return None
+        return archive.files / archive.wall_seconds
+
+    @property
+    def retries(self):
+        return sum(stage.retries for stage in self.stages)
+
+    def to_dict(self):
+        return {
+            "job": self.job,
+            "archive_name": self.archive_name,
+            "success": self.success,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "finished_at": datetime.fromtimestamp(self.finished_at).isoformat(timespec="seconds") if self.finished_at else None,
+            "compress_type": self.compress_type,
+            "encrypted": self.encrypted,
+            "compression_level": self.compression_level,
+            "compression_tuning": self.compression_tuning,
+            "unchanged_of": self.unchanged_of,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "source_bytes": self.source_bytes,
+            "archive_bytes": self.archive_bytes,
+            "compression_ratio": round(self.compression_ratio, 4) if self.compression_ratio else None,
+            "files_per_second": round(self.files_per_second, 2) if self.files_per_second else None,
+            "retries": self.retries,
+            "stages": [asdict(stage) for stage in self.stages],
+            "verifications": list(self.verifications),
+        }
+
+
+# ====================================================================================================
+# EXPORT
+# ====================================================================================================
+
+def append_history(history_path, run, max_entries=HISTORY_MAX_ENTRIES):
+    """Hängt den Lauf als JSON-Zeile an; kürzt die Datei, wenn sie deutlich über max_entries wächst."""
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run.to_dict(), sort_keys=True) + "\n")
+
+    with open(history_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) > max_entries * 1.1:
+        _atomic_write(history_path, "".join(lines[-max_entries:]))
+
+
+def load_history(history_path, job=None):
+    """Liest die Historie (älteste zuerst), optional gefiltert nach Job. Defekte Zeilen werden übersprungen."""
+    runs = []
+    if not os.path.exists(history_path):
+        return runs
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if job is None or entry.get("job") == job:
+                runs.append(entry)
+    return runs
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(run):
+    """Textformat für den node_exporter textfile collector."""
+    job = run.job
+    lines = []
+
+    def metric(name, help_text, kind, samples):
+        lines.append(f"# HELP {TEXTFILE_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {TEXTFILE_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label_value(val)}"' for key, val in [("job", job)] + labels)
+            lines.append(f"{TEXTFILE_PREFIX}_{name}{{{label_text}}} {value}")
+
+    metric("last_run_timestamp_seconds", "Start time of the last backup run.", "gauge", [([], f"{run.started_at:.0f}")])
+    metric("last_run_success", "1 if the last backup run succeeded.", "gauge", [([], int(bool(run.success)))])
+    metric("last_run_duration_seconds", "Wall time of the last backup run.", "gauge", [([], f"{run.wall_seconds:.3f}")])
+    metric("last_run_cpu_seconds", "Process CPU time of the last backup run.", "gauge", [([], f"{run.cpu_seconds:.3f}")])
+    metric("last_run_source_bytes", "Bytes read from the sources.", "gauge", [([], run.source_bytes)])
+    metric("last_run_archive_bytes", "Size of the archive before encryption.", "gauge", [([], run.archive_bytes)])
+    if run.compression_ratio:
+        metric("last_run_compression_ratio", "Source bytes divided by archive bytes.", "gauge", [([], f"{run.compression_ratio:.4f}")])
+    if run.files_per_second:
+        metric("last_run_files_per_second", "Files archived per second.", "gauge", [([], f"{run.files_per_second:.2f}")])
+
+    if run.verifications:
+        methods = sorted({entry["method"] for entry in run.verifications})
+        metric("last_run_verified_files", "Uploaded files verified on the remote side, by method.", "gauge",
+               [([("method", method)], sum(1 for entry in run.verifications if entry["method"] == method and entry["ok"]))
+                for method in methods])
+        metric("last_run_verification_failures", "Remote verifications that did not match.", "gauge",
+               [([], sum(1 for entry in run.verifications if not entry["ok"]))])
+
+    stages = [[("stage", stage.name)] for stage in run.stages]
+    metric("stage_duration_seconds", "Wall time per stage.", "gauge",
+           [(labels, f"{stage.wall_seconds:.3f}") for labels, stage in zip(stages, run.stages)])
+    metric("stage_cpu_seconds", "Process CPU time per stage.", "gauge",
+           [(labels, f"{stage.cpu_seconds:.3f}") for labels, stage in zip(stages, run.stages)])
+    metric("stage_bytes_in", "Bytes read per stage.", "gauge",
+           [(labels, stage.bytes_in) for labels, stage in zip(stages, run.stages)])
+    metric("stage_bytes_out", "Bytes written per stage.", "gauge",
+           [(labels, stage.bytes_out) for labels, stage in zip(stages, run.stages)])
+    metric("stage_retries", "Retries per stage.", "gauge",
+           [(labels, stage.retries) for labels, stage in zip(stages, run.stages)])
+    metric("stage_failed", "1 if the stage raised an error.", "gauge",
+           [(labels, int(stage.error is not None)) for labels, stage in zip(stages, run.stages)])
+    return "\n".join(lines) + "\n"
+
+
+def textfile_path_for(textfile_path, job):
+    """Ein Verzeichnis (z.B. der collector-Ordner) bekommt eine .prom-Datei pro Job."""
+    if os.path.isdir(textfile_path):
+        safe_job = re.sub(r"[^A-Za-z0-9_.-]", "_", job)
+        return os.path.join(textfile_path, f"{TEXTFILE_PREFIX}_{safe_job}.prom")
+    return textfile_path
+
+
+def write_prometheus_textfile(textfile_path, run):
+    # Der node_exporter darf nie eine halb geschriebene Datei sehen: erst temp, dann os.replace
+    _atomic_write(textfile_path_for(textfile_path, run.job), format_prometheus(run))
+
+
+def _atomic_write(path, text):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def export_run_metrics(run, app_data_dir, textfile_path=None, log=None):
+    """Schreibt Historie und (falls konfiguriert) Prometheus-Textfile; Fehler werden nur geloggt."""
+    try:
+        append_history(os.path.join(app_data_dir, HISTORY_FILENAME), run)
+        if textfile_path:
+            write_prometheus_textfile(textfile_path, run)
+    except OSError as e:
+        if log:
+            log(f"Could not write run metrics: {e}", level="WARNING")
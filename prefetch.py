@@ -0,0 +1,192 @@
+import os
+import stat
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from sparse import allocated_size
+from low_impact import advise_noreuse, release_cache
+
+
+# ====================================================================================================
+# READ-AHEAD PREFETCH
+# ====================================================================================================
+#
+# Auf NFS/SMB kostet jede Datei mehrere Round-Trips (lstat, open, read, close). Der Archivierer
+# arbeitet die Dateien nacheinander ab und wartet bei vielen kleinen Dateien fast nur auf das Netz.
+# Der Prefetcher läuft den Dateien voraus: bis zu 'depth' Dateien werden parallel auf einem
+# Thread-Pool per lstat geprüft und - wenn klein genug - vollständig gelesen. Der Archivierer
+# bekommt sie strikt in der ursprünglichen Reihenfolge; das Archiv ist also identisch.
+#
+# - Speicher: Höchstens 'max_bytes' gelesene, noch nicht archivierte Daten. Ist das Budget
+#   erschöpft, liest der Worker die Datei nicht (nur lstat) und der Archivierer liest sie selbst.
+#   Ein Worker wartet nie auf Budget, damit kann sich die Warteschlange nicht verklemmen.
+# - Große Dateien (> max_file_size) und Sparse-Dateien werden nicht vorgeladen, nur ihr lstat
+#   wärmt den Attribut-Cache des Clients.
+# - Standard: an auf Netzwerk-Dateisystemen (siehe is_network_path), sonst aus - lokal kostet der
+#   Thread-Wechsel pro Datei mehr als er spart. 'prefetch_depth' in config.json erzwingt einen Wert
+#   (0 = aus), 'prefetch_memory_mb' setzt das Speicherbudget.
+
+DEFAULT_PREFETCH_DEPTH = 32
+DEFAULT_PREFETCH_MEMORY = 64 * 1024 * 1024
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+MAX_PREFETCH_WORKERS = 64
+
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "ceph",
+                       "glusterfs", "fuse.glusterfs", "davfs", "fuse.rclone"}
+
+
+@dataclass
+class PrefetchedEntry:
+    path: str
+    arcname: str
+    st: Optional[os.stat_result] = None # None: lstat fehlgeschlagen, der Archivierer meldet den Fehler
+    data: Optional[bytes] = None # vollständiger Inhalt oder None (selbst lesen)
+
+
+def _mount_fstype(path):
+    """Dateisystemtyp des Mountpoints, unter dem path liegt (Linux, /proc/self/mounts)."""
+    try:
+        with open("/proc/self/mounts", "r", encoding="utf-8", errors="replace") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    for mount_point, mount_fstype in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        prefix = mount_point.rstrip("/") + "/"
+        if (path == mount_point or path.startswith(prefix)) and len(mount_point) > len(best):
+            best, fstype = mount_point, mount_fstype
+    return fstype
+
+
+def is_network_path(path):
+    """True, wenn path auf einem Netzwerk-Dateisystem liegt (Linux: Mount-Typ, Windows: UNC/Netzlaufwerk)."""
+    if sys.platform == "win32":
+        if path.startswith("\\\\"):
+            return True
+        import ctypes
+        drive = os.path.splitdrive(os.path.abspath(path))[0]
+        return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4 # DRIVE_REMOTE
+    fstype = _mount_fstype(path)
+    return fstype in NETWORK_FILESYSTEMS if fstype else False
+
+
+def prefetch_depth_for(source_paths, depth=None):
+    """Konfigurierte Tiefe oder - ohne Konfiguration - DEFAULT_PREFETCH_DEPTH für Netzwerkquellen, sonst 0."""
+    if depth is not None:
+        return max(0, int(depth))
+    return DEFAULT_PREFETCH_DEPTH if any(is_network_path(p) for p in source_paths if os.path.exists(p)) else 0
+
+
+class Prefetcher:
+    """
+    Iteriert über (pfad, arcname)-Paare aus entries und liefert PrefetchedEntry in derselben
+    Reihenfolge. Die Daten eines Eintrags gelten bis zum nächsten next() als belegt.
+    drop_cache gibt vorgeladene Dateien danach im Page-Cache frei (siehe low_impact.py).
+    """
+
+    def __init__(self, entries, depth=DEFAULT_PREFETCH_DEPTH, max_bytes=DEFAULT_PREFETCH_MEMORY,
+                 max_file_size=DEFAULT_MAX_FILE_SIZE, drop_cache=False):
+        self._entries = iter(entries)
+        self.drop_cache = drop_cache
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self._budget = max_bytes
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._current_size = 0
+        self._executor = ThreadPoolExecutor(max_workers=min(self.depth, MAX_PREFETCH_WORKERS),
+                                            thread_name_prefix="prefetch")
+        self.prefetched_files = 0
+        self.prefetched_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._release_current()
+        self._fill()
+        if not self._pending:
+            raise StopIteration
+        entry = self._pending.popleft().result()
+        self._current_size = len(entry.data) if entry.data is not None else 0
+        self._fill()
+        return entry
+
+    def _fill(self):
+        while len(self._pending) < self.depth:
+            try:
+                path, arcname = next(self._entries)
+            except StopIteration:
+                return
+            self._pending.append(self._executor.submit(self._load, path, arcname))
+
+    def _reserve(self, size):
+        with self._lock:
+            if size > self._budget:
+                return False
+            self._budget -= size
+            return True
+
+    def _release_current(self):
+        if self._current_size:
+            with self._lock:
+                self._budget += self._current_size
+            self._current_size = 0
+
+    def _load(self, path, arcname):
+        entry = PrefetchedEntry(path, arcname)
+        try:
+            entry.st = os.lstat(path)
+        except OSError:
+            return entry
+        st = entry.st
+        if (not stat.S_ISREG(st.st_mode) or st.st_size > self.max_file_size
+                or allocated_size(st) < st.st_size or not self._reserve(st.st_size)):
+            return entry
+        try:
+            with open(path, "rb") as f:
+                if self.drop_cache:
+                    advise_noreuse(f)
+                data = f.read(st.st_size + 1)
+                if self.drop_cache:
+                    release_cache(f)
+        except OSError:
+            data = None
+        if data is None or len(data) != st.st_size: # seit lstat geändert: Archivierer liest selbst
+            with self._lock:
+                self._budget += st.st_size
+            return entry
+        entry.data = data
+        with self._lock:
+            self.prefetched_files += 1
+            self.prefetched_bytes += len(data)
+        return entry
+
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+
+@contextmanager
+def prefetched(entries, depth, max_bytes=DEFAULT_PREFETCH_MEMORY, drop_cache=False):
+    """Prefetcher als Kontextmanager; mit depth 0 ohne Threads (PrefetchedEntry ohne st und data)."""
+    if not depth:
+        yield (PrefetchedEntry(path, arcname) for path, arcname in entries)
+        return
+    with Prefetcher(entries, depth, max_bytes, drop_cache=drop_cache) as prefetcher:
+        yield prefetcher
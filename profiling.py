@@ -0,0 +1,245 @@
+import cProfile
+import io
+import os
+import pstats
+import shutil
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# ====================================================================================================
+# PROFILING
+# ====================================================================================================
+#
+# Ein StageProfiler hängt sich an die Stufen von metrics.RunMetrics (RunMetrics(profiler=...)), so
+# dass jede Stufe von Backup und Restore einzeln profiliert wird. Zwei Modi:
+#
+# - "full":     cProfile + tracemalloc pro Stufe. Schreibt <stufe>.pstats (für pstats/snakeviz),
+#               <stufe>.txt (Top-Funktionen) und <stufe>_alloc.txt (Top-Allokationen der Stufe).
+#               cProfile sieht nur den Thread, der die Stufe ausführt (nicht die ZIP-Worker);
+#               tracemalloc verlangsamt allokationsintensiven Code deutlich.
+#               tracemalloc gilt für den ganzen Prozess: Profiler parallel laufender Jobs (Scheduler)
+#               teilen es sich über einen Referenzzähler, der letzte schaltet es wieder ab. Ab
+#               Python 3.12 kann nur ein cProfile gleichzeitig aktiv sein; eine Stufe, die gerade
+#               keinen bekommt, erhält nur den Allokationsbericht.
+# - "sampling": Ein Hintergrund-Thread nimmt alle 'interval' Sekunden die Stacks aller Threads auf.
+#               Kostet bei 20 Hz praktisch nichts und kann dauerhaft aktiv bleiben. Schreibt
+#               <stufe>.collapsed (Format von flamegraph.pl/speedscope) und <stufe>_top.txt.
+#
+# Die Berichte landen neben dem Lauf-Log im App-Datenordner unter profiles/<zeitstempel>_<job>/;
+# ältere Verzeichnisse als die letzten KEEP_PROFILE_RUNS werden gelöscht.
+
+PROFILE_MODES = ("full", "sampling")
+PROFILES_DIRNAME = "profiles"
+KEEP_PROFILE_RUNS = 20
+DEFAULT_SAMPLE_INTERVAL = 0.05
+TOP_ENTRIES = 30
+TRACEMALLOC_FRAMES = 10
+
+# Blockierte Threads (Dispatcher, Worker ohne Arbeit) stehen in diesen Funktionen; sie werden als
+# "idle" gezählt statt die Top-Liste zu füllen
+IDLE_FUNCTIONS = {"threading.py:wait", "threading.py:_wait_for_tstate_lock", "queue.py:get",
+                  "selectors.py:select", "_base.py:result", "thread.py:_worker"}
+
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False # nur selbst gestartetes tracemalloc wird wieder gestoppt
+
+
+def _acquire_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+
+def _safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+class StageProfiler:
+    """Profiliert benannte Stufen eines Laufs und schreibt die Berichte nach output_dir."""
+
+    def __init__(self, output_dir, mode="full", interval=DEFAULT_SAMPLE_INTERVAL, top=TOP_ENTRIES):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.reports = []
+        os.makedirs(output_dir, exist_ok=True)
+
+        self._samples = {} # Stufe -> Counter(collapsed stack)
+        self._idle = Counter() # Stufe -> Samples blockierter Threads
+        self._current_stage = {} # Thread-ID -> Stufe
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._sampler_stop = threading.Event()
+        self._uses_tracemalloc = False
+        if mode == "sampling":
+            self._sampler = threading.Thread(target=self._sample_loop, name="stage-sampler", daemon=True)
+            self._sampler.start()
+        else:
+            _acquire_tracemalloc()
+            self._uses_tracemalloc = True
+
+    @contextmanager
+    def stage(self, name):
+        if self.mode == "sampling":
+            thread_id = threading.get_ident()
+            with self._lock:
+                previous = self._current_stage.get(thread_id)
+                self._current_stage[thread_id] = name
+                self._samples.setdefault(name, Counter())
+            try:
+                yield
+            finally:
+                with self._lock:
+                    if previous is None:
+                        self._current_stage.pop(thread_id, None)
+                    else:
+                        self._current_stage[thread_id] = previous
+            return
+
+        profile = cProfile.Profile()
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if before is not None and hasattr(tracemalloc, "reset_peak"): # Python 3.9+
+            tracemalloc.reset_peak()
+        try:
+            profile.enable()
+        except ValueError: # Python 3.12+: ein anderer Profiler (paralleler Job, äußere Stufe) ist aktiv
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            after = tracemalloc.take_snapshot() if before is not None and tracemalloc.is_tracing() else None
+            current, peak = tracemalloc.get_traced_memory()
+            self._write_full_report(name, profile, before, after, current, peak)
+
+    # --- full mode ---------------------------------------------------------
+    def _write_full_report(self, name, profile, before, after, current, peak):
+        base = os.path.join(self.output_dir, _safe_name(name))
+        if profile is not None:
+            profile.dump_stats(base + ".pstats")
+            text = io.StringIO()
+            stats = pstats.Stats(profile, stream=text)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            stats.sort_stats("tottime").print_stats(self.top)
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+            self.reports.extend([base + ".pstats", base + ".txt"])
+        if before is None or after is None:
+            return
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        with open(base + "_alloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"Stage {name}: traced memory {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+            f.write(f"Top {self.top} allocation changes by line:\n")
+            for entry in diff[:self.top]:
+                f.write(f"{entry}\n")
+        self.reports.append(base + "_alloc.txt")
+
+    # --- sampling mode -------------------------------------------------------
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._sampler_stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                stages = dict(self._current_stage)
+            if not stages:
+                continue
+            # Threads ohne eigene Stufe (z.B. ZIP-Worker) zählen zur einzigen aktiven Stufe, falls eindeutig
+            single_stage = next(iter(set(stages.values()))) if len(set(stages.values())) == 1 else None
+            collected = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stage = stages.get(thread_id, single_stage)
+                if stage is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack[0] in IDLE_FUNCTIONS:
+                    collected.append((stage, None))
+                else:
+                    collected.append((stage, ";".join(reversed(stack))))
+            with self._lock:
+                for stage, stack in collected:
+                    if stack is None:
+                        self._idle[stage] += 1
+                    else:
+                        self._samples.setdefault(stage, Counter())[stack] += 1
+
+    def _write_sampling_reports(self):
+        for name, counter in self._samples.items():
+            if not counter:
+                continue
+            base = os.path.join(self.output_dir, _safe_name(name))
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for stack, count in counter.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            total = sum(counter.values())
+            self_counts = Counter()
+            inclusive_counts = Counter()
+            for stack, count in counter.items():
+                functions = stack.split(";")
+                self_counts[functions[-1]] += count
+                for function in set(functions):
+                    inclusive_counts[function] += count
+            with open(base + "_top.txt", "w", encoding="utf-8") as f:
+                f.write(f"Stage {name}: {total} busy samples every {self.interval * 1000:.0f} ms (all threads), "
+                        f"{self._idle[name]} idle\n\n")
+                f.write("Self (where time is spent):\n")
+                for function, count in self_counts.most_common(self.top):
+                    f.write(f"{count / total * 100:6.1f}%  {function}\n")
+                f.write("\nInclusive (function on the stack):\n")
+                for function, count in inclusive_counts.most_common(self.top):
+                    f.write(f"{count / total * 100:6.1f}%  {function}\n")
+            self.reports.extend([base + ".collapsed", base + "_top.txt"])
+
+    def close(self):
+        """Beendet den Sampler/tracemalloc und schreibt die restlichen Berichte; gibt output_dir zurück."""
+        if self._sampler:
+            self._sampler_stop.set()
+            self._sampler.join()
+            self._sampler = None
+            self._write_sampling_reports()
+        if self._uses_tracemalloc:
+            _release_tracemalloc()
+            self._uses_tracemalloc = False
+        return self.output_dir
+
+
+def profile_output_dir(app_data_dir, job):
+    """profiles/<zeitstempel>_<job> im App-Datenordner; räumt ältere Läufe auf."""
+    root = os.path.join(app_data_dir, PROFILES_DIRNAME)
+    os.makedirs(root, exist_ok=True)
+    runs = sorted(entry for entry in os.listdir(root) if os.path.isdir(os.path.join(root, entry)))
+    for old in runs[:max(0, len(runs) - KEEP_PROFILE_RUNS + 1)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(root, f"{stamp}_{_safe_name(job)}")
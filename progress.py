@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+from sparse import allocated_size
+
+
+# ====================================================================================================
+# PROGRESS MODEL
+# ====================================================================================================
+#
+# Ein Vorab-Scan zählt Dateien und Bytes der Quellen. Danach meldet jede Stufe (Archivieren,
+# Verschlüsseln, Hash, Upload je Ziel) die tatsächlich verarbeiteten Bytes. Die Stufen sind
+# unterschiedlich teuer (ein Hash ist viel schneller als ein Upload), deshalb wird jede Stufe mit
+# einem Gewicht in "Arbeitseinheiten" umgerechnet; Fortschritt, Rate und ETA beziehen sich darauf.
+# Die Größe des Archivs ist erst nach dem Archivieren bekannt, bis dahin wird mit den Quell-Bytes
+# geschätzt.
+
+STAGE_ARCHIVE = "archive"
+STAGE_ENCRYPT = "encrypt"
+STAGE_HASH = "hash"
+UPLOAD_STAGE_PREFIX = "upload:"
+
+DEFAULT_STAGE_WEIGHTS = {
+    STAGE_ARCHIVE: 1.0,
+    STAGE_ENCRYPT: 0.3,
+    STAGE_HASH: 0.1,
+    UPLOAD_STAGE_PREFIX: 1.0, # gilt für jedes Upload-Ziel
+}
+
+RATE_WINDOW_SECONDS = 10.0
+
+
+def upload_stage(destination):
+    return UPLOAD_STAGE_PREFIX + destination
+
+
+@dataclass(frozen=True)
+class ScanResult:
+    files: int
+    bytes: int
+
+
+def prescan_sources(source_paths):
+    """
+    Zählt Dateien und Bytes der Quellen (nur Metadaten, folgt keinen Symlinks).
+    Sparse-Dateien zählen mit ihren belegten Bytes, da nur diese gelesen werden.
+    """
+    files = 0
+    total = 0
+    for path in source_paths:
+        if os.path.isfile(path):
+            files += 1
+            total += allocated_size(os.stat(path))
+            continue
+        for root, _, names in os.walk(path):
+            for name in names:
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                files += 1
+                total += allocated_size(st)
+    return ScanResult(files, total)
+
+
+@dataclass(frozen=True)
+class ProgressSnapshot:
+    fraction: float
+    done_bytes: int
+    total_bytes: int
+    stage: Optional[str]
+    stage_done_bytes: int
+    stage_total_bytes: int
+    rate_bytes_per_second: float
+    eta_seconds: Optional[float]
+    elapsed_seconds: float
+
+    def format(self):
+        line = f"{self.fraction * 100:5.1f}%"
+        if self.stage:
+            line += f" {self.stage} {format_bytes(self.stage_done_bytes)}/{format_bytes(self.stage_total_bytes)}"
+        if self.rate_bytes_per_second:
+            line += f" {format_bytes(self.rate_bytes_per_second)}/s"
+        if self.eta_seconds is not None:
+            line += f" ETA {format_duration(self.eta_seconds)}"
+        return line
+
+
+class ProgressModel:
+    """Thread-sicheres, bytegenaues Fortschrittsmodell über alle Stufen eines Backups."""
+
+    def __init__(self, weights=None, clock=time.monotonic):
+        self.weights = dict(DEFAULT_STAGE_WEIGHTS, **(weights or {}))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._done = {}
+        self._order = []
+        self._stage = None
+        self._started = None
+        self._samples = deque()
+        self.scan = None
+
+    def _weight(self, stage):
+        if stage.startswith(UPLOAD_STAGE_PREFIX):
+            return self.weights.get(stage, self.weights[UPLOAD_STAGE_PREFIX])
+        return self.weights.get(stage, 1.0)
+
+    def plan(self, scan, encrypt=False, destinations=()):
+        """Legt die Stufen an; alles nach dem Archivieren wird vorerst mit den Quell-Bytes geschätzt."""
+        with self._lock:
+            self.scan = scan
+            self._order = [STAGE_ARCHIVE]
+            if encrypt:
+                self._order.append(STAGE_ENCRYPT)
+            self._order.append(STAGE_HASH)
+            self._order.extend(upload_stage(d) for d in destinations)
+            self._totals = {stage: scan.bytes for stage in self._order}
+            self._done = {stage: 0 for stage in self._order}
+            self._stage = None
+            self._started = self._clock()
+            self._samples = deque([(self._started, 0.0)])
+
+    def set_total(self, stage, total_bytes):
+        with self._lock:
+            if stage not in self._totals:
+                self._order.append(stage)
+                self._done[stage] = 0
+            self._totals[stage] = total_bytes
+
+    def set_archive_size(self, archive_bytes):
+        """Nach dem Archivieren ist die echte Größe bekannt: korrigiert alle folgenden Stufen."""
+        with self._lock:
+            for stage in self._order:
+                if stage != STAGE_ARCHIVE:
+                    self._totals[stage] = archive_bytes
+
+    def start_stage(self, stage):
+        with self._lock:
+            self._stage = stage
+
+    def advance(self, stage, nbytes):
+        with self._lock:
+            if stage not in self._done:
+                return
+            self._done[stage] += nbytes
+            self._stage = stage
+            self._sample()
+
+    def finish_stage(self, stage):
+        with self._lock:
+            if stage in self._done:
+                self._done[stage] = self._totals[stage] = max(self._done[stage], 0)
+                self._sample()
+
+    def callback(self, stage):
+        """Liefert eine Funktion(nbytes) für Code, der nur Byte-Deltas meldet."""
+        return lambda nbytes: self.advance(stage, nbytes)
+
+    def _work(self):
+        done = total = 0.0
+        for stage in self._order:
+            weight = self._weight(stage)
+            stage_total = max(self._totals[stage], self._done[stage])
+            done += weight * min(self._done[stage], stage_total)
+            total += weight * stage_total
+        return done, total
+
+    def _sample(self):
+        now = self._clock()
+        self._samples.append((now, self._work()[0]))
+        while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW_SECONDS:
+            self._samples.popleft()
+
+    def snapshot(self):
+        with self._lock:
+            now = self._clock()
+            done_work, total_work = self._work()
+            done_bytes = sum(self._done.values())
+            total_bytes = sum(max(self._totals[s], self._done[s]) for s in self._order)
+            fraction = done_work / total_work if total_work else 0.0
+
+            # Rate über ein gleitendes Fenster, in Arbeitseinheiten für die ETA und in Bytes der
+            # aktuellen Stufe für die Anzeige (MB/s sollen echte Bytes der laufenden Stufe sein).
+            rate_work = 0.0
+            rate_bytes = 0.0
+            eta = None
+            if self._samples:
+                t0, w0 = self._samples[0]
+                if now - t0 > 0:
+                    rate_work = (done_work - w0) / (now - t0)
+                    if self._stage:
+                        rate_bytes = rate_work / self._weight(self._stage)
+            if rate_work > 0:
+                eta = (total_work - done_work) / rate_work
+
+            stage = self._stage
+            return ProgressSnapshot(
+                fraction=min(fraction, 1.0),
+                done_bytes=done_bytes,
+                total_bytes=total_bytes,
+                stage=stage,
+                stage_done_bytes=self._done.get(stage, 0) if stage else 0,
+                stage_total_bytes=self._totals.get(stage, 0) if stage else 0,
+                rate_bytes_per_second=rate_bytes,
+                eta_seconds=eta,
+                elapsed_seconds=now - self._started if self._started else 0.0,
+            )
+
+
+def format_bytes(num):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(num) < 1024 or unit == "TB":
+            return f"{num:.1f} {unit}" if unit != "B" else f"{int(num)} B"
+        num /= 1024.0
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,121 @@
+import posixpath
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from backup_logic import SFTPSessionPool, parse_backup_filename, sftp_session
+
+
+# ====================================================================================================
+# REMOTE BACKUP BROWSER
+# ====================================================================================================
+#
+# Auswahl eines Backups auf dem SFTP-Server im Restore-Tab, statt den Dateinamen zu raten:
+#
+# - Pro Verzeichnis genau ein listdir_attr (Namen, Größen und Typen in einer Antwort); die Sitzung
+#   kommt aus einem SFTPSessionPool und bleibt zwischen den Aufrufen offen.
+# - Ergebnisse werden pro Verzeichnis ttl Sekunden gecacht; "Refresh" fragt erneut an.
+# - Alle Netzwerkzugriffe laufen auf einem eigenen Worker-Thread (list_async liefert ein Future);
+#   die GUI fragt das Future nur ab und blockiert nie.
+#
+# Angezeigt werden Unterverzeichnisse und Backups (wie get_backup_files_in_directory, also ohne
+# einzelne Volumes und unfertige Uploads), die neuesten zuerst.
+
+REMOTE_LISTING_TTL = 60
+REMOTE_SESSION_IDLE_TIMEOUT = 300
+
+
+@dataclass
+class RemoteEntry:
+    name: str
+    path: str
+    is_dir: bool
+    size: int = 0
+    mtime: float = 0.0
+    timestamp: Optional[datetime] = None # aus dem Dateinamen
+
+
+def _sort_key(entry):
+    # Verzeichnisse alphabetisch zuerst, danach Backups absteigend nach Zeitstempel
+    if entry.is_dir:
+        return (0, 0.0, entry.name)
+    return (1, -entry.timestamp.timestamp(), entry.name)
+
+
+class RemoteBackupBrowser:
+    """Listet Verzeichnisse auf dem SFTP-Server mit TTL-Cache und eigener, wiederverwendeter Sitzung."""
+
+    def __init__(self, sftp_host, sftp_username, sftp_password, ttl=REMOTE_LISTING_TTL, sftp_pool=None,
+                 clock=time.monotonic):
+        self.sftp_host = sftp_host
+        self.sftp_username = sftp_username
+        self.sftp_password = sftp_password
+        self.ttl = ttl
+        self._clock = clock
+        self._own_pool = sftp_pool is None
+        self._pool = sftp_pool or SFTPSessionPool(idle_timeout=REMOTE_SESSION_IDLE_TIMEOUT)
+        self._cache = {} # absoluter Pfad -> (Zeitpunkt, [RemoteEntry])
+        self._home = None # Home-Verzeichnis der Sitzung, beim ersten relativen Pfad ermittelt
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="remote-browser")
+
+    def matches(self, sftp_host, sftp_username, sftp_password):
+        return (sftp_host, sftp_username, sftp_password) == (self.sftp_host, self.sftp_username, self.sftp_password)
+
+    def list_directory(self, path, refresh=False):
+        """
+        Blockierend: gibt (absoluter_pfad, [RemoteEntry]) für path zurück, aus dem Cache, solange
+        jünger als ttl. Relative Pfade gelten ab dem Home-Verzeichnis der Sitzung.
+        """
+        path = self._absolute(posixpath.normpath(path or "."))
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and not refresh and self._clock() - cached[0] < self.ttl:
+            return path, cached[1]
+
+        with sftp_session(self.sftp_host, self.sftp_username, self.sftp_password, self._pool) as (sftp_client, _):
+            if not path.startswith("/"):
+                self._home = sftp_client.normalize(".")
+                path = self._absolute(path)
+            attributes = sftp_client.listdir_attr(path)
+        entries = []
+        for attr in attributes:
+            entry_path = posixpath.join(path, attr.filename)
+            if attr.st_mode is not None and stat.S_ISDIR(attr.st_mode):
+                if not attr.filename.startswith("."):
+                    entries.append(RemoteEntry(attr.filename, entry_path, True, mtime=attr.st_mtime or 0))
+                continue
+            timestamp = parse_backup_filename(attr.filename)
+            if timestamp is not None:
+                entries.append(RemoteEntry(attr.filename, entry_path, False, attr.st_size or 0,
+                                           attr.st_mtime or 0, timestamp))
+        entries.sort(key=_sort_key)
+        with self._lock:
+            self._cache[path] = (self._clock(), entries)
+        return path, entries
+
+    def _absolute(self, path):
+        if path.startswith("/") or self._home is None:
+            return path
+        return posixpath.normpath(posixpath.join(self._home, path))
+
+    def list_async(self, path, refresh=False):
+        """Wie list_directory, aber auf dem Worker-Thread; gibt ein concurrent.futures.Future zurück."""
+        return self._executor.submit(self.list_directory, path, refresh)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._absolute(posixpath.normpath(path)), None)
+
+    def close(self):
+        """Beendet den Worker; die Sitzungen werden nach einem laufenden Listing geschlossen."""
+        if self._own_pool:
+            self._executor.submit(self._pool.close_all)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,145 @@
+import posixpath
+import tkinter as tk
+from datetime import datetime
+from tkinter import ttk
+
+
+PAGE_SIZE = 200
+POLL_INTERVAL_MS = 50
+LOAD_MORE_THRESHOLD = 0.9 # load the next page once the view is scrolled past 90%
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class RemoteBrowserDialog(tk.Toplevel):
+    """
+    Lets the user pick a backup on the SFTP server. Listings come from a
+    remote_browser.RemoteBackupBrowser: the request runs on its worker thread, this
+    dialog only polls the future via after(), so the GUI thread never waits on the
+    network. Rows are inserted page by page as the user scrolls, which keeps large
+    directories responsive.
+    """
+
+    def __init__(self, parent, browser, start_path, on_select, page_size=PAGE_SIZE):
+        super().__init__(parent)
+        self.title("Browse Hetzner Storage Box")
+        self.geometry("700x450")
+        self.transient(parent)
+        self.browser = browser
+        self.on_select = on_select
+        self.page_size = page_size
+        self.path = posixpath.normpath(start_path or ".")
+        self._entries = []
+        self._loaded = 0
+        self._request_id = 0
+        self._rows = {} # Treeview item id -> RemoteEntry
+
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(fill="x")
+        ttk.Button(toolbar, text="Up", command=self.go_up).pack(side="left")
+        ttk.Button(toolbar, text="Refresh", command=lambda: self.navigate(self.path, refresh=True)).pack(side="left", padx=5)
+        self.path_var = tk.StringVar(value=self.path)
+        path_entry = ttk.Entry(toolbar, textvariable=self.path_var)
+        path_entry.pack(side="left", fill="x", expand=True)
+        path_entry.bind("<Return>", lambda event: self.navigate(self.path_var.get()))
+
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill="both", expand=True, padx=5)
+        self.tree = ttk.Treeview(tree_frame, columns=("date", "size"), selectmode="browse")
+        self.tree.heading("#0", text="Name")
+        self.tree.heading("date", text="Backup Time")
+        self.tree.heading("size", text="Size")
+        self.tree.column("#0", width=380)
+        self.tree.column("date", width=160)
+        self.tree.column("size", width=100, anchor="e")
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<Double-1>", self._on_double_click)
+        self.tree.bind("<Return>", self._on_double_click)
+
+        bottom = ttk.Frame(self, padding=5)
+        bottom.pack(fill="x")
+        self.status_var = tk.StringVar()
+        ttk.Label(bottom, textvariable=self.status_var).pack(side="left")
+        ttk.Button(bottom, text="Cancel", command=self.destroy).pack(side="right")
+        ttk.Button(bottom, text="Select", command=self.select_current).pack(side="right", padx=5)
+
+        self.navigate(self.path)
+
+    # --- loading -------------------------------------------------------------
+    def navigate(self, path, refresh=False):
+        self.path = posixpath.normpath(path or ".")
+        self.path_var.set(self.path)
+        self._request_id += 1 # answers for earlier directories are ignored
+        self.status_var.set(f"Loading {self.path} ...")
+        self._poll(self.browser.list_async(self.path, refresh), self._request_id)
+
+    def go_up(self):
+        if self.path != "/":
+            self.navigate(posixpath.dirname(self.path) if self.path.startswith("/") else posixpath.join(self.path, ".."))
+
+    def _poll(self, future, request_id):
+        if request_id != self._request_id or not self.winfo_exists():
+            return
+        if not future.done():
+            self.after(POLL_INTERVAL_MS, self._poll, future, request_id)
+            return
+        try:
+            self.path, entries = future.result()
+        except Exception as e:
+            self.status_var.set(f"Error: {e}")
+            return
+        self.path_var.set(self.path)
+        self.tree.delete(*self.tree.get_children())
+        self._rows.clear()
+        self._entries = entries
+        self._loaded = 0
+        self._load_next_page()
+
+    def _load_next_page(self):
+        page = self._entries[self._loaded:self._loaded + self.page_size]
+        for entry in page:
+            if entry.is_dir:
+                item = self.tree.insert("", "end", text=entry.name + "/", values=("", ""))
+            else:
+                moment = entry.timestamp or datetime.fromtimestamp(entry.mtime)
+                item = self.tree.insert("", "end", text=entry.name,
+                                        values=(f"{moment:%Y-%m-%d %H:%M:%S}", format_size(entry.size)))
+            self._rows[item] = entry
+        self._loaded += len(page)
+        backups = sum(1 for entry in self._entries if not entry.is_dir)
+        self.status_var.set(f"{backups} backups in {self.path} (showing {self._loaded} of {len(self._entries)} entries)")
+
+    def _on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= LOAD_MORE_THRESHOLD and self._loaded < len(self._entries):
+            self.after_idle(self._load_next_page)
+
+    # --- selection -----------------------------------------------------------
+    def _selected_entry(self):
+        selection = self.tree.selection()
+        return self._rows.get(selection[0]) if selection else None
+
+    def _on_double_click(self, event=None):
+        entry = self._selected_entry()
+        if entry is None:
+            return
+        if entry.is_dir:
+            self.navigate(entry.path)
+        else:
+            self.select_current()
+
+    def select_current(self):
+        entry = self._selected_entry()
+        if entry is None or entry.is_dir:
+            return
+        self.on_select(entry.path)
+        self.destroy()
@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backup_logic import COPY_BLOCK_SIZE, Destination
+from verify import VerificationResult
+
+
+# ====================================================================================================
+# S3-COMPATIBLE OBJECT STORAGE
+# ====================================================================================================
+#
+# SFTP überträgt über einen TCP-Stream; auf Leitungen mit hoher Latenz begrenzt das Fenster den
+# Durchsatz. S3 (AWS, MinIO, Wasabi, Hetzner Object Storage, ...) nimmt eine Datei dagegen in Teilen
+# über mehrere Verbindungen an:
+#
+# - Upload: Dateien bis part_size mit einem PutObject, größere als Multipart-Upload mit bis zu
+#   workers Teilen gleichzeitig, auch über parallel hochgeladene Volumes hinweg (höchstens workers
+#   Teile im Speicher). Jeder Teil trägt seinen SHA256 (ChecksumSHA256); der Server lehnt
+#   abweichende Teile ab. Das Objekt ist erst nach CompleteMultipartUpload sichtbar, ein Fehler
+#   bricht den Upload ab (keine .part-Dateien nötig).
+#   Der SHA256 der ganzen Datei landet in den Metadaten (x-amz-meta-sha256).
+# - Download (Restore, Inhaltsanzeige, Volumes): parallele Range-Requests zu je part_size direkt an
+#   ihre Stelle in der Zieldatei; danach wird gegen den SHA256 aus den Metadaten geprüft.
+# - Retention listet serverseitig (ListObjectsV2 mit Prefix und Delimiter) statt Dateien zu lesen.
+#
+# boto3 ist optional und wird erst beim ersten Zugriff importiert. endpoint_url zeigt auf
+# S3-kompatible Server; für Tests reicht ein lokaler MinIO oder moto (s3_fixture.py). Ohne
+# Zugangsdaten in der Konfiguration gilt die Standardkette von boto3 (Umgebung, ~/.aws, Profil).
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024 # S3-Minimum für alle Teile außer dem letzten
+MAX_PARTS = 10000
+DEFAULT_WORKERS = 4
+METADATA_SHA256 = "sha256"
+METHOD_S3_CHECKSUM = "s3-checksum"
+
+
+def _b64_sha256(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+
+
+def _is_not_found(error):
+    code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3Destination(Destination):
+    """Bucket (mit optionalem Prefix) auf einem S3-kompatiblen Server (siehe oben)."""
+
+    name = "s3"
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None, access_key_id=None, secret_access_key=None,
+                 profile=None, part_size=DEFAULT_PART_SIZE, workers=DEFAULT_WORKERS, bandwidth=None, client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.credentials = (access_key_id, secret_access_key)
+        self.profile = profile
+        self.part_size = max(MIN_PART_SIZE, int(part_size))
+        self.workers = max(1, int(workers))
+        self.bandwidth = bandwidth
+        self.label = f"S3 bucket {bucket}" + (f" at {endpoint_url}" if endpoint_url else "")
+        self.location = f"s3://{bucket}/{self.prefix}"
+        self._client = client
+        self._client_lock = threading.Lock()
+        # Teile über alle gleichzeitig hochgeladenen Dateien (Volumes, Shards) hinweg begrenzen
+        self._part_slots = threading.BoundedSemaphore(self.workers)
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                import boto3
+                from botocore.config import Config
+
+                session = boto3.session.Session(profile_name=self.profile) if self.profile else boto3.session.Session()
+                access_key_id, secret_access_key = self.credentials
+                self._client = session.client(
+                    "s3", endpoint_url=self.endpoint_url or None, region_name=self.region or None,
+                    aws_access_key_id=access_key_id or None, aws_secret_access_key=secret_access_key or None,
+                    # eine Verbindung je gleichzeitigem Teil, Wiederholungen übernimmt botocore
+                    config=Config(max_pool_connections=max(10, self.workers * 2),
+                                  retries={"max_attempts": 5, "mode": "standard"}))
+            return self._client
+
+    def key(self, path):
+        path = path.lstrip("/")
+        return f"{self.prefix}/{path}" if self.prefix else path
+
+    # --- Upload ---
+
+    def _throttle(self, nbytes, progress):
+        if progress:
+            progress(nbytes)
+        if self.bandwidth is not None:
+            self.bandwidth.throttle(nbytes)
+
+    def upload(self, local_path, name, progress=None, sha256=None):
+        """Lädt local_path als name hoch; gibt die Anzahl der (serverseitig geprüften) Teile zurück."""
+        size = os.path.getsize(local_path)
+        key = self.key(name)
+        metadata = {METADATA_SHA256: sha256} if sha256 else {}
+        if size <= self.part_size:
+            with open(local_path, "rb") as f:
+                data = f.read()
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ChecksumSHA256=_b64_sha256(data),
+                                   Metadata=metadata)
+            self._throttle(len(data), progress)
+            return 1
+
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        offsets = list(range(0, size, part_size))
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ChecksumAlgorithm="SHA256",
+                                                        Metadata=metadata)["UploadId"]
+
+        def upload_part(number):
+            with self._part_slots:
+                with open(local_path, "rb") as f:
+                    f.seek(offsets[number - 1])
+                    data = f.read(part_size)
+                checksum = _b64_sha256(data)
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                                   Body=data, ChecksumSHA256=checksum)
+            self._throttle(len(data), progress)
+            return {"PartNumber": number, "ETag": response["ETag"], "ChecksumSHA256": checksum}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="s3-upload") as executor:
+                parts = list(executor.map(upload_part, range(1, len(offsets) + 1)))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={"Parts": parts})
+        except BaseException:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception:
+                pass # unvollständige Uploads räumt sonst eine Lifecycle-Regel des Buckets ab
+            raise
+        return len(parts)
+
+    def uploader(self, expected_hashes=None, on_verified=None, parallel=False):
+        def put(local_path, progress):
+            name = os.path.basename(local_path)
+            expected = (expected_hashes or {}).get(name)
+            parts = self.upload(local_path, name, progress, expected)
+            if expected:
+                size = self.stat(name)[0]
+                ok = size == os.path.getsize(local_path)
+                result = VerificationResult(name, METHOD_S3_CHECKSUM, ok,
+                                            f"{parts} parts" if ok else f"remote size {size}")
+                if on_verified:
+                    on_verified(result)
+                if not ok:
+                    raise ValueError(f"Remote verification of {name} failed: {result.detail}")
+            return self.key(name)
+        return put
+
+    # --- Download ---
+
+    def download(self, path, local_path, progress=None):
+        """Lädt path mit parallelen Range-Requests nach local_path und prüft gegen den SHA256 der Metadaten."""
+        head = self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+        size = head["ContentLength"]
+        with open(local_path, "wb") as f:
+            f.truncate(size)
+
+        def fetch_range(offset):
+            end = min(size, offset + self.part_size) - 1
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key(path), Range=f"bytes={offset}-{end}")["Body"]
+            with open(local_path, "r+b") as f:
+                f.seek(offset)
+                for block in iter(lambda: body.read(COPY_BLOCK_SIZE), b""):
+                    f.write(block)
+                    self._throttle(len(block), progress)
+
+        if size:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="s3-download") as executor:
+                list(executor.map(fetch_range, range(0, size, self.part_size)))
+        expected = head.get("Metadata", {}).get(METADATA_SHA256)
+        if expected:
+            digest = hashlib.sha256()
+            with open(local_path, "rb") as f:
+                for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b""):
+                    digest.update(block)
+            if digest.hexdigest() != expected:
+                raise ValueError(f"Checksum mismatch for {path} downloaded from {self.label}")
+        return local_path
+
+    def fetch(self, path, temp_dir, progress=None):
+        return self.download(path, os.path.join(temp_dir, posixpath.basename(path)), progress), True
+
+    def read_bytes(self, path):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(path))["Body"].read()
+
+    # --- Auflistung und Löschen ---
+
+    def list_names(self):
+        prefix = self.key("") if self.prefix else ""
+        names = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            names.extend(entry["Key"][len(prefix):] for entry in page.get("Contents", []))
+        return names
+
+    def stat(self, path):
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(path) from e
+            raise
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def remove(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(path))
+
+    def remove_uploaded(self, names):
+        # Objekte entstehen erst mit dem Abschluss, halbe Uploads wurden schon abgebrochen
+        for name in names:
+            self.remove(name)
+
+
+def s3_destination_from_config(config, bandwidth=None):
+    """S3Destination aus config.json ('s3_*') oder None, wenn das Ziel aus ist."""
+    if not config.get('destination_s3_enabled', False) or not config.get('s3_bucket'):
+        return None
+    return S3Destination(
+        config['s3_bucket'],
+        prefix=config.get('s3_prefix', '') or '',
+        endpoint_url=config.get('s3_endpoint_url') or None,
+        region=config.get('s3_region') or None,
+        access_key_id=config.get('s3_access_key_id') or None,
+        secret_access_key=config.get('s3_secret_access_key') or None,
+        profile=config.get('s3_profile') or None,
+        part_size=int(float(config.get('s3_part_size_mb', DEFAULT_PART_SIZE // (1024 * 1024)) or 16) * 1024 * 1024),
+        workers=int(config.get('s3_workers', DEFAULT_WORKERS) or DEFAULT_WORKERS),
+        bandwidth=bandwidth,
+    )
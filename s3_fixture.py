@@ -0,0 +1,63 @@
+"""
+In-process S3 endpoint for benchmarks and local experiments.
+
+Runs moto's S3 server on 127.0.0.1 (pip install "moto[server]"), so the S3
+destination can be exercised end to end without a cloud account:
+
+    with LocalS3Server() as server:
+        destination = server.destination()
+        perform_backup(..., extra_destinations=[destination])
+        perform_restore("s3", "backup_....zip", dest, True, {}, log, source=destination)
+
+A real MinIO works the same way: pass its URL as endpoint_url to
+s3_destination.S3Destination (or set 's3_endpoint_url' in config.json).
+"""
+import socket
+
+from s3_destination import S3Destination
+
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class LocalS3Server:
+    """moto-S3-Server mit einem leeren Bucket; als Kontextmanager nutzbar."""
+
+    def __init__(self, bucket="backups", host="127.0.0.1", port=0, access_key_id="testing", secret_access_key="testing"):
+        self.bucket = bucket
+        self.host = host
+        self.port = port or _free_port(host)
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self._server = None
+
+    @property
+    def endpoint_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def destination(self, prefix="", **kwargs):
+        """S3Destination auf diesen Server; kwargs wie S3Destination (part_size, workers, ...)."""
+        return S3Destination(self.bucket, prefix, endpoint_url=self.endpoint_url, region="us-east-1",
+                             access_key_id=self.access_key_id, secret_access_key=self.secret_access_key, **kwargs)
+
+    def start(self):
+        from moto.server import ThreadedMotoServer
+
+        self._server = ThreadedMotoServer(ip_address=self.host, port=self.port, verbose=False)
+        self._server.start()
+        self.destination().client.create_bucket(Bucket=self.bucket)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,406 @@
+"""
+Optional resident scheduler service for BackupTool.
+
+Instead of one cold process per cron/schtasks trigger, `python cli.py daemon` keeps
+running and executes named jobs from a persistent queue:
+
+- Jobs come from the 'scheduler_jobs' list in config.json. Each job may override any
+  config key (source_path, destination_path, archive_format, ...) and defines its
+  schedule with 'frequency' (interval/daily/weekly/monthly), 'time', 'day_of_week',
+  'day_of_month' or 'interval_minutes', plus optional 'jitter_seconds' and 'catch_up'.
+  Without 'scheduler_jobs', one job named "default" is derived from the Schedule tab.
+- Queue and last/next run times are persisted in scheduler_state.json, so queued runs
+  survive a restart and runs missed while the service was down are caught up once.
+- A job never overlaps with itself: it holds a lock file that the cron path
+  (cli.py scheduled) honours as well.
+- 'scheduler_max_concurrent_jobs' caps all running jobs and
+  'scheduler_destination_limits' ({"nas": 1, "hetzner": 1, "s3": 1}) caps jobs per destination.
+- SFTP sessions and the loaded configuration/key stay warm between jobs.
+- Every run appends its stage metrics to metrics_history.jsonl; with
+  'metrics_textfile_path' set they are also written for node_exporter (see metrics.py).
+  'profile_mode' ("sampling" or "full", per job or global) profiles each run (see profiling.py).
+- With 'change_journal_enabled' (Linux) the service watches each job's source with inotify and
+  the next backup's pre-scan reads only the recorded changes (see change_journal.py).
+"""
+import json
+import os
+import platform
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+from change_journal import CHANGE_JOURNAL_DIRNAME, ChangeWatcher, journal_key
+from job_config import (backup_arguments_from_config, retention_settings_from_config, hetzner_host_string,
+                        export_metrics, stage_profiler)
+
+STATE_FILENAME = "scheduler_state.json"
+LOCK_DIRNAME = "locks"
+DAEMON_LOCK_NAME = "scheduler-daemon"
+DEFAULT_JOB_NAME = "default"
+STALE_LOCK_SECONDS = 24 * 3600 # Windows: Sperren ohne prüfbaren Prozess gelten nach 24 h als verwaist
+
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+
+# ====================================================================
+# LOCK FILES
+# ====================================================================
+def _pid_alive(pid):
+    if platform.system() == "Windows":
+        return True # os.kill would terminate the process on Windows; rely on the lock age instead
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobLock:
+    """Exclusive lock file (O_EXCL) holding the owner's PID; stale locks of dead processes are taken over."""
+
+    def __init__(self, lock_dir, name):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.path = os.path.join(lock_dir, f"{name}.lock")
+        self.acquired = False
+
+    def _is_stale(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                pid = int(f.read().strip() or 0)
+            age = time.time() - os.path.getmtime(self.path)
+        except (OSError, ValueError):
+            return True
+        return not _pid_alive(pid) or (platform.system() == "Windows" and age > STALE_LOCK_SECONDS)
+
+    def acquire(self):
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._is_stale():
+                    return False
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str(os.getpid()))
+            self.acquired = True
+            return True
+        return False
+
+    def release(self):
+        if self.acquired:
+            self.acquired = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def job_lock(app_data_dir, job_name):
+    return JobLock(os.path.join(app_data_dir, LOCK_DIRNAME), job_name)
+
+
+# ====================================================================
+# JOBS & SCHEDULES
+# ====================================================================
+def load_jobs(config):
+    """Returns {name: job_dict}. Falls back to a single job built from the Schedule tab settings."""
+    jobs = {}
+    for job in config.get('scheduler_jobs', []):
+        if job.get('name'):
+            jobs[job['name']] = dict(job)
+    if not jobs:
+        jobs[DEFAULT_JOB_NAME] = {
+            'name': DEFAULT_JOB_NAME,
+            'frequency': config.get('schedule_frequency', 'daily'),
+            'time': config.get('schedule_time', '03:00'),
+            'day_of_week': config.get('schedule_day_of_week', 'Mon'),
+            'day_of_month': config.get('schedule_day_of_month', '1'),
+        }
+    return jobs
+
+
+def job_config(config, job):
+    """The global configuration with the job's overrides applied."""
+    merged = dict(config)
+    for key, value in job.items():
+        if key not in ('name', 'frequency', 'time', 'day_of_week', 'day_of_month',
+                       'interval_minutes', 'jitter_seconds', 'catch_up'):
+            merged[key] = value
+    return merged
+
+
+def job_destinations(merged_config):
+    """Destination keys used for the per-destination concurrency limits."""
+    destinations = []
+    if merged_config.get('destination_nas_enabled') and merged_config.get('destination_path'):
+        destinations.append(("nas", os.path.normcase(os.path.abspath(merged_config['destination_path']))))
+    if merged_config.get('destination_hetzner_enabled') and merged_config.get('hetzner_host'):
+        destinations.append(("hetzner", hetzner_host_string(merged_config)))
+    if merged_config.get('destination_s3_enabled') and merged_config.get('s3_bucket'):
+        destinations.append(("s3", f"{merged_config.get('s3_endpoint_url') or ''}/{merged_config['s3_bucket']}"))
+    return destinations
+
+
+def compute_next_run(job, after):
+    """Next scheduled time strictly after 'after' (without jitter)."""
+    frequency = str(job.get('frequency', 'daily')).lower()
+    if frequency == 'interval':
+        return after + timedelta(minutes=max(1, int(job.get('interval_minutes', 60))))
+
+    hour, minute = map(int, str(job.get('time', '03:00')).split(':'))
+    candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    if frequency == 'weekly':
+        weekday = WEEKDAYS.get(str(job.get('day_of_week', 'Mon'))[:3].lower(), 0)
+        candidate += timedelta(days=(weekday - candidate.weekday()) % 7)
+        if candidate <= after:
+            candidate += timedelta(days=7)
+    elif frequency == 'monthly':
+        day = max(1, min(31, int(job.get('day_of_month', 1))))
+        year, month = candidate.year, candidate.month
+        while True:
+            # Clamp to the last day of shorter months
+            next_month = datetime(year + month // 12, month % 12 + 1, 1)
+            last_day = (next_month - timedelta(days=1)).day
+            candidate = candidate.replace(year=year, month=month, day=min(day, last_day))
+            if candidate > after:
+                break
+            year, month = next_month.year, next_month.month
+    else: # daily (and unknown values, e.g. "custom" cron strings)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+    return candidate
+
+
+def _with_jitter(job, when):
+    jitter_seconds = float(job.get('jitter_seconds', 0) or 0)
+    return when + timedelta(seconds=random.uniform(0, jitter_seconds)) if jitter_seconds > 0 else when
+
+
+# ====================================================================
+# DAEMON
+# ====================================================================
+class SchedulerDaemon:
+    def __init__(self, config_manager, log, tick_seconds=15):
+        self.config_manager = config_manager
+        self.log = log
+        self.tick_seconds = tick_seconds
+        self.app_data_dir = config_manager.app_data_dir
+        self.state_path = os.path.join(self.app_data_dir, STATE_FILENAME)
+        self.state = {'jobs': {}, 'queue': []}
+        self.state_lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.running = {} # job name -> thread
+        self.destination_usage = {} # (kind, target) -> running job count
+        self.sftp_pool = None
+        self.watchers = {} # journal key -> change_journal.ChangeWatcher
+
+    # --- persistent state ---------------------------------------------
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.log(f"Could not read scheduler state, starting fresh: {e}", level="WARNING")
+        self.state.setdefault('jobs', {})
+        self.state.setdefault('queue', [])
+        # Runs that were in progress when the service stopped are re-queued
+        for entry in self.state['queue']:
+            entry.pop('started_at', None)
+
+    def _save_state(self):
+        with self.state_lock:
+            temp_path = self.state_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=4)
+            os.replace(temp_path, self.state_path)
+
+    def _enqueue(self, job_name, reason):
+        with self.state_lock:
+            if any(entry['job'] == job_name for entry in self.state['queue']):
+                self.log(f"[{job_name}] Already queued or running; not queueing again ({reason}).", level="DEBUG")
+                return
+            self.state['queue'].append({'job': job_name, 'reason': reason,
+                                        'enqueued_at': datetime.now().isoformat(timespec="seconds")})
+        self.log(f"[{job_name}] Queued ({reason}).", level="INFO")
+
+    # --- scheduling ---------------------------------------------------
+    def _schedule_jobs(self, jobs, now, startup=False):
+        with self.state_lock:
+            for name, job in jobs.items():
+                job_state = self.state['jobs'].setdefault(name, {})
+                next_run = job_state.get('next_run')
+                if next_run is None:
+                    job_state['next_run'] = _with_jitter(job, compute_next_run(job, now)).isoformat(timespec="seconds")
+                    continue
+                if datetime.fromisoformat(next_run) <= now:
+                    missed = startup and job.get('catch_up', True)
+                    if not startup or missed:
+                        self._enqueue(name, "catch-up" if startup else "schedule")
+                    job_state['next_run'] = _with_jitter(job, compute_next_run(job, now)).isoformat(timespec="seconds")
+            # Drop queue entries of jobs that no longer exist
+            self.state['queue'] = [entry for entry in self.state['queue'] if entry['job'] in jobs]
+        self._save_state()
+
+    def _destination_limit(self, config, kind):
+        limits = config.get('scheduler_destination_limits', {})
+        return int(limits.get(kind, limits.get('default', 1)))
+
+    def _dispatch(self, config, jobs):
+        max_jobs = int(config.get('scheduler_max_concurrent_jobs', 2))
+        with self.state_lock:
+            for entry in self.state['queue']:
+                if len(self.running) >= max_jobs:
+                    return
+                name = entry['job']
+                if 'started_at' in entry or name in self.running:
+                    continue # never overlap a job with itself
+                merged = job_config(config, jobs[name])
+                destinations = job_destinations(merged)
+                if any(self.destination_usage.get(dest, 0) >= self._destination_limit(config, dest[0])
+                       for dest in destinations):
+                    continue
+                for dest in destinations:
+                    self.destination_usage[dest] = self.destination_usage.get(dest, 0) + 1
+                entry['started_at'] = datetime.now().isoformat(timespec="seconds")
+                thread = threading.Thread(target=self._run_job, args=(name, merged, destinations),
+                                          name=f"job-{name}", daemon=True)
+                self.running[name] = thread
+                thread.start()
+        self._save_state()
+
+    def _run_job(self, name, merged_config, destinations):
+        from backup_logic import perform_backup, apply_retention_policy
+        from metrics import RunMetrics
+
+        def job_log(message, percentage=None, level="INFO"):
+            self.log(f"[{name}] {message}", percentage, level=level)
+
+        result = "failed"
+        try:
+            with job_lock(self.app_data_dir, name) as lock:
+                if not lock.acquire():
+                    job_log("Another run of this job holds the lock; skipping.", level="WARNING")
+                    result = "skipped"
+                    return
+                kwargs = backup_arguments_from_config(merged_config)
+                if not kwargs['source_paths'] or (not kwargs['nas_path'] and not kwargs['hetzner_host']
+                                                   and not kwargs['extra_destinations']):
+                    job_log("No source or destination configured; skipping.", level="WARNING")
+                    result = "skipped"
+                    return
+                with stage_profiler(None, merged_config, name, job_log) as profiler:
+                    run_metrics = RunMetrics(job=name, profiler=profiler)
+                    success, calculated_hash, filename = perform_backup(progress_callback=job_log,
+                                                                        sftp_pool=self.sftp_pool,
+                                                                        metrics=run_metrics, **kwargs)
+                export_metrics(run_metrics, merged_config, job_log)
+                if success and merged_config.get('retention_enabled', False):
+                    success = apply_retention_policy(retention_settings_from_config(merged_config),
+                                                     merged_config.get('destination_path', ''),
+                                                     kwargs['hetzner_host'], kwargs['hetzner_password'],
+                                                     job_log, sftp_pool=self.sftp_pool,
+                                                     extra_destinations=kwargs['extra_destinations'])
+                result = "success" if success else "failed"
+                if filename:
+                    job_log(f"Backup {filename} finished: {result}. SHA256: {calculated_hash}", level="INFO")
+        except Exception as e:
+            job_log(f"An unexpected error occurred: {e}", level="ERROR")
+        finally:
+            with self.state_lock:
+                job_state = self.state['jobs'].setdefault(name, {})
+                job_state['last_run'] = datetime.now().isoformat(timespec="seconds")
+                job_state['last_result'] = result
+                self.state['queue'] = [entry for entry in self.state['queue'] if entry['job'] != name]
+                for dest in destinations:
+                    self.destination_usage[dest] -= 1
+                self.running.pop(name, None)
+            self._save_state()
+
+    # --- change journal -----------------------------------------------
+    def _sync_watchers(self, config, jobs):
+        """Starts a change journal watcher per watched source and stops the ones no longer configured."""
+        wanted = {}
+        for job in jobs.values():
+            merged = job_config(config, job)
+            if merged.get('change_journal_enabled', False) and merged.get('source_path'):
+                wanted[journal_key([merged['source_path']])] = merged['source_path']
+        for key in set(self.watchers) - set(wanted):
+            self.watchers.pop(key).stop()
+        for key, source_path in wanted.items():
+            if key in self.watchers:
+                continue
+            watcher = ChangeWatcher([source_path], os.path.join(self.app_data_dir, CHANGE_JOURNAL_DIRNAME), self.log)
+            if watcher.start():
+                self.watchers[key] = watcher
+            else:
+                self.log(f"Change journal not available for {source_path} (needs Linux inotify and a directory); "
+                         "backups use full scans.", level="WARNING")
+                self.watchers[key] = watcher # not retried on every tick
+
+    # --- main loop ----------------------------------------------------
+    def stop(self, *_):
+        self.stop_event.set()
+
+    def run(self, once=False):
+        """Runs until stopped (SIGINT/SIGTERM). With once=True: catch up, run queued jobs, exit."""
+        from backup_logic import SFTPSessionPool
+
+        daemon_lock = job_lock(self.app_data_dir, DAEMON_LOCK_NAME)
+        if not daemon_lock.acquire():
+            self.log("Another scheduler service is already running.", level="ERROR")
+            return 1
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        self.sftp_pool = SFTPSessionPool()
+        try:
+            self._load_state()
+            config = self.config_manager.load_config()
+            jobs = load_jobs(config)
+            self._schedule_jobs(jobs, datetime.now(), startup=True)
+            if not once: # a journal only helps while the service keeps running between backups
+                self._sync_watchers(config, jobs)
+            self.log(f"Scheduler started with jobs: {', '.join(sorted(jobs))}", level="INFO")
+
+            while not self.stop_event.is_set():
+                self._dispatch(config, jobs)
+                if once:
+                    if not self.running and not self.state['queue']:
+                        break
+                else:
+                    self.sftp_pool.prune()
+                self.stop_event.wait(1 if once else self.tick_seconds)
+                if not once:
+                    # Pick up configuration changes made in the GUI between ticks
+                    config = self.config_manager.load_config()
+                    jobs = load_jobs(config)
+                    self._schedule_jobs(jobs, datetime.now())
+                    self._sync_watchers(config, jobs)
+
+            for thread in list(self.running.values()):
+                thread.join()
+            self.log("Scheduler stopped.", level="INFO")
+            return 0
+        finally:
+            for watcher in self.watchers.values():
+                watcher.stop()
+            self.sftp_pool.close_all()
+            daemon_lock.release()
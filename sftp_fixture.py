@@ -0,0 +1,268 @@
+"""
+In-process SFTP server for benchmarks and local experiments.
+
+Serves a local directory over SFTP with paramiko's server classes, so
+perform_backup/perform_restore/apply_retention_policy can be exercised end to
+end without a Hetzner Storage Box:
+
+    with LocalSFTPServer("/tmp/remote") as server:
+        perform_backup(..., hetzner_host=server.host_string, hetzner_password=server.password, ...)
+        perform_restore("hetzner_sftp", "/backup_....zip", dest, True, server.sftp_config, log)
+
+Remote paths are resolved inside the served root ("/" and "." both map to it).
+Like a Storage Box, the server also accepts "sha256sum <file>" on an exec
+channel (disable with allow_exec=False to exercise clients' fallbacks).
+"""
+import hashlib
+import logging
+import os
+import shlex
+import socket
+import threading
+
+import paramiko
+from paramiko.sftp import SFTP_OK
+
+# Clients trennen die Verbindung ohne Abmeldung; paramiko meldet das serverseitig als Fehler
+LOG_CHANNEL = "sftp_fixture"
+logging.getLogger(LOG_CHANNEL).addHandler(logging.NullHandler())
+logging.getLogger(LOG_CHANNEL).propagate = False
+
+_HOST_KEY = None
+_HOST_KEY_LOCK = threading.Lock()
+
+
+def _host_key():
+    # RSA-Schlüsselerzeugung kostet spürbar Zeit: einmal pro Prozess reicht
+    global _HOST_KEY
+    with _HOST_KEY_LOCK:
+        if _HOST_KEY is None:
+            _HOST_KEY = paramiko.RSAKey.generate(2048)
+        return _HOST_KEY
+
+
+def _local_path(root, path):
+    path = os.path.normpath("/" + path.replace("\\", "/")).replace("//", "/")
+    return os.path.join(root, path.lstrip("/"))
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, username, password, root=None, allow_exec=False):
+        self.username = username
+        self.password = password
+        self.root = root
+        self.allow_exec = allow_exec
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        try:
+            argv = shlex.split(command.decode("utf-8"))
+        except ValueError:
+            return False
+        if not self.allow_exec or len(argv) != 2 or argv[0] != "sha256sum":
+            return False
+        threading.Thread(target=self._sha256sum, args=(channel, argv[1]), daemon=True).start()
+        return True
+
+    def _sha256sum(self, channel, path):
+        try:
+            sha256 = hashlib.sha256()
+            with open(_local_path(self.root, path), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(block)
+            channel.sendall(f"{sha256.hexdigest()}  {path}\n".encode("utf-8"))
+            status = 0
+        except OSError as e:
+            channel.sendall_stderr(f"sha256sum: {path}: {e.strerror}\n".encode("utf-8"))
+            status = 1
+        channel.send_exit_status(status)
+        # Nur EOF senden: ein close() vor der Bestätigung des Exec-Requests ließe ihn beim Client scheitern
+        channel.shutdown_write()
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _SFTPInterface(paramiko.SFTPServerInterface):
+    """Bildet SFTP-Operationen auf ein lokales Wurzelverzeichnis ab."""
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        return _local_path(self.root, path)
+
+    def canonicalize(self, path):
+        return os.path.normpath("/" + path.replace("\\", "/")).replace("//", "/")
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            result = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(local, name)))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        local = self._local(path)
+        try:
+            fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        try:
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            os.close(fd)
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _SFTPHandle(flags)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        return SFTP_OK
+
+
+class LocalSFTPServer:
+    """SFTP-Server auf 127.0.0.1 mit Passwort-Login, der 'root' bereitstellt; als Kontextmanager nutzbar."""
+
+    def __init__(self, root, username="backup", password="backup", host="127.0.0.1", port=0, allow_exec=True):
+        self.root = os.path.abspath(root)
+        self.username = username
+        self.password = password
+        self.allow_exec = allow_exec
+        self.host = host
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self.port = self._socket.getsockname()[1]
+        self._transports = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def host_string(self):
+        """Format von perform_backup/apply_retention_policy: user@host:port."""
+        return f"{self.username}@{self.host}:{self.port}"
+
+    @property
+    def sftp_config(self):
+        """Format von perform_restore."""
+        return {'host': self.host, 'port': self.port, 'username': self.username, 'password': self.password}
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._socket.listen(16)
+        self._socket.settimeout(0.2)
+        self._thread = threading.Thread(target=self._accept_loop, name="sftp-fixture", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            transport = paramiko.Transport(conn)
+            transport.set_log_channel(LOG_CHANNEL)
+            transport.add_server_key(_host_key())
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTPInterface, self.root)
+            transport.start_server(server=_Server(self.username, self.password, self.root, self.allow_exec))
+            self._transports.append(transport)
+
+    def stop(self):
+        self._stop.set()
+        self._socket.close()
+        if self._thread:
+            self._thread.join()
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import stat
+import time
+
+
+# ====================================================================================================
+# SOURCE FINGERPRINTS (NO-OP BACKUPS)
+# ====================================================================================================
+#
+# Am Wochenende ändern sich viele Quellen gar nicht, trotzdem baut, verschlüsselt, hasht und lädt
+# jeder Lauf ein volles Archiv hoch. Vor dem Vorab-Scan wird deshalb ein Fingerabdruck des
+# Quellbaums gebildet und mit dem des letzten erfolgreichen Laufs verglichen:
+#
+# - Fingerabdruck: Merkle-Hash von unten nach oben (os.walk topdown=False). Jedes Verzeichnis hasht
+#   seine sortierten Einträge (Name, Typ, Größe, mtime_ns, ctime_ns, Modus; bei Symlinks das Ziel)
+#   und die Hashes seiner Unterverzeichnisse. Gelesen wird nur mit lstat, nie der Inhalt. ctime
+#   fängt auch Änderungen ab, die mtime zurücksetzen (touch -r, rsync -t). Einstellungen, die das
+#   Archiv verändern (Format, Stufe, Verschlüsselung), gehen mit in den Fingerabdruck ein.
+# - Zustand pro Job (Quellen + Ziele) unter fingerprints/<key>.json im App-Datenordner: Fingerabdruck,
+#   Name und SHA256 des letzten vollen Backups. Er wird nur nach einem vollständig erfolgreichen
+#   Lauf geschrieben; gebildet wird der Fingerabdruck vor dem Archivieren, eine Änderung während
+#   des Laufs führt also beim nächsten Mal zu einem vollen Backup statt zu einem verpassten.
+# - 'skip_unchanged' in config.json:
+#     off        immer volles Backup (Standard)
+#     skip       bei gleichem Fingerabdruck nichts tun; das Ergebnis verweist auf das letzte Backup
+#     reference  statt des Archivs eine kleine Referenz-Datei (backup_<zeit>.<typ>.ref) hochladen,
+#                damit die Retention weiterhin einen Stand pro Tag sieht. Restore und Inhaltsanzeige
+#                folgen der Referenz, die Retention löscht kein Backup, auf das eine behaltene
+#                Referenz zeigt.
+#   Fehlt das letzte Backup auf einem der Ziele, wird immer voll gesichert.
+# - Mit Änderungsjournal (change_journal.py) merkt sich der Zustand zusätzlich die Journal-Stelle
+#   zum Zeitpunkt des Fingerabdrucks. Ist das Journal seitdem leer geblieben (gleiche Sitzung), gilt
+#   der gespeicherte Fingerabdruck ohne erneuten Durchlauf.
+
+FINGERPRINT_DIRNAME = "fingerprints"
+UNCHANGED_OFF = "off"
+UNCHANGED_SKIP = "skip"
+UNCHANGED_REFERENCE = "reference"
+UNCHANGED_MODES = (UNCHANGED_OFF, UNCHANGED_SKIP, UNCHANGED_REFERENCE)
+
+
+def _entry_record(path, name, st):
+    kind = "d" if stat.S_ISDIR(st.st_mode) else "l" if stat.S_ISLNK(st.st_mode) else "f"
+    record = f"{kind}\0{name}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ctime_ns}\0{st.st_mode}"
+    if kind == "l":
+        try:
+            record += "\0" + os.readlink(path)
+        except OSError:
+            pass
+    return record.encode("utf-8", "surrogateescape")
+
+
+def _directory_digest(root, names, child_digests):
+    digest = hashlib.sha256()
+    for name in sorted(names):
+        path = os.path.join(root, name)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue # während des Laufs gelöscht; der nächste Lauf sieht den Unterschied
+        digest.update(_entry_record(path, name, st))
+        digest.update(child_digests.pop(path, b"") if stat.S_ISDIR(st.st_mode) else b"")
+        digest.update(b"\n")
+    return digest.digest()
+
+
+def tree_fingerprint(source_paths):
+    """SHA256-Fingerabdruck (hex) über Pfade, Größen und Zeiten aller Quellen; gibt (fingerabdruck, einträge) zurück."""
+    top = hashlib.sha256()
+    entries = 0
+    for source in source_paths:
+        top.update(os.path.abspath(source).encode("utf-8", "surrogateescape") + b"\0")
+        try:
+            st = os.lstat(source)
+        except OSError:
+            top.update(b"missing\n")
+            continue
+        top.update(_entry_record(source, os.path.basename(source), st))
+        if not stat.S_ISDIR(st.st_mode):
+            entries += 1
+            continue
+        child_digests = {}
+        for root, dirs, files in os.walk(source, topdown=False):
+            child_digests[root] = _directory_digest(root, dirs + files, child_digests)
+            entries += len(dirs) + len(files)
+        top.update(child_digests.get(source, b""))
+        top.update(b"\n")
+    return top.hexdigest(), entries
+
+
+def fingerprint_key(source_paths, destinations):
+    """Dateiname des Zustands für eine Kombination aus Quellen und Zielen."""
+    data = json.dumps([sorted(os.path.abspath(p) for p in source_paths), list(destinations)])
+    return hashlib.sha256(data.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+
+
+class UnchangedDetector:
+    """Vergleicht den Fingerabdruck der Quellen mit dem des letzten erfolgreichen Backups (siehe oben)."""
+
+    def __init__(self, directory, mode=UNCHANGED_SKIP, log=None):
+        self.directory = directory
+        self.mode = mode
+        self.log = log
+        self._settings_hash = None
+        self._journal_position = None
+
+    def _state_path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def fingerprint(self, source_paths, settings, key=None, journal=None):
+        """
+        (fingerabdruck, einträge); settings (dict) sind die Archiv-Einstellungen des Laufs. Mit key und
+        journal (change_journal.JournaledScan) ohne Änderungen seit dem letzten Backup wird dessen
+        Fingerabdruck ohne Durchlauf übernommen (einträge ist dann 0).
+        """
+        extra = json.dumps(settings, sort_keys=True, default=str).encode("utf-8")
+        settings_hash = hashlib.sha256(extra).hexdigest()
+        self._settings_hash = settings_hash
+        self._journal_position = journal.position() if journal is not None else None
+        if key is not None and self._journal_position is not None:
+            state = self._load(key)
+            mark = state.get("journal") if state else None
+            if (mark and state.get("settings") == settings_hash and state.get("fingerprint")
+                    and journal.unchanged_since(mark)):
+                if self.log:
+                    self.log("Sources unchanged according to the change journal; tree walk skipped.", level="INFO")
+                return state["fingerprint"], 0
+        tree, entries = tree_fingerprint(source_paths)
+        return hashlib.sha256(tree.encode("ascii") + b"\0" + extra).hexdigest(), entries
+
+    def _load(self, key):
+        try:
+            with open(self._state_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def previous(self, key, fingerprint):
+        """Zustand des letzten Backups ({'archive', 'sha256', ...}), wenn der Fingerabdruck gleich ist, sonst None."""
+        state = self._load(key)
+        if state is None or state.get("fingerprint") != fingerprint or not state.get("archive"):
+            return None
+        return state
+
+    def record(self, key, fingerprint, archive_name, sha256):
+        """Merkt sich ein vollständig erfolgreiches volles Backup."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._state_path(key)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            # Journal-Stelle und Einstellungen aus dem letzten fingerprint()-Aufruf dieses Laufs
+            json.dump({"fingerprint": fingerprint, "archive": archive_name, "sha256": sha256,
+                       "created": time.time(), "settings": self._settings_hash,
+                       "journal": self._journal_position}, f)
+        os.replace(temp_path, path)
+
+
+def unchanged_detector_from_config(config, app_data_dir, log=None):
+    """UnchangedDetector nach 'skip_unchanged' in config.json oder None, wenn der Modus aus ist."""
+    mode = config.get('skip_unchanged') or UNCHANGED_OFF
+    if mode not in UNCHANGED_MODES:
+        if log:
+            log(f"Unknown skip_unchanged mode '{mode}'; running full backups.", level="WARNING")
+        return None
+    if mode == UNCHANGED_OFF:
+        return None
+    return UnchangedDetector(os.path.join(app_data_dir, FINGERPRINT_DIRNAME), mode, log)
@@ -0,0 +1,190 @@
+import errno
+import os
+import tarfile
+
+
+# ====================================================================================================
+# SPARSE FILES
+# ====================================================================================================
+#
+# VM-Images und Datenbankdateien bestehen oft größtenteils aus Löchern (nicht belegten Blöcken).
+# Über lseek(SEEK_DATA/SEEK_HOLE) werden nur die Datenbereiche gelesen:
+#
+# - tar.gz: Mitglieder im PAX-Sparse-Format 1.0 von GNU tar (Sparse-Map am Anfang der Daten, danach
+#           nur die Datenbereiche). GNU tar, bsdtar und Pythons tarfile stellen die Löcher wieder her.
+# - ZIP:    ZIP kennt keine Löcher. Blöcke, die vollständig in einem Loch liegen, werden nicht gelesen,
+#           sondern durch einen einmal komprimierten Null-Block ersetzt (siehe zip_writer.py); das
+#           Archiv bleibt ein Standard-ZIP, ein Loch kostet ca. 1/1000 seiner Größe.
+#
+# Beim Restore schreibt write_sparse Null-Blöcke nicht, sondern springt über sie hinweg.
+# Ohne SEEK_DATA (Windows, ältere Dateisysteme) wird jede Datei wie bisher vollständig gelesen.
+
+SEEK_DATA = getattr(os, "SEEK_DATA", None)
+SEEK_HOLE = getattr(os, "SEEK_HOLE", None)
+HOLE_BLOCK_SIZE = 64 * 1024 # Granularität, mit der beim Restore Null-Bereiche übersprungen werden
+READ_BLOCK_SIZE = 1024 * 1024
+# Größere Datenmengen bräuchte einen PAX-"size"-Eintrag, der die Sparse-Größe überschreiben würde
+MAX_SPARSE_TAR_DATA = 0o77777777777
+
+
+def allocated_size(st):
+    """Tatsächlich belegte Bytes einer Datei (für Sparse-Dateien kleiner als st_size)."""
+    blocks = getattr(st, "st_blocks", None)
+    if blocks is None:
+        return st.st_size
+    return min(st.st_size, blocks * 512)
+
+
+def data_extents(fd, size):
+    """
+    Liste der Datenbereiche [(offset, länge), ...] einer geöffneten Datei oder None, wenn die Datei
+    keine Löcher hat oder das Dateisystem sie nicht meldet.
+    """
+    if SEEK_DATA is None or size == 0:
+        return None
+    extents = []
+    offset = 0
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO: # ab offset nur noch Loch
+                    break
+                raise
+            if start >= size:
+                break
+            end = min(os.lseek(fd, start, SEEK_HOLE), size)
+            extents.append((start, end - start))
+            offset = end
+    except OSError:
+        return None # z.B. EINVAL: Dateisystem unterstützt SEEK_DATA nicht
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+    if sum(length for _, length in extents) >= size:
+        return None
+    return extents
+
+
+def sparse_extents(f, st=None):
+    """data_extents für ein Dateiobjekt; prüft vorab über st_blocks, ob sich die Suche lohnt."""
+    st = st or os.fstat(f.fileno())
+    if allocated_size(st) >= st.st_size:
+        return None
+    return data_extents(f.fileno(), st.st_size)
+
+
+def is_hole(extents, start, end):
+    """True, wenn [start, end) in keinem Datenbereich liegt."""
+    return all(offset + length <= start or offset >= end for offset, length in extents)
+
+
+# ====================================================================================================
+# TAR (PAX SPARSE 1.0)
+# ====================================================================================================
+
+class _SparseReader:
+    """Liefert die Sparse-Map gefolgt von den Datenbereichen der Datei, wie tarfile.addfile sie liest."""
+
+    def __init__(self, fileobj, extents, header):
+        self._fileobj = fileobj
+        self._header = header
+        self._extents = list(extents)
+        self._remaining = 0
+
+    def read(self, size=-1):
+        # tarfile.copyfileobj verlangt volle Blöcke: über Bereichsgrenzen hinweg auffüllen
+        if size is None or size < 0:
+            size = READ_BLOCK_SIZE
+        parts = []
+        while size:
+            if self._header:
+                data, self._header = self._header[:size], self._header[size:]
+            else:
+                while not self._remaining and self._extents:
+                    offset, self._remaining = self._extents.pop(0)
+                    self._fileobj.seek(offset)
+                if not self._remaining:
+                    break
+                data = self._fileobj.read(min(size, self._remaining))
+                if not data: # Datei ist seit dem Scan geschrumpft
+                    break
+                self._remaining -= len(data)
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+
+def sparse_tarinfo(tarinfo, extents):
+    """
+    Macht aus tarinfo (regulär, Größe = logische Dateigröße) ein PAX-Sparse-Mitglied.
+    Gibt (tarinfo, map_header) zurück; die Daten des Mitglieds sind map_header + alle Datenbereiche.
+    """
+    real_size = tarinfo.size
+    if extents and extents[-1][0] + extents[-1][1] < real_size:
+        extents = extents + [(real_size, 0)] # Loch am Dateiende, wie GNU tar es schreibt
+    numbers = [len(extents)] + [n for extent in extents for n in extent]
+    header = "".join(f"{n}\n" for n in numbers).encode("ascii")
+    header += b"\0" * (-len(header) % tarfile.BLOCKSIZE)
+
+    directory, basename = os.path.split(tarinfo.name)
+    member_name = "/".join(filter(None, [directory, "GNUSparseFile.0", basename]))
+    # "path" steht vor GNU.sparse.name, damit beim Lesen der echte Name gewinnt (Reihenfolge zählt)
+    pax_headers = {"path": member_name}
+    pax_headers.update(tarinfo.pax_headers)
+    pax_headers.update({
+        "GNU.sparse.major": "1",
+        "GNU.sparse.minor": "0",
+        "GNU.sparse.name": tarinfo.name,
+        "GNU.sparse.realsize": str(real_size),
+    })
+    tarinfo.pax_headers = pax_headers
+    tarinfo.name = member_name
+    tarinfo.size = len(header) + sum(length for _, length in extents)
+    return tarinfo, header
+
+
+def add_sparse_to_tar(tar, tarinfo, f, wrap=None):
+    """
+    Schreibt eine geöffnete reguläre Datei als Sparse-Mitglied, falls sie Löcher hat.
+    Gibt False zurück, wenn sie normal archiviert werden soll. wrap(reader) erlaubt Fortschrittszähler.
+    """
+    if tar.format != tarfile.PAX_FORMAT:
+        return False
+    extents = sparse_extents(f)
+    # Obergrenze inkl. Sparse-Map (höchstens zwei 20-stellige Zahlen pro Bereich)
+    if extents is None or sum(length for _, length in extents) + 42 * (len(extents) + 1) > MAX_SPARSE_TAR_DATA:
+        return False
+    tarinfo, header = sparse_tarinfo(tarinfo, extents)
+    reader = _SparseReader(f, extents, header)
+    tar.addfile(tarinfo, wrap(reader) if wrap else reader)
+    return True
+
+
+# ====================================================================================================
+# RESTORE
+# ====================================================================================================
+
+def write_sparse(src, dst_path, size=None, progress=None):
+    """
+    Kopiert src (Dateiobjekt) nach dst_path und lässt Null-Blöcke als Löcher aus.
+    Gibt die Anzahl geschriebener (nicht übersprungener) Bytes zurück.
+    """
+    zero_block = bytes(HOLE_BLOCK_SIZE)
+    written = 0
+    position = 0
+    with open(dst_path, "wb") as dst:
+        for block in iter(lambda: src.read(READ_BLOCK_SIZE), b""):
+            for start in range(0, len(block), HOLE_BLOCK_SIZE):
+                piece = block[start:start + HOLE_BLOCK_SIZE]
+                if piece == zero_block[:len(piece)]:
+                    dst.seek(len(piece), os.SEEK_CUR)
+                else:
+                    dst.write(piece)
+                    written += len(piece)
+            position += len(block)
+            if progress:
+                progress(len(block))
+        # Endet die Datei mit einem Loch, legt truncate die Größe fest, ohne Blöcke zu belegen
+        dst.truncate(position if size is None else size)
+    return written
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import random
+import shlex
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+
+# ====================================================================================================
+# REMOTE VERIFICATION
+# ====================================================================================================
+#
+# Nach dem SFTP-Upload wird die entfernte Kopie gegen den lokalen SHA256 geprüft, ohne sie erneut
+# herunterzuladen:
+#
+# 1. "sha256sum <datei>" über einen SSH-Exec-Kanal derselben Verbindung. Hetzner Storage Boxen
+#    erlauben das; der Server liest die Datei lokal, über die Leitung gehen nur 64 Hex-Zeichen.
+# 2. Lehnt der Server Exec-Kanäle ab: Stichproben. Erster und letzter Block sowie zufällige Bereiche
+#    werden per readv gelesen und mit denselben Bereichen der lokalen Datei verglichen (ein SHA256
+#    über alle Stichproben). Findet zuverlässig abgeschnittene oder falsch zusammengesetzte Dateien,
+#    aber keine einzelnen gekippten Bits außerhalb der Stichproben.
+#
+# Vorher wird immer die Größe verglichen. Das Ergebnis landet pro Datei in den Lauf-Metriken.
+
+METHOD_SIZE = "size"
+METHOD_REMOTE_SHA256 = "sha256sum"
+METHOD_SAMPLED = "sampled"
+
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 64 * 1024
+EXEC_OPEN_TIMEOUT = 10
+EXEC_MIN_TIMEOUT = 60
+EXEC_BYTES_PER_SECOND = 50 * 1024 * 1024 # großzügige Annahme für das Hashen auf dem Server
+
+
+@dataclass
+class VerificationResult:
+    file: str
+    method: str
+    ok: bool
+    detail: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def remote_sha256(transport, remote_path, size=0):
+    """SHA256 der entfernten Datei über 'sha256sum' oder None, wenn der Server das nicht erlaubt."""
+    timeout = max(EXEC_MIN_TIMEOUT, size / EXEC_BYTES_PER_SECOND * 2)
+    try:
+        channel = transport.open_session(timeout=EXEC_OPEN_TIMEOUT)
+    except Exception:
+        return None
+    try:
+        channel.settimeout(timeout)
+        channel.exec_command("sha256sum " + shlex.quote(remote_path))
+        output = channel.makefile("rb").read()
+        status = channel.recv_exit_status()
+    except Exception: # Exec abgelehnt (SSHException) oder Zeitüberschreitung
+        return None
+    finally:
+        channel.close()
+    if status != 0 or not output:
+        return None
+    digest = output.split()[0].decode("ascii", "replace").lower()
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        return None
+    return digest
+
+
+def sample_ranges(size, count=SAMPLE_COUNT, sample_size=SAMPLE_SIZE, seed=None):
+    """Erster und letzter Block plus zufällige, sortierte Bereiche [(offset, länge), ...]."""
+    if size <= count * sample_size:
+        return [(0, size)] if size else []
+    rng = random.Random(seed)
+    offsets = {0, size - sample_size}
+    while len(offsets) < count:
+        offsets.add(rng.randrange(0, size - sample_size))
+    return [(offset, sample_size) for offset in sorted(offsets)]
+
+
+def _sampled_digest_local(local_path, ranges):
+    sha256 = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            sha256.update(f.read(length))
+    return sha256.hexdigest()
+
+
+def _sampled_digest_remote(sftp_client, remote_path, ranges):
+    sha256 = hashlib.sha256()
+    with sftp_client.open(remote_path, "rb") as f:
+        for data in f.readv(ranges): # readv schickt alle Anfragen gebündelt
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def verify_remote_file(sftp_client, transport, remote_path, local_path, expected_sha256):
+    """Prüft die hochgeladene Datei remote_path gegen local_path bzw. expected_sha256."""
+    name = os.path.basename(local_path)
+    local_size = os.path.getsize(local_path)
+    remote_size = sftp_client.stat(remote_path).st_size
+    if remote_size != local_size:
+        return VerificationResult(name, METHOD_SIZE, False, f"remote size {remote_size} != local size {local_size}")
+
+    digest = remote_sha256(transport, remote_path, local_size)
+    if digest is not None:
+        ok = digest == expected_sha256
+        return VerificationResult(name, METHOD_REMOTE_SHA256, ok, None if ok else f"remote sha256 {digest}")
+
+    ranges = sample_ranges(local_size)
+    ok = _sampled_digest_remote(sftp_client, remote_path, ranges) == _sampled_digest_local(local_path, ranges)
+    return VerificationResult(name, METHOD_SAMPLED, ok,
+                              f"{len(ranges)} ranges, {sum(length for _, length in ranges)} bytes")
@@ -0,0 +1,201 @@
+import os
+import random
+import struct
+import zlib
+import zipfile
+from collections import Counter
+from dedup import METADATA_DIR
+
+
+# ====================================================================================================
+# TRAINED DEFLATE DICTIONARIES
+# ====================================================================================================
+#
+# Jedes ZIP-Mitglied ist ein eigener Deflate-Stream. Bei vielen kleinen, ähnlichen Dateien (Configs,
+# JSON) fängt jeder Stream bei null an und findet kaum Wiederholungen. Deflate erlaubt ein
+# vorbelegtes Fenster (zdict, bis 32 KB): was dort steht, kann jede Datei von Beginn an referenzieren.
+#
+# - Training (nach dem Vorbild von zstd --train, Verfahren COVER): eine Stichprobe kleiner Dateien
+#   wird in k-mere zerlegt, gezählt wird, in wie vielen Dateien jedes k-mer vorkommt. Die Stichprobe
+#   wird in Epochen geteilt; aus jeder Epoche kommt das Segment mit der höchsten Summe noch nicht
+#   abgedeckter k-mere ins Wörterbuch. Die besten Segmente stehen am Ende (kürzeste Distanzen).
+# - Das Wörterbuch wird nur benutzt, wenn es auf der zurückgehaltenen Hälfte der Stichprobe
+#   mindestens MIN_GAIN Bytes spart.
+# - Im Archiv liegt es als DICTIONARY_MEMBER. Mitglieder bis DICTIONARY_MAX_MEMBER_SIZE werden damit
+#   komprimiert und tragen die private Methoden-ID ZIP_DEFLATED_DICT; sie bleiben einzeln lesbar
+#   (read_dictionary_member), aber Standard-Werkzeuge wie unzip können nur die übrigen Mitglieder
+#   entpacken. Der Rest des Archivs ist ein normales ZIP.
+
+ZIP_DEFLATED_DICT = 0x4244 # private Methode: Raw-Deflate mit DICTIONARY_MEMBER als zdict
+DICTIONARY_MEMBER = METADATA_DIR + "deflate.dict"
+DICTIONARY_SIZE = 32 * 1024 # Deflate-Fenster; mehr kann zdict nicht nutzen
+DICTIONARY_MAX_MEMBER_SIZE = 128 * 1024
+DEFAULT_SAMPLE_BYTES = 512 * 1024
+DEFAULT_SAMPLE_FILES = 2000
+MAX_SAMPLE_CANDIDATES = 200000
+SAMPLE_PREFIX_BYTES = 8 * 1024 # das Wörterbuch wirkt vor allem am Anfang einer Datei
+KMER_SIZE = 8
+SEGMENT_SIZE = 256
+MIN_GAIN = 0.05 # Anteil der komprimierten Größe ohne Wörterbuch
+
+_LOCAL_HEADER_STRUCT = "<4s2B4HL2L2H"
+_LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+
+def sample_small_files(source_paths, max_bytes=DEFAULT_SAMPLE_BYTES, max_files=DEFAULT_SAMPLE_FILES, rng=None):
+    """Gleichverteilte Stichprobe kleiner Dateien (bis DICTIONARY_MAX_MEMBER_SIZE), je die ersten SAMPLE_PREFIX_BYTES."""
+    rng = rng or random.Random()
+    reservoir = []
+    seen = 0
+    for path in source_paths:
+        walk = [(os.path.dirname(path), [], [os.path.basename(path)])] if os.path.isfile(path) else os.walk(path)
+        for root, _, names in walk:
+            for name in names:
+                full_path = os.path.join(root, name)
+                try:
+                    if os.path.islink(full_path) or not 0 < os.path.getsize(full_path) <= DICTIONARY_MAX_MEMBER_SIZE:
+                        continue
+                except OSError:
+                    continue
+                seen += 1
+                if len(reservoir) < max_files:
+                    reservoir.append(full_path)
+                else:
+                    slot = rng.randrange(seen)
+                    if slot < max_files:
+                        reservoir[slot] = full_path
+                if seen >= MAX_SAMPLE_CANDIDATES:
+                    break
+    samples = []
+    total = 0
+    for path in reservoir:
+        try:
+            with open(path, "rb") as f:
+                data = f.read(min(SAMPLE_PREFIX_BYTES, max_bytes - total))
+        except OSError:
+            continue
+        samples.append(data)
+        total += len(data)
+        if total >= max_bytes:
+            break
+    return samples
+
+
+def _kmers(data, kmer):
+    return [data[i:i + kmer] for i in range(len(data) - kmer + 1)]
+
+
+def train_dictionary(samples, dict_size=DICTIONARY_SIZE, segment=SEGMENT_SIZE, kmer=KMER_SIZE):
+    """Trainiert ein Wörterbuch aus den Stichproben (Bytes); None, wenn sie dafür nicht reichen."""
+    frequency = Counter()
+    for sample in samples:
+        frequency.update(set(_kmers(sample, kmer)))
+    data = b"".join(samples)
+    if len(samples) < 2 or len(data) < segment * 2:
+        return None
+
+    epochs = max(1, min(dict_size // segment, len(data) // segment))
+    epoch_size = len(data) // epochs
+    chosen = [] # (score, segment)
+    window_kmers = segment - kmer + 1
+    for epoch in range(epochs):
+        start = epoch * epoch_size
+        kmers = _kmers(data[start:start + epoch_size], kmer)
+        if len(kmers) < window_kmers:
+            continue
+        # Fenster über die Epoche schieben; Punktzahl = Summe der Häufigkeiten verschiedener k-mere
+        counts = Counter()
+        score = 0
+        best_score, best_start = 0, None
+        for index, key in enumerate(kmers):
+            counts[key] += 1
+            if counts[key] == 1:
+                score += frequency.get(key, 0)
+            if index >= window_kmers:
+                old = kmers[index - window_kmers]
+                counts[old] -= 1
+                if counts[old] == 0:
+                    score -= frequency.get(old, 0)
+            if index >= window_kmers - 1 and score > best_score:
+                best_score, best_start = score, index - window_kmers + 1
+        if best_start is None or best_score <= len(samples) // 10: # nur, was in mehreren Dateien vorkommt
+            continue
+        piece = data[start + best_start:start + best_start + segment]
+        for key in _kmers(piece, kmer): # abgedeckt: spätere Epochen wählen anderes
+            frequency[key] = 0
+        chosen.append((best_score, piece))
+    if not chosen:
+        return None
+    chosen.sort(key=lambda entry: entry[0])
+    return b"".join(piece for _, piece in chosen)[-dict_size:]
+
+
+def _deflate_size(data, level, zdict=None):
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return len(compressor.compress(data)) + len(compressor.flush())
+
+
+def build_dictionary(source_paths, compresslevel=-1, sample_bytes=DEFAULT_SAMPLE_BYTES):
+    """
+    Stichprobe, Training und Gegenprobe. Gibt (zdict oder None, Stichproben-Bytes, Ersparnis-Anteil) zurück;
+    trainiert wird auf jeder zweiten Datei der Stichprobe, gemessen auf den übrigen.
+    """
+    samples = sample_small_files(source_paths, sample_bytes)
+    sampled = sum(len(sample) for sample in samples)
+    zdict = train_dictionary(samples[::2])
+    if zdict is None or len(samples) < 4:
+        return None, sampled, 0.0
+    held_out = samples[1::2]
+    plain = sum(_deflate_size(sample, compresslevel) for sample in held_out)
+    trained = sum(_deflate_size(sample, compresslevel, zdict) for sample in held_out)
+    gain = 1 - trained / max(1, plain)
+    return (zdict if gain >= MIN_GAIN else None), sampled, gain
+
+
+def uses_dictionary(info):
+    return info.compress_type == ZIP_DEFLATED_DICT
+
+
+def load_dictionary(zip_ref):
+    """Wörterbuch eines geöffneten zipfile.ZipFile oder None."""
+    if DICTIONARY_MEMBER not in zip_ref.namelist():
+        return None
+    return zip_ref.read(DICTIONARY_MEMBER)
+
+
+def read_dictionary_member(fp, info, zdict):
+    """Liest ein ZIP_DEFLATED_DICT-Mitglied aus der Archivdatei fp (binär geöffnet) und prüft den CRC."""
+    if zdict is None:
+        raise zipfile.BadZipFile(f"{info.filename} needs {DICTIONARY_MEMBER}, which is missing.")
+    fp.seek(info.header_offset)
+    header = fp.read(struct.calcsize(_LOCAL_HEADER_STRUCT))
+    fields = struct.unpack(_LOCAL_HEADER_STRUCT, header)
+    if fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}.")
+    fp.seek(fields[10] + fields[11], os.SEEK_CUR) # Dateiname und Extra-Feld
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=zdict)
+    data = decompressor.decompress(fp.read(info.compress_size)) + decompressor.flush()
+    if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename}.")
+    return data
+
+
+def testzip(archive_path):
+    """Wie zipfile.ZipFile.testzip, versteht aber Wörterbuch-Mitglieder. Gibt das erste defekte Mitglied oder None zurück."""
+    with zipfile.ZipFile(archive_path) as zip_ref, open(archive_path, "rb") as fp:
+        zdict = load_dictionary(zip_ref)
+        for info in zip_ref.infolist():
+            try:
+                if uses_dictionary(info):
+                    read_dictionary_member(fp, info, zdict)
+                else:
+                    with zip_ref.open(info) as member:
+                        while member.read(1024 * 1024):
+                            pass
+            except (zipfile.BadZipFile, zlib.error):
+                return info.filename
+    return None
@@ -0,0 +1,384 @@
+import os
+import struct
+import time
+import zlib
+import zipfile
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sparse import sparse_extents, is_hole
+from zip_dictionary import ZIP_DEFLATED_DICT, DICTIONARY_MAX_MEMBER_SIZE
+from low_impact import advise_noreuse, release_cache
+
+
+# ====================================================================================================
+# PARALLEL ZIP WRITER
+# ====================================================================================================
+#
+# zipfile.ZipFile komprimiert jedes Mitglied nacheinander auf einem einzigen Kern. Da ZIP-Mitglieder
+# unabhängig voneinander komprimiert werden, lässt sich das Deflate auf einen Thread-Pool verteilen
+# (zlib gibt während der Kompression den GIL frei). Große Dateien werden wie bei pigz in Blöcke
+# zerlegt: jeder Block wird mit Z_SYNC_FLUSH abgeschlossen und mit den letzten 32 KB des
+# Vorgängerblocks als Wörterbuch vorbelegt, der letzte Block mit Z_FINISH. Die Blöcke ergeben
+# aneinandergehängt einen gültigen Deflate-Stream.
+#
+# Bei Sparse-Dateien werden Blöcke, die samt Wörterbuch-Fenster in einem Loch liegen, nicht gelesen:
+# ihr komprimiertes Ergebnis ist immer gleich und wird nur einmal berechnet (_compress_zero_chunk).
+#
+# Die Ergebnisse werden strikt in Einreichungsreihenfolge geschrieben; eine begrenzte Warteschlange
+# deckelt den Speicherverbrauch auf ungefähr max_pending * chunk_size * 2 Bytes.
+#
+# Mit zdict (trainiertes Wörterbuch, siehe zip_dictionary.py) werden kleine Mitglieder mit diesem
+# Wörterbuch komprimiert und als ZIP_DEFLATED_DICT geschrieben.
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024 # 4 MB pro Kompressionsblock
+DEFLATE_WINDOW = 32768 # Maximale Rückwärtsdistanz von Deflate
+
+_LOCAL_DATA_DESCRIPTOR = 0x08
+_UTF8_FILENAME = 0x800
+
+_CENTRAL_DIR_STRUCT = "<4s4B4HL2L5H2L"
+_CENTRAL_DIR_SIGNATURE = b"PK\001\002"
+_END_ARCHIVE_STRUCT = "<4s4H2LH"
+_END_ARCHIVE_SIGNATURE = b"PK\005\006"
+_END_ARCHIVE64_STRUCT = "<4sQ2H2L4Q"
+_END_ARCHIVE64_SIGNATURE = b"PK\x06\x06"
+_END_ARCHIVE64_LOCATOR_STRUCT = "<4sLQL"
+_END_ARCHIVE64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+_DEFAULT_VERSION = 20
+_ZIP64_VERSION = 45
+
+
+def _gf2_matrix_times(matrix, vector):
+    result = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return result
+
+
+def _gf2_matrix_compose(outer, inner):
+    return [_gf2_matrix_times(outer, column) for column in inner]
+
+
+@functools.lru_cache(maxsize=32)
+def _crc32_shift_operator(length):
+    """
+    Liefert den GF(2)-Operator, der einen CRC32 um 'length' Null-Bytes weiterschiebt.
+    Gecacht, da fast alle Blöcke dieselbe Länge (chunk_size) haben.
+    """
+    # Operator für ein einzelnes Null-Bit (reflektiertes CRC32-Polynom)
+    operator = [0xEDB88320] + [1 << n for n in range(31)]
+    for _ in range(3): # 1 Bit -> 8 Bit = 1 Byte
+        operator = _gf2_matrix_compose(operator, operator)
+
+    result = [1 << n for n in range(32)] # Identität
+    while length:
+        if length & 1:
+            result = _gf2_matrix_compose(operator, result)
+        length >>= 1
+        if length:
+            operator = _gf2_matrix_compose(operator, operator)
+    return tuple(result)
+
+
+def crc32_combine(crc1, crc2, length2):
+    """Kombiniert CRC32(A) und CRC32(B) zu CRC32(A + B), wobei length2 = len(B)."""
+    if length2 <= 0:
+        return crc1
+    return _gf2_matrix_times(_crc32_shift_operator(length2), crc1) ^ crc2
+
+
+def _compress_chunk(file_path, offset, length, compresslevel, final, zdict=None, drop_cache=False):
+    """
+    Liest und komprimiert einen Block einer Datei (läuft im Thread-Pool).
+    Gibt (komprimierte Daten, CRC32 der Rohdaten, Anzahl Rohbytes) zurück.
+    zdict gilt nur für den ersten Block; Folgeblöcke nutzen das Fenster ihres Vorgängers.
+    drop_cache gibt die gelesenen Seiten danach im Page-Cache frei (siehe low_impact.py).
+    """
+    with open(file_path, "rb") as f:
+        if drop_cache:
+            advise_noreuse(f)
+        window_start = offset
+        if offset:
+            # Fenster des Vorgängerblocks als Wörterbuch, damit die Kompressionsrate erhalten bleibt
+            window_start = max(0, offset - DEFLATE_WINDOW)
+            f.seek(window_start)
+            zdict = f.read(offset - window_start)
+        raw = f.read(length)
+        if drop_cache:
+            release_cache(f, window_start, offset - window_start + len(raw))
+
+    if zdict:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return data, zlib.crc32(raw), len(raw)
+
+
+def _compress_data(raw, compresslevel, zdict=None):
+    """Komprimiert bereits gelesene Daten als vollständigen Deflate-Stream (ein Block)."""
+    if zdict:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(raw) + compressor.flush(), zlib.crc32(raw), len(raw)
+
+
+@functools.lru_cache(maxsize=8)
+def _compress_zero_chunk(length, with_window, compresslevel):
+    """Wie _compress_chunk für einen nicht-finalen Block aus Null-Bytes mit Null-Fenster als Wörterbuch."""
+    raw = bytes(length)
+    if with_window:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, bytes(DEFLATE_WINDOW))
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data, zlib.crc32(raw), length
+
+
+class _PendingMember:
+    """Schreibzustand eines ZIP-Mitglieds, dessen Blöcke noch komprimiert werden."""
+
+    def __init__(self, zinfo, chunk_count):
+        self.zinfo = zinfo
+        self.chunk_count = chunk_count
+        self.zip64 = False
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+
+class ParallelZipWriter:
+    """
+    Schreibt ein Standard-ZIP-Archiv (ZIP_DEFLATED), dessen Mitglieder parallel komprimiert werden.
+    Die Schnittstelle entspricht dem in perform_backup genutzten Teil von zipfile.ZipFile
+    (write(filename, arcname) und Context-Manager). Mit zdict werden Mitglieder bis
+    DICTIONARY_MAX_MEMBER_SIZE als ZIP_DEFLATED_DICT geschrieben; das Wörterbuch selbst legt der
+    Aufrufer per writestr(DICTIONARY_MEMBER, zdict) ins Archiv. drop_cache gibt gelesene Dateien
+    im Page-Cache frei.
+    """
+
+    def __init__(self, file_path, compresslevel=-1, max_workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_pending=None, zdict=None, drop_cache=False):
+        self.file_path = file_path
+        self.compresslevel = compresslevel
+        self.zdict = zdict
+        self.drop_cache = drop_cache
+        self.chunk_size = max(DEFLATE_WINDOW, int(chunk_size))
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        self._fp = open(file_path, "wb")
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._pending = deque() # (member, future, chunk_index) in Schreibreihenfolge
+        self._members = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, filename, arcname=None, data=None):
+        """
+        Reiht eine Datei (oder ein Verzeichnis) zur Kompression ein.
+        Gibt die ZipInfo zurück; CRC und komprimierte Größe stehen erst nach close() fest.
+        data (bereits gelesener Inhalt, siehe prefetch.py) wird statt der Datei komprimiert,
+        wenn die Größe noch stimmt und das Mitglied aus einem Block besteht.
+        """
+        if self._closed:
+            raise ValueError("Attempt to write to a closed ParallelZipWriter.")
+
+        zinfo = zipfile.ZipInfo.from_file(filename, arcname, strict_timestamps=False)
+        if zinfo.is_dir():
+            # Verzeichnisse haben keine Daten und werden direkt in Reihenfolge geschrieben
+            self._drain(0)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo.CRC = 0
+            zinfo.compress_size = 0
+            zinfo.file_size = 0
+            zinfo.header_offset = self._fp.tell()
+            self._fp.write(zinfo.FileHeader(False))
+            self._members.append(zinfo)
+            return zinfo
+
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        chunk_count = max(1, -(-zinfo.file_size // self.chunk_size))
+        member = _PendingMember(zinfo, chunk_count)
+        zdict = None
+        if self.zdict and zinfo.file_size <= DICTIONARY_MAX_MEMBER_SIZE:
+            zinfo.compress_type = ZIP_DEFLATED_DICT
+            zdict = self.zdict
+        if data is not None and chunk_count == 1 and len(data) == zinfo.file_size:
+            self._pending.append((member, self._executor.submit(_compress_data, data, self.compresslevel, zdict), 0))
+            self._drain(self.max_pending)
+            return zinfo
+        extents = None
+        if chunk_count > 1:
+            with open(filename, "rb") as f:
+                extents = sparse_extents(f)
+        for index in range(chunk_count):
+            final = index == chunk_count - 1
+            offset = index * self.chunk_size
+            # Der letzte Block liest bis zum Dateiende, falls die Datei seit stat() gewachsen ist
+            length = -1 if final else self.chunk_size
+            if extents is not None and not final and is_hole(extents, max(0, offset - DEFLATE_WINDOW), offset + length):
+                future = self._executor.submit(_compress_zero_chunk, length, offset > 0, self.compresslevel)
+            else:
+                future = self._executor.submit(_compress_chunk, filename, offset, length,
+                                               self.compresslevel, final, zdict, self.drop_cache)
+            self._pending.append((member, future, index))
+            self._drain(self.max_pending)
+        return zinfo
+
+    def writestr(self, arcname, data):
+        """Schreibt kleine Daten (z.B. Metadaten) als Mitglied, nach allen bisher eingereihten Dateien."""
+        if self._closed:
+            raise ValueError("Attempt to write to a closed ParallelZipWriter.")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._drain(0)
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o644 << 16
+        self._write_chunk(_PendingMember(zinfo, 1), 0, *_compress_data(data, self.compresslevel))
+        return zinfo
+
+    def _drain(self, limit):
+        """Schreibt fertige Blöcke in Reihenfolge, bis höchstens 'limit' Blöcke ausstehen."""
+        while len(self._pending) > limit:
+            member, future, index = self._pending.popleft()
+            data, crc, raw_length = future.result()
+            self._write_chunk(member, index, data, crc, raw_length)
+
+    def _write_chunk(self, member, index, data, crc, raw_length):
+        zinfo = member.zinfo
+        if member.chunk_count == 1:
+            # Häufigster Fall: alle Werte sind bekannt, der lokale Header kann sie direkt enthalten
+            zinfo.CRC = crc
+            zinfo.compress_size = len(data)
+            zinfo.file_size = raw_length
+            zinfo.header_offset = self._fp.tell()
+            self._fp.write(zinfo.FileHeader(False))
+            self._fp.write(data)
+            self._members.append(zinfo)
+            return
+
+        if index == 0:
+            # Mehrblöckige Mitglieder: CRC und Größen folgen in einem Data Descriptor
+            zinfo.flag_bits |= _LOCAL_DATA_DESCRIPTOR
+            member.zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+            zinfo.header_offset = self._fp.tell()
+            self._fp.write(zinfo.FileHeader(member.zip64))
+
+        self._fp.write(data)
+        member.crc = crc32_combine(member.crc, crc, raw_length)
+        member.compress_size += len(data)
+        member.file_size += raw_length
+
+        if index == member.chunk_count - 1:
+            if not member.zip64 and (member.compress_size > zipfile.ZIP64_LIMIT
+                                     or member.file_size > zipfile.ZIP64_LIMIT):
+                raise zipfile.LargeZipFile(f"File {zinfo.filename} grew beyond the ZIP64 limit while archiving.")
+            zinfo.CRC = member.crc
+            zinfo.compress_size = member.compress_size
+            zinfo.file_size = member.file_size
+            descriptor_format = "<4sLQQ" if member.zip64 else "<4sLLL"
+            self._fp.write(struct.pack(descriptor_format, _DATA_DESCRIPTOR_SIGNATURE,
+                                       zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+            self._members.append(zinfo)
+
+    def _write_central_directory(self):
+        start_dir = self._fp.tell()
+        for zinfo in self._members:
+            dt = zinfo.date_time
+            dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+            dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+
+            extra = []
+            file_size = zinfo.file_size
+            compress_size = zinfo.compress_size
+            header_offset = zinfo.header_offset
+            if file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT:
+                extra.extend((file_size, compress_size))
+                file_size = compress_size = 0xFFFFFFFF
+            if header_offset > zipfile.ZIP64_LIMIT:
+                extra.append(header_offset)
+                header_offset = 0xFFFFFFFF
+
+            extra_data = b""
+            version = _DEFAULT_VERSION
+            if extra:
+                extra_data = struct.pack("<HH" + "Q" * len(extra), 1, 8 * len(extra), *extra)
+                version = _ZIP64_VERSION
+
+            try:
+                filename = zinfo.filename.encode("ascii")
+                flag_bits = zinfo.flag_bits
+            except UnicodeEncodeError:
+                filename = zinfo.filename.encode("utf-8")
+                flag_bits = zinfo.flag_bits | _UTF8_FILENAME
+
+            self._fp.write(struct.pack(_CENTRAL_DIR_STRUCT, _CENTRAL_DIR_SIGNATURE,
+                                       max(version, zinfo.create_version), zinfo.create_system,
+                                       max(version, zinfo.extract_version), zinfo.reserved,
+                                       flag_bits, zinfo.compress_type, dostime, dosdate,
+                                       zinfo.CRC, compress_size, file_size,
+                                       len(filename), len(extra_data), 0,
+                                       0, zinfo.internal_attr, zinfo.external_attr,
+                                       header_offset))
+            self._fp.write(filename)
+            self._fp.write(extra_data)
+
+        end_dir = self._fp.tell()
+        count = len(self._members)
+        size = end_dir - start_dir
+        if count > zipfile.ZIP_FILECOUNT_LIMIT or start_dir > zipfile.ZIP64_LIMIT or size > zipfile.ZIP64_LIMIT:
+            self._fp.write(struct.pack(_END_ARCHIVE64_STRUCT, _END_ARCHIVE64_SIGNATURE,
+                                       44, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                                       count, count, size, start_dir))
+            self._fp.write(struct.pack(_END_ARCHIVE64_LOCATOR_STRUCT, _END_ARCHIVE64_LOCATOR_SIGNATURE,
+                                       0, end_dir, 1))
+            count = min(count, 0xFFFF)
+            size = min(size, 0xFFFFFFFF)
+            start_dir = min(start_dir, 0xFFFFFFFF)
+        self._fp.write(struct.pack(_END_ARCHIVE_STRUCT, _END_ARCHIVE_SIGNATURE,
+                                   0, 0, count, count, size, start_dir, 0))
+
+    def close(self):
+        """Wartet auf alle ausstehenden Blöcke und schreibt das zentrale Verzeichnis."""
+        if self._closed:
+            return
+        try:
+            self._drain(0)
+            self._write_central_directory()
+        except BaseException:
+            self.abort()
+            raise
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        self._fp.close()
+
+    def abort(self):
+        """Bricht das Schreiben ab; die (unvollständige) Ausgabedatei bleibt dem Aufrufer überlassen."""
+        if self._closed:
+            return
+        self._closed = True
+        for _, future, _ in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        self._fp.close()